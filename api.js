@@ -3,7 +3,17 @@
 
 const API_URL = '/api';
 
+// Responses loaded ahead of time by prefetch(), keyed by action and payload
+const PREFETCH_MAX_AGE_MS = 60000;
+const prefetchedResponses = new Map();
+
 export async function sendRequest(action, payload = {}) {
+    // Any other request may change what a prefetched response showed, so drop them all
+    prefetchedResponses.clear();
+    return postAction(action, payload);
+}
+
+async function postAction(action, payload) {
     // No need to check for sessionToken here, the HttpOnly cookie is sent automatically by the browser.
     
     try {
@@ -17,22 +27,94 @@ export async function sendRequest(action, payload = {}) {
             body: JSON.stringify({ action, payload })
         });
 
-        if (response.status === 401) {
-            // Unauthorized, clear local data and redirect to login page.
-            localStorage.removeItem('currentUser');
-            window.location.href = '/login.html';
-            throw new Error('Unauthorized');
-        }
-
-        if (!response.ok) {
-             // Try to parse the error message from the server's JSON response
-             const errorResult = await response.json();
-             throw new Error(errorResult.message || `Network response was not ok. Status: ${response.status}`);
-        }
-        return await response.json();
+        return await parseResponse(response);
     } catch (error) {
         console.error("API request failed:", error);
         // Throw the specific error message from the server if available, otherwise a generic one.
         throw new Error(error.message || 'การเชื่อมต่อกับเซิร์ฟเวอร์ล้มเหลว');
     }
 }
+
+// Runs several actions in one round-trip. `requests` is an array of { action, payload };
+// the resolved array holds each action's own response, in the same order.
+export async function sendBatch(requests, { readTransaction = false } = {}) {
+    const res = await sendRequest('batch', { actions: requests, read_transaction: readTransaction });
+    if (res.results.some(result => result.status_code === 401)) {
+        localStorage.removeItem('currentUser');
+        window.location.href = '/login.html';
+        throw new Error('Unauthorized');
+    }
+    return res.results.map(result => result.response);
+}
+
+function prefetchKey(action, payload) {
+    return JSON.stringify([action, payload]);
+}
+
+// Sends several read requests as one batch when a page starts. Afterwards
+// sendPrefetchable() answers each matching request once from the batch, while it is fresh.
+export async function prefetch(requests) {
+    if (requests.length === 0) return;
+    try {
+        const responses = await sendBatch(requests, { readTransaction: true });
+        const fetchedAt = Date.now();
+        requests.forEach(({ action, payload }, i) => {
+            prefetchedResponses.set(prefetchKey(action, payload), { response: responses[i], fetchedAt });
+        });
+    } catch (error) {
+        console.error("Prefetch failed:", error); // Each request is sent on its own instead
+    }
+}
+
+export async function sendPrefetchable(action, payload = {}) {
+    const key = prefetchKey(action, payload);
+    const entry = prefetchedResponses.get(key);
+    prefetchedResponses.delete(key);
+    if (entry && Date.now() - entry.fetchedAt < PREFETCH_MAX_AGE_MS) return entry.response;
+    return postAction(action, payload);
+}
+
+// Sends a list of records as newline-delimited JSON, so the server can import
+// them row by row instead of parsing one giant payload.
+export async function uploadRows(url, rows) {
+    prefetchedResponses.clear();
+    try {
+        const response = await fetch(url, {
+            method: 'POST',
+            cache: 'no-cache',
+            headers: { 'Content-Type': 'application/x-ndjson' },
+            body: rows.map(row => JSON.stringify(row)).join('\n')
+        });
+        return await parseResponse(response);
+    } catch (error) {
+        console.error("Upload failed:", error);
+        throw new Error(error.message || 'การเชื่อมต่อกับเซิร์ฟเวอร์ล้มเหลว');
+    }
+}
+
+// Opens the admin event stream. `listeners` maps event names to callbacks that get
+// the parsed event data; the browser reconnects on its own if the stream drops.
+export function subscribeEvents(listeners) {
+    if (!window.EventSource) return null;
+    const source = new EventSource('/events');
+    for (const [eventName, callback] of Object.entries(listeners)) {
+        source.addEventListener(eventName, event => callback(JSON.parse(event.data)));
+    }
+    return source;
+}
+
+async function parseResponse(response) {
+    if (response.status === 401) {
+        // Unauthorized, clear local data and redirect to login page.
+        localStorage.removeItem('currentUser');
+        window.location.href = '/login.html';
+        throw new Error('Unauthorized');
+    }
+
+    if (!response.ok) {
+         // Try to parse the error message from the server's JSON response
+         const errorResult = await response.json();
+         throw new Error(errorResult.message || `Network response was not ok. Status: ${response.status}`);
+    }
+    return await response.json();
+}
@@ -1,7 +1,7 @@
 // app.js
 // Main application file for initialization and state management.
 
-import { sendRequest } from './api.js';
+import { sendRequest, prefetch, sendPrefetchable, subscribeEvents } from './api.js';
 import * as ui from './ui.js';
 import * as handlers from './handlers.js';
 import { escapeHTML } from './utils.js';
@@ -14,6 +14,7 @@ window.allHistoryData = {};
 window.personnelCurrentPage = 1;
 window.userCurrentPage = 1;
 window.holidayDatepicker = null; // To store the holiday datepicker instance
+window.dashboardSummary = null; // Last dashboard summary, kept current by server events
 
 // --- Auto Logout Feature ---
 let inactivityTimer;
@@ -68,6 +69,7 @@ window.personnelForm = null;
 window.cancelPersonnelBtn = null;
 window.importExcelBtn = null;
 window.excelImportInput = null;
+window.importSyncCheckbox = null;
 window.userListArea = null;
 window.addUserBtn = null;
 window.userModal = null;
@@ -139,6 +141,7 @@ function assignDomElements() {
     window.cancelPersonnelBtn = document.getElementById('cancel-personnel-btn');
     window.importExcelBtn = document.getElementById('import-excel-btn');
     window.excelImportInput = document.getElementById('excel-import-input');
+    window.importSyncCheckbox = document.getElementById('import-sync-checkbox');
     window.userListArea = document.getElementById('user-list-area');
     window.addUserBtn = document.getElementById('add-user-btn');
     window.userModal = document.getElementById('user-modal');
@@ -213,9 +216,10 @@ function initializePage() {
         document.getElementById('tab-archive').classList.toggle('hidden', !is_admin);
         
         if (is_admin) {
-            switchTab('tab-dashboard');
+            prefetchPanes(['pane-dashboard', 'pane-active-statuses', 'pane-report']).then(() => switchTab('tab-dashboard'));
+            subscribeDashboardEvents();
         } else {
-            switchTab('tab-active-statuses');
+            prefetchPanes(['pane-active-statuses', 'pane-submit-status', 'pane-history']).then(() => switchTab('tab-active-statuses'));
         }
     }
 
@@ -339,11 +343,43 @@ function initializePage() {
     }
 }
 
+// --- Live Dashboard Updates ---
+// Applies submission events pushed by the server to the loaded summary instead of re-querying it.
+function subscribeDashboardEvents() {
+    const isDashboardVisible = () => !document.getElementById('pane-dashboard').classList.contains('hidden');
+    subscribeEvents({
+        report_submitted: (event) => {
+            const summary = window.dashboardSummary;
+            if (event.kind !== 'weekly' || !summary) return;
+            summary.submitted_info[event.department] = event.submitted_info;
+            summary.status_summary = event.status_summary;
+            summary.total_on_duty = event.total_on_duty;
+            if (isDashboardVisible()) ui.renderDashboard({ summary });
+        },
+        reports_archived: (event) => {
+            if (event.kind !== 'weekly') return;
+            window.dashboardSummary = null;
+            if (isDashboardVisible()) loadDataForPane('pane-dashboard');
+        }
+    });
+}
+
 // --- Data Loading and Tab Switching ---
-window.loadDataForPane = async function(paneId) {
+// Loads the first pane together with the tabs the user is likely to open next in one
+// batch round-trip; each tab then renders its prefetched response on first open.
+async function prefetchPanes(paneIds) {
+    const requests = paneIds.map(paneRequest).filter(Boolean);
+    await prefetch(requests.map(({ paneConfig, payload }) => ({ action: paneConfig.action, payload })));
+}
+
+// Returns the action and payload that load a pane, or null for an unknown pane.
+function paneRequest(paneId) {
     let payload = {};
     const actions = {
-        'pane-dashboard': { action: 'get_dashboard_summary', renderer: ui.renderDashboard },
+        'pane-dashboard': { action: 'get_dashboard_summary', renderer: (res) => {
+            window.dashboardSummary = res.summary;
+            ui.renderDashboard(res);
+        }},
         'pane-active-statuses': { action: 'get_active_statuses', renderer: ui.renderActiveStatuses },
         'pane-personnel': { action: 'list_personnel', renderer: ui.renderPersonnel, searchInput: personnelSearchInput, pageState: 'personnelCurrentPage' },
         'pane-admin': { action: 'list_users', renderer: ui.renderUsers, searchInput: userSearchInput, pageState: 'userCurrentPage' },
@@ -362,7 +398,7 @@ window.loadDataForPane = async function(paneId) {
     const paneConfig = actions[paneId];
     if (!paneConfig) {
         console.error("No config for pane:", paneId);
-        return;
+        return null;
     };
 
     if (paneConfig.searchInput) {
@@ -381,9 +417,16 @@ window.loadDataForPane = async function(paneId) {
             payload.department = deptSelector.value;
         }
     }
+    return { paneConfig, payload };
+}
+
+window.loadDataForPane = async function(paneId) {
+    const request = paneRequest(paneId);
+    if (!request) return;
+    const { paneConfig, payload } = request;
 
     try {
-        const res = await sendRequest(paneConfig.action, payload);
+        const res = await sendPrefetchable(paneConfig.action, payload);
         if (res && res.status === 'success') {
             if (paneConfig.renderer) {
                 paneConfig.renderer(res);
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark harness for the API.
+
+Seeds a synthetic database in a temporary directory, starts the real server from
+web_server.py on a free local port, drives its actions from concurrent clients and
+reports p50/p95/p99 latency and throughput per action. Results are written as JSON
+together with the git commit, so runs can be compared between changes:
+
+    python benchmark.py --departments 20 --personnel 1200 --years 3 --concurrency 16
+    python benchmark.py --compare bench_results/previous.json
+"""
+import argparse
+import gzip
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import web_server
+
+BENCH_PASSWORD = "Bench@2024pw"
+ADMIN_USERNAME = "bench_admin"
+KEEPALIVE_MAX_P50_MS = 10.0 # A kept-alive request slower than this points at a per-request stall, not load
+STATUSES = ['ราชการ', 'ลาพักผ่อน', 'ศึกษา', 'คุมงาน', 'ลากิจ', 'ลาป่วย']
+FIRST_NAMES = ['สมชาย', 'สมศักดิ์', 'วิชัย', 'ประเสริฐ', 'กิตติ', 'อนุชา', 'สุภาพร', 'วรรณา', 'ธนพล', 'ณัฐวุฒิ']
+LAST_NAMES = ['ใจดี', 'ศรีสุข', 'มั่นคง', 'ทองดี', 'บุญมา', 'แก้วมณี', 'สายสุวรรณ', 'พรหมมา']
+
+# Relative weight of each scenario in the request mix; see Client.run_scenario
+DEFAULT_MIX = {
+    "get_dashboard_summary": 10,
+    "get_daily_dashboard_summary": 10,
+    "get_daily_personnel_for_submission": 15,
+    "submit_daily_report": 10,
+    "list_personnel": 10,
+    "list_personnel_fetch_all": 5,
+    "get_active_statuses": 10,
+    "get_archived_reports": 3,
+    "get_archived_daily_reports": 3,
+    "get_archive_page": 10,
+    "get_archive_index": 5,
+    "login": 2,
+}
+
+
+# --- Synthetic Data ---
+def department_names(count):
+    return [f"แผนก{i + 1:02d}.กวก.ชย.ทอ." for i in range(count)]
+
+def working_days(start, end, holidays):
+    day = start
+    while day <= end:
+        if day.weekday() < 5 and day not in holidays:
+            yield day
+        day += timedelta(days=1)
+
+def seed_database(db_file, args, rng):
+    """Fills a fresh database (already created by init_db) and returns the row counts it wrote."""
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    departments = department_names(args.departments)
+    salt, key = web_server.hash_password(BENCH_PASSWORD)
+
+    users = [(ADMIN_USERNAME, salt, key, 'น.อ.', 'ผู้ทดสอบ', 'ระบบ', 'ผู้ดูแลระบบ', 'ส่วนกลาง', 'admin')]
+    users += [(f"bench_user{i + 1:02d}", salt, key, 'น.ต.', 'ผู้ทดสอบ', f"แผนก{i + 1:02d}", 'เจ้าหน้าที่', dept, 'user')
+              for i, dept in enumerate(departments)]
+    cursor.executemany("INSERT OR REPLACE INTO users (username, salt, key, rank, first_name, last_name, position, department, role) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", users)
+
+    personnel_by_dept = {dept: [] for dept in departments}
+    personnel_rows = []
+    for i in range(args.personnel):
+        dept = departments[i % len(departments)]
+        rank = web_server.RANK_ORDER[i % len(web_server.RANK_ORDER)]
+        person = {"id": str(uuid.uuid4()), "rank": rank, "first_name": rng.choice(FIRST_NAMES), "last_name": f"{rng.choice(LAST_NAMES)}{i}"}
+        personnel_by_dept[dept].append(person)
+        personnel_rows.append((person["id"], rank, person["first_name"], person["last_name"], 'เจ้าหน้าที่', '-', dept))
+    cursor.executemany("INSERT INTO personnel (id, rank, first_name, last_name, position, specialty, department) VALUES (?, ?, ?, ?, ?, ?, ?)", personnel_rows)
+
+    today = date.today()
+    first_day = date(today.year - args.years, 1, 1)
+    holidays = set()
+    for year in range(first_day.year, today.year + 2):
+        holidays.update(date(year, rng.randint(1, 12), rng.randint(1, 28)) for _ in range(args.holidays_per_year))
+    cursor.executemany("INSERT OR IGNORE INTO holidays (date, description) VALUES (?, ?)", [(d.isoformat(), 'วันหยุดทดสอบ') for d in sorted(holidays)])
+
+    def status_items(people, day):
+        items = []
+        for person in rng.sample(people, min(len(people), rng.randint(0, 4))):
+            start = day + timedelta(days=rng.randint(0, 3))
+            items.append({"personnel_id": person["id"], "personnel_name": f"{person['rank']} {person['first_name']} {person['last_name']}",
+                          "rank": person["rank"], "first_name": person["first_name"], "last_name": person["last_name"],
+                          "status": rng.choice(STATUSES), "details": "ทดสอบ", "start_date": start.isoformat(),
+                          "end_date": (start + timedelta(days=rng.randint(0, 5))).isoformat()})
+        return items
+
+    counts = {"departments": len(departments), "personnel": len(personnel_rows), "holidays": len(holidays), "archived_reports": 0, "archived_daily_reports": 0}
+    archive_end = today - timedelta(days=today.weekday() + 1)
+    week = first_day - timedelta(days=first_day.weekday())
+    while week <= archive_end:
+        for dept in departments:
+            items = status_items(personnel_by_dept[dept], week)
+            report_id = str(uuid.uuid4())
+            cursor.execute("INSERT INTO archived_reports (id, year, month, date, department, submitted_by, report_data, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           (report_id, week.year, week.month, week.isoformat(), dept, 'น.ต. ผู้ทดสอบ', json.dumps(items), f"{week.isoformat()} 09:00:00"))
+            web_server.write_report_items(cursor, 'archived_reports', report_id, dept, week.isoformat(), items)
+            counts["archived_reports"] += 1
+        week += timedelta(days=7)
+
+    for day in working_days(first_day, today - timedelta(days=1), holidays):
+        for dept in departments:
+            by_category = web_server.classify_personnel(personnel_by_dept[dept])
+            report_data = {category: status_items(people, day) if people else [] for category, people in by_category.items()}
+            summary_data = {category: {"total": len(people), "available": len(people) - len(report_data[category]), "mission": len(report_data[category])}
+                            for category, people in by_category.items()}
+            report_id = str(uuid.uuid4())
+            cursor.execute("""INSERT INTO archived_daily_reports (id, year, month, report_date, department, submitted_by, timestamp, summary_data, report_data)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                           (report_id, day.year, day.month, day.isoformat(), dept, 'น.ต. ผู้ทดสอบ', f"{day.isoformat()} 08:00:00",
+                            json.dumps(summary_data), json.dumps(report_data)))
+            web_server.write_report_items(cursor, 'archived_daily_reports', report_id, dept, day.isoformat(), report_data)
+            counts["archived_daily_reports"] += 1
+
+    # About half of the departments have already sent this week's report
+    for i, dept in enumerate(departments[::2]):
+        items = status_items(personnel_by_dept[dept], today)
+        report_id = str(uuid.uuid4())
+        cursor.execute("INSERT INTO status_reports (id, date, submitted_by, department, report_data, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                       (report_id, today.isoformat(), f"bench_user{2 * i + 1:02d}", dept, json.dumps(items), f"{today.isoformat()} 10:00:00"))
+        web_server.write_report_items(cursor, 'status_reports', report_id, dept, today.isoformat(), items)
+        web_server.replace_status_counts(cursor, dept, items)
+
+    conn.commit()
+    conn.close()
+    return counts
+
+
+# --- Load Generation ---
+class QuietAPIHandler(web_server.APIHandler):
+    def log_message(self, format, *args):
+        pass # Keep the access log out of the report
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return None
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+class Client:
+    """One simulated browser: an admin session plus one department user's session."""
+    def __init__(self, port, department_index, rng):
+        self.port = port
+        self.rng = rng
+        self.username = f"bench_user{department_index + 1:02d}"
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        self.admin_cookie = self.login(ADMIN_USERNAME)[1]
+        self.user_cookie = self.login(self.username)[1]
+        self.daily_form = None
+
+    def request(self, action, payload=None, cookie=None):
+        headers = {'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'}
+        if cookie: headers['Cookie'] = cookie
+        body = json.dumps({"action": action, "payload": payload or {}})
+        for attempt in range(2):
+            try:
+                self.connection.request('POST', '/api', body, headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                if response.getheader('Content-Encoding') == 'gzip':
+                    data = gzip.decompress(data)
+                if response.will_close: self.connection.close()
+                return response, data
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed an idle connection between requests; retry once on a new one
+                self.connection.close()
+                if attempt: raise
+
+    def login(self, username):
+        response, data = self.request("login", {"username": username, "password": BENCH_PASSWORD})
+        cookie = response.getheader('Set-Cookie')
+        return response, cookie.split(';')[0] if cookie else None
+
+    def run_scenario(self, name):
+        """Sends one request of scenario `name` and returns its HTTP status."""
+        if name == "login":
+            return self.login(self.username)[0].status
+        if name == "submit_daily_report":
+            if not self.daily_form:
+                self.run_scenario("get_daily_personnel_for_submission")
+            form = self.daily_form
+            report_data = {}
+            for category, people in form["personnel"].items():
+                chosen = self.rng.sample(people, min(len(people), self.rng.randint(0, 2)))
+                report_data[category] = [{"personnel_id": p["id"], "personnel_name": f"{p['rank']} {p['first_name']} {p['last_name']}",
+                                          "status": self.rng.choice(STATUSES), "details": "ทดสอบ",
+                                          "start_date": form["report_date"], "end_date": form["report_date"]} for p in chosen]
+            summary_data = {category: {"total": len(people), "available": len(people) - len(report_data[category]), "mission": len(report_data[category])}
+                            for category, people in form["personnel"].items()}
+            payload = {"data": {"department": form["department"], "report_date": form["report_date"], "summary_data": summary_data, "report_data": report_data}}
+            return self.request("submit_daily_report", payload, self.user_cookie)[0].status
+        if name == "get_daily_personnel_for_submission":
+            response, data = self.request(name, {}, self.user_cookie)
+            if response.status == 200:
+                self.daily_form = json.loads(data)
+            return response.status
+        if name == "list_personnel":
+            return self.request(name, {"page": self.rng.randint(1, 3), "searchTerm": ""}, self.admin_cookie)[0].status
+        if name == "list_personnel_fetch_all":
+            return self.request("list_personnel", {"fetchAll": True}, self.user_cookie)[0].status
+        if name == "get_active_statuses":
+            return self.request(name, {}, self.user_cookie)[0].status
+        if name in ("get_archive_page", "get_archive_index"):
+            return self.request(name, {"kind": self.rng.choice(["weekly", "daily"])}, self.admin_cookie)[0].status
+        return self.request(name, {}, self.admin_cookie)[0].status
+
+def run_load(port, args, departments_count):
+    mix = DEFAULT_MIX if not args.actions else {name: DEFAULT_MIX.get(name, 1) for name in args.actions}
+    names, weights = list(mix), list(mix.values())
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(args.concurrency + 1)
+    timing = {}
+
+    def worker(index):
+        rng = random.Random(args.seed + index)
+        client = Client(port, index % departments_count, rng)
+        start_barrier.wait()
+        warmup_until = timing["start"] + args.warmup
+        while time.perf_counter() < timing["end"]:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = client.run_scenario(name)
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - started
+            if started < warmup_until: continue
+            with lock:
+                latencies[name].append(elapsed)
+                if status != 200: errors[name] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.concurrency)]
+    for thread in threads: thread.start()
+    timing["start"] = time.perf_counter()
+    timing["end"] = timing["start"] + args.warmup + args.duration
+    start_barrier.wait()
+    for thread in threads: thread.join()
+
+    results = {}
+    for name in names:
+        values = sorted(latencies[name])
+        if not values: continue
+        results[name] = {
+            "requests": len(values), "errors": errors[name], "throughput_rps": len(values) / args.duration,
+            "mean_ms": sum(values) / len(values) * 1000, "max_ms": values[-1] * 1000,
+            "p50_ms": percentile(values, 50) * 1000, "p95_ms": percentile(values, 95) * 1000, "p99_ms": percentile(values, 99) * 1000,
+        }
+    everything = sorted(v for values in latencies.values() for v in values)
+    overall = {
+        "requests": len(everything), "errors": sum(errors.values()), "throughput_rps": len(everything) / args.duration,
+        "p50_ms": (percentile(everything, 50) or 0) * 1000, "p95_ms": (percentile(everything, 95) or 0) * 1000, "p99_ms": (percentile(everything, 99) or 0) * 1000,
+    }
+    return results, overall
+
+
+def measure_keepalive(port, samples):
+    """
+    Times sequential requests from one client over a single reused connection, which
+    exposes per-request stalls (such as Nagle's algorithm waiting on delayed ACKs) that
+    the concurrent mix hides behind its throughput.
+    """
+    client = Client(port, 0, random.Random(0))
+    latencies, reconnects = [], 0
+    for _ in range(samples):
+        socket_before = client.connection.sock
+        started = time.perf_counter()
+        client.request("get_active_statuses", {}, client.user_cookie)
+        latencies.append(time.perf_counter() - started)
+        if socket_before is not None and client.connection.sock is not socket_before: reconnects += 1
+    client.connection.close()
+    latencies.sort()
+    return {"requests": samples, "reconnects": reconnects,
+            "p50_ms": percentile(latencies, 50) * 1000, "p95_ms": percentile(latencies, 95) * 1000}
+
+
+# --- Reporting ---
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+def print_results(results, overall, baseline=None):
+    header = f"{'action':<38}{'reqs':>7}{'err':>5}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    print(header + ("   Δp50     Δp95" if baseline else ""))
+    print("-" * (len(header) + (17 if baseline else 0)))
+    rows = sorted(results.items()) + [("ALL", overall)]
+    for name, row in rows:
+        line = f"{name:<38}{row['requests']:>7}{row['errors']:>5}{row['throughput_rps']:>9.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+        previous = (baseline.get("overall") if name == "ALL" else baseline.get("results", {}).get(name)) if baseline else None
+        if previous:
+            line += "".join(f"{(row[key] - previous[key]) / previous[key] * 100 if previous[key] else 0:>+8.1f}%" for key in ("p50_ms", "p95_ms"))
+        print(line)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a synthetic database and load-test the API.")
+    parser.add_argument("--departments", type=int, default=10)
+    parser.add_argument("--personnel", type=int, default=600, help="total personnel, spread over departments and all ranks")
+    parser.add_argument("--years", type=int, default=2, help="years of archived weekly and daily reports")
+    parser.add_argument("--holidays-per-year", type=int, default=15)
+    parser.add_argument("--concurrency", type=int, default=8, help="simultaneous clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of load before measuring starts")
+    parser.add_argument("--actions", nargs="+", choices=sorted(DEFAULT_MIX), help="limit the mix to these scenarios")
+    parser.add_argument("--server-mode", choices=["pooled", "threaded", "single"], default=web_server.SERVER_MODE)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="results file (default: bench_results/<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", help="previous results file to print latency changes against")
+    parser.add_argument("--keepalive-samples", type=int, default=200, help="sequential requests on one kept-alive connection (0 skips the check)")
+    parser.add_argument("--keepalive-max-ms", type=float, default=KEEPALIVE_MAX_P50_MS, help="fail when the kept-alive p50 latency exceeds this")
+    parser.add_argument("--keep-db", action="store_true", help="keep the temporary directory with the seeded database")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="ps-bench-")
+    db_file = os.path.join(workdir, "database.db")
+    web_server.DB_FILE = db_file # The pool and init_db() read the module setting when they connect
+
+    print(f"กำลังสร้างฐานข้อมูลทดสอบใน {workdir} ...")
+    started = time.perf_counter()
+    web_server.init_db()
+    dataset = seed_database(db_file, args, rng)
+    seed_seconds = time.perf_counter() - started
+    print(f"สร้างข้อมูลเสร็จใน {seed_seconds:.1f} วินาที: {dataset}")
+
+    web_server.PASSWORD_HASHER.start()
+    server = web_server.make_server(('127.0.0.1', 0), QuietAPIHandler, args.server_mode)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    port = server.server_address[1]
+    try:
+        print(f"กำลังทดสอบ {args.concurrency} ไคลเอนต์เป็นเวลา {args.duration:g} วินาที (warm-up {args.warmup:g} วินาที) ...")
+        results, overall = run_load(port, args, len(department_names(args.departments)))
+        keepalive = measure_keepalive(port, args.keepalive_samples) if args.keepalive_samples else None
+    finally:
+        server.shutdown()
+        server.server_close()
+        web_server.EVENT_BROADCASTER.close()
+        web_server.PASSWORD_HASHER.shutdown()
+        web_server.DB_POOL.close_all()
+
+    revision = git_revision()
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git": revision,
+        "environment": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "keep_db")},
+        "dataset": dataset,
+        "seed_seconds": seed_seconds,
+        "results": results,
+        "overall": overall,
+        "keepalive": keepalive,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"เทียบกับ {args.compare} (commit {baseline.get('git', {}).get('commit')})")
+    print_results(results, overall, baseline)
+    keepalive_ok = True
+    if keepalive:
+        keepalive_ok = keepalive["p50_ms"] <= args.keepalive_max_ms
+        print(f"keep-alive: {keepalive['requests']} คำขอบนการเชื่อมต่อเดียว p50 {keepalive['p50_ms']:.2f} ms, p95 {keepalive['p95_ms']:.2f} ms, "
+              f"เชื่อมต่อใหม่ {keepalive['reconnects']} ครั้ง" + ("" if keepalive_ok else f"  ช้ากว่าเกณฑ์ {args.keepalive_max_ms:g} ms"))
+
+    output = args.output or os.path.join("bench_results", f"{datetime.now():%Y%m%d-%H%M%S}-{(revision['commit'] or 'nogit')[:8]}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"บันทึกผลไว้ที่ {output}")
+
+    if args.keep_db:
+        print(f"เก็บฐานข้อมูลทดสอบไว้ที่ {db_file}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if overall["errors"] == 0 and keepalive_ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
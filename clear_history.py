@@ -22,9 +22,29 @@ def clear_all_reports():
         
         print("กำลังลบข้อมูลจากตาราง archived_reports...")
         cursor.execute("DELETE FROM archived_reports")
+
+        # Older archives moved by the server into the compressed cold-tier file
+        root, ext = os.path.splitext(DB_FILE)
+        cold_file = f"{root}.cold{ext}"
+        if os.path.exists(cold_file):
+            cursor.execute("ATTACH DATABASE ? AS cold", (cold_file,))
+            cursor.execute("SELECT name FROM cold.sqlite_master WHERE type = 'table' AND name = 'archived_reports'")
+            if cursor.fetchone():
+                print(f"กำลังลบข้อมูลจากตาราง archived_reports ใน {cold_file}...")
+                cursor.execute("DELETE FROM cold.archived_reports")
         
         print("กำลังลบข้อมูลจากตาราง persistent_statuses...")
         cursor.execute("DELETE FROM persistent_statuses")
+
+        # Derived tables created by the server's schema migrations
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('status_report_counts', 'report_items')")
+        derived_tables = {row[0] for row in cursor.fetchall()}
+        if 'status_report_counts' in derived_tables:
+            print("กำลังลบข้อมูลจากตาราง status_report_counts...")
+            cursor.execute("DELETE FROM status_report_counts")
+        if 'report_items' in derived_tables:
+            print("กำลังลบข้อมูลจากตาราง report_items...")
+            cursor.execute("DELETE FROM report_items WHERE report_table IN ('status_reports', 'archived_reports')")
         
         conn.commit()
         print("\nล้างข้อมูลประวัติการส่งยอดทั้งหมดเรียบร้อยแล้ว!")
@@ -1,7 +1,7 @@
 // daily.js - Main script for the daily reporting system
 
 // --- Imports ---
-import { sendRequest } from './api.js';
+import { sendRequest, prefetch, sendPrefetchable, subscribeEvents } from './api.js';
 import * as ui from './ui.js'; 
 import { escapeHTML, formatThaiDateRangeArabic, exportSingleReportToExcel } from './utils.js';
 
@@ -12,6 +12,7 @@ let currentReportDate = ''; // To store the target date for the report
 let allDailyHistoryData = {}; // To cache history data
 let allArchivedDailyData = {}; // To cache archived daily data
 let currentDailyReports = []; // To store reports for archiving
+let currentDailySummary = null; // Last dashboard summary, kept current by server events
 window.editingDailyReportData = null; // To hold data for editing
 
 // --- DOM References ---
@@ -117,9 +118,20 @@ async function initializePage() {
     document.getElementById('tab-daily-report').classList.toggle('hidden', !is_admin);
     document.getElementById('tab-daily-archive').classList.toggle('hidden', !is_admin);
     
+    // One batch round-trip loads the first tab and the ones most often opened next
     if (is_admin) {
+        await prefetch([
+            { action: 'get_daily_dashboard_summary', payload: {} },
+            { action: 'get_daily_final_report', payload: {} },
+            { action: 'get_daily_submission_history', payload: {} },
+        ]);
         await switchTab('tab-daily-dashboard');
+        subscribeDailyDashboardEvents();
     } else {
+        await prefetch([
+            { action: 'get_daily_personnel_for_submission', payload: {} },
+            { action: 'get_daily_submission_history', payload: {} },
+        ]);
         await switchTab('tab-daily-submit');
     }
 }
@@ -142,7 +154,7 @@ async function loadDataForPane(paneId, department = null) {
     
     if (paneId === 'pane-daily-submit') {
         try {
-            const res = await sendRequest('get_daily_personnel_for_submission', payload);
+            const res = await sendPrefetchable('get_daily_personnel_for_submission', payload);
             if (res.status === 'success') {
                 currentDepartment = res.department;
                 currentReportDate = res.report_date;
@@ -156,8 +168,9 @@ async function loadDataForPane(paneId, department = null) {
     }
     if (paneId === 'pane-daily-dashboard') {
         try {
-            const res = await sendRequest('get_daily_dashboard_summary', {});
+            const res = await sendPrefetchable('get_daily_dashboard_summary', {});
             if (res.status === 'success') {
+                currentDailySummary = res.summary;
                 renderDailyDashboard(res.summary);
             } else {
                 ui.showMessage(res.message, false);
@@ -168,7 +181,7 @@ async function loadDataForPane(paneId, department = null) {
     }
     if (paneId === 'pane-daily-history') {
         try {
-            const res = await sendRequest('get_daily_submission_history', {});
+            const res = await sendPrefetchable('get_daily_submission_history', {});
             if (res.status === 'success') {
                 allDailyHistoryData = res.history || {};
                 populateDailyHistoryYears();
@@ -180,7 +193,7 @@ async function loadDataForPane(paneId, department = null) {
     }
     if (paneId === 'pane-daily-report') {
         try {
-            const res = await sendRequest('get_daily_final_report', {});
+            const res = await sendPrefetchable('get_daily_final_report', {});
             if (res.status === 'success') {
                 renderDailyFinalReport(res);
             }
@@ -190,7 +203,7 @@ async function loadDataForPane(paneId, department = null) {
     }
      if (paneId === 'pane-daily-archive') {
         try {
-            const res = await sendRequest('get_archived_daily_reports', {});
+            const res = await sendPrefetchable('get_archived_daily_reports', {});
             if (res.status === 'success') {
                 allArchivedDailyData = res.archives || {};
                 populateDailyArchiveYears();
@@ -202,6 +215,24 @@ async function loadDataForPane(paneId, department = null) {
     }
 }
 
+// --- Live Dashboard Updates ---
+// Applies submission events pushed by the server to the loaded summary instead of re-querying it.
+function subscribeDailyDashboardEvents() {
+    const isDashboardVisible = () => !document.getElementById('pane-daily-dashboard').classList.contains('hidden');
+    subscribeEvents({
+        report_submitted: (event) => {
+            if (event.kind !== 'daily' || !currentDailySummary || event.report_date !== currentDailySummary.report_date) return;
+            currentDailySummary.submitted_info[event.department] = event.submitted_info;
+            if (isDashboardVisible()) renderDailyDashboard(currentDailySummary);
+        },
+        reports_archived: (event) => {
+            if (event.kind !== 'daily') return;
+            currentDailySummary = null;
+            if (isDashboardVisible()) loadDataForPane('pane-daily-dashboard');
+        }
+    });
+}
+
 async function switchTab(tabId) {
     for (const tab of tabs) {
         const paneId = tab.id.replace('tab-', 'pane-');
@@ -1,7 +1,7 @@
 // handlers.js
 // Contains all event handler functions.
 
-import { sendRequest } from './api.js';
+import { sendRequest, uploadRows } from './api.js';
 import { showMessage, openPersonnelModal, openUserModal, showConfirmModal, addStatusRow, renderArchivedReports, renderFilteredHistoryReports } from './ui.js';
 import { exportSingleReportToExcel, formatThaiDateRangeArabic, escapeHTML } from './utils.js';
 
@@ -131,7 +131,19 @@ export function handleExcelImport(event) {
                 rank: row['ยศ-คำนำหน้า'], first_name: row['ชื่อ'], last_name: row['นามสกุล'],
                 position: row['ตำแหน่ง'], specialty: row['เหล่า'], department: row['แผนก']
             }));
-            const response = await sendRequest('import_personnel', { personnel: formattedData });
+            let url = '/api/import_personnel?mode=upsert';
+            if (window.importSyncCheckbox && window.importSyncCheckbox.checked) {
+                // Sync deletes everyone missing from the file, so show who that is before running it
+                const preview = await uploadRows('/api/import_personnel?mode=sync&dry_run=1', formattedData);
+                if (preview.status !== 'success') return showMessage(preview.message, false);
+                const names = preview.deleted_personnel.map(p => `${p.rank || ''} ${p.first_name || ''} ${p.last_name || ''} (${p.department || '-'})`);
+                const shown = names.slice(0, 30).join('\n') + (names.length > 30 ? `\nและอีก ${names.length - 30} รายการ` : '');
+                if (!window.confirm(`${preview.message}\n\nกำลังพลที่จะถูกลบ:\n${shown || '-'}\n\nยืนยันการนำเข้า?`)) {
+                    return showMessage('ยกเลิกการนำเข้าข้อมูล', false);
+                }
+                url = `/api/import_personnel?mode=sync&confirm_deleted=${preview.counts.deleted}`;
+            }
+            const response = await uploadRows(url, formattedData);
             if (response.status === 'success') {
                 window.loadDataForPane('pane-personnel');
             }
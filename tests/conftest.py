@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import http.client
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import web_server
+
+ADMIN_USERNAME = "jeerawut" # Created by init_db
+ADMIN_PASSWORD = "Jee@wut2534"
+
+
+class QuietAPIHandler(web_server.APIHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh database in tmp_path, with the module caches emptied around the test."""
+    web_server.DB_POOL.close_all()
+    monkeypatch.setattr(web_server, "DB_FILE", str(tmp_path / "database.db"))
+    web_server.RESPONSE_CACHE.clear()
+    web_server.LIST_TOTAL_CACHE.clear()
+    web_server.WORKING_DAY_CALENDAR.invalidate()
+    web_server.init_db()
+    with web_server.DB_POOL.connection() as conn:
+        yield conn
+    web_server.DB_POOL.close_all()
+    web_server.RESPONSE_CACHE.clear()
+    web_server.LIST_TOTAL_CACHE.clear()
+    web_server.WORKING_DAY_CALENDAR.invalidate()
+
+
+@pytest.fixture
+def server(db):
+    """Serves the API on a free local port; yields the port."""
+    httpd = web_server.make_server(('127.0.0.1', 0), QuietAPIHandler, "threaded")
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class APIClient:
+    """Sends API actions over one kept-alive connection with the admin's session."""
+    def __init__(self, port):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        self.cookie = None
+
+    def post(self, path, body, content_type='application/json'):
+        headers = {'Content-Type': content_type}
+        if self.cookie: headers['Cookie'] = self.cookie
+        self.connection.request('POST', path, body.encode('utf-8'), headers)
+        response = self.connection.getresponse()
+        return response, response.read()
+
+    def call(self, action, payload=None):
+        response, data = self.post('/api', json.dumps({"action": action, "payload": payload or {}}))
+        return json.loads(data)
+
+    def login(self, username=ADMIN_USERNAME, password=ADMIN_PASSWORD):
+        response, data = self.post('/api', json.dumps({"action": "login", "payload": {"username": username, "password": password}}))
+        self.cookie = response.getheader('Set-Cookie').split(';')[0]
+        return json.loads(data)
+
+
+@pytest.fixture
+def client(server):
+    api = APIClient(server)
+    api.login()
+    yield api
+    api.connection.close()
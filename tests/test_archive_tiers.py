@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+import uuid
+import zlib
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import web_server
+
+DEPARTMENTS = ["แผนก1", "แผนก2", "แผนก3"]
+
+
+@pytest.fixture
+def archives(db):
+    """A weekly and a daily archive per department for 120 days, the older half past the cold cutoff."""
+    cursor = db.cursor()
+    today = date.today()
+    for offset in range(0, 240, 2):
+        day = (today - timedelta(days=offset)).isoformat()
+        for department in DEPARTMENTS:
+            items = [{"personnel_id": f"p{n}", "personnel_name": f"ร.ต. คนที่ {n} " + "ข้อมูล" * 20, "status": "ลาพักผ่อน",
+                      "details": "รายละเอียด" * 10, "start_date": day, "end_date": day} for n in range(8)]
+            weekly_id, daily_id = str(uuid.uuid4()), str(uuid.uuid4())
+            cursor.execute("INSERT INTO archived_reports (id, year, month, date, department, submitted_by, report_data, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           (weekly_id, int(day[:4]), int(day[5:7]), day, department, "user", json.dumps(items), f"{day} 08:00:00"))
+            web_server.write_report_items(cursor, 'archived_reports', weekly_id, department, day, items)
+            report_data = {"officer": items[:4], "nco": items[4:]}
+            cursor.execute("""INSERT INTO archived_daily_reports (id, year, month, report_date, department, submitted_by, timestamp, summary_data, report_data)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                           (daily_id, int(day[:4]), int(day[5:7]), day, department, "user", f"{day} 08:00:00",
+                            json.dumps({"officer": {"total": 10}}), json.dumps(report_data)))
+            web_server.write_report_items(cursor, 'archived_daily_reports', daily_id, department, day, report_data)
+    db.commit()
+    return db
+
+
+def read_everything(db):
+    cursor = db.cursor()
+    def materialize(result):
+        return json.loads(json.dumps(result, default=lambda stream: dict(stream.items) if hasattr(stream, 'items') else list(stream)))
+    snapshot = {}
+    for kind in web_server.ARCHIVE_KINDS:
+        pages, token = [], None
+        while True:
+            page = web_server.handle_get_archive_page({"kind": kind, "limit": 25, "cursor": token}, db, cursor)
+            pages += page["reports"]
+            token = page["next_cursor"]
+            if not token: break
+        snapshot[kind] = pages
+        snapshot[kind + "_index"] = web_server.handle_get_archive_index({"kind": kind}, db, cursor)["index"]
+        snapshot[kind + "_filtered"] = web_server.handle_get_archive_page({"kind": kind, "department": "แผนก2", "date_to": (date.today() - timedelta(days=150)).isoformat()}, db, cursor)["reports"]
+    snapshot["weekly_ids"] = sorted(r["id"] for r in snapshot["weekly"])
+    return snapshot
+
+
+def test_tiering_round_trip_keeps_every_report(archives):
+    before = read_everything(archives)
+    moved = web_server.tier_archives(archives, 119)
+    assert moved == {"weekly": 60 * 3, "daily": 60 * 3}
+    assert archives.execute("SELECT COUNT(*) FROM main.archived_reports").fetchone()[0] == 60 * 3
+    assert read_everything(archives) == before
+
+    report_id = before["weekly"][-1]["id"]
+    edited = web_server.handle_get_report_for_editing({"id": report_id}, archives, archives.cursor())
+    assert edited["report"]["items"] == before["weekly"][-1]["items"]
+
+
+def test_tiering_shrinks_the_main_file(archives):
+    path = web_server.DB_FILE
+    archives.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+    size_before = os.path.getsize(path)
+    moved = web_server.tier_archives(archives, 0)
+    archives.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+    report = web_server.archive_tier_report(archives)
+    assert report["files"]["main"]["free_bytes"] == 0
+    assert os.path.getsize(path) < size_before
+    for kind in web_server.ARCHIVE_KINDS:
+        cold = report["kinds"][kind]["cold"]
+        assert cold["reports"] == moved[kind]
+        assert cold["saved_bytes"] > 0 and cold["stored_bytes"] < cold["raw_bytes"]
+        assert cold["items_in_main"]["rows"] == moved[kind] * 8
+        assert cold["read_latency"]["samples"] > 0
+
+
+def test_report_in_both_tiers_is_read_once(archives):
+    web_server.tier_archives(archives, 0)
+    row = archives.execute("SELECT id, year, month, date, department, submitted_by, report_data, timestamp FROM cold.archived_reports LIMIT 1").fetchone()
+    values = list(row)
+    values[6] = web_server.decode_archive_json(values[6])
+    archives.execute("INSERT INTO main.archived_reports (id, year, month, date, department, submitted_by, report_data, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     values[:6] + [json.dumps(values[6])] + values[7:])
+    archives.commit()
+    assert archives.execute("SELECT COUNT(*) FROM all_archived_reports").fetchone()[0] == 120 * 3
+    ids, payload = [], {"kind": "weekly", "limit": 50}
+    while True:
+        page = web_server.handle_get_archive_page(payload, archives, archives.cursor())
+        ids += [r["id"] for r in page["reports"]]
+        if not page.get("next_cursor"): break
+        payload = dict(payload, cursor=page["next_cursor"])
+    assert len(ids) == len(set(ids)) == 120 * 3
+
+
+def test_tier_actions(client, archives):
+    result = client.call("tier_archives", {"older_than_days": 119})
+    assert result["status"] == "success" and result["moved"] == {"weekly": 180, "daily": 180}
+    assert client.call("tier_archives", {"older_than_days": "soon"})["status"] == "error"
+    tiers = client.call("get_archive_tiers")["tiers"]
+    assert tiers["kinds"]["daily"]["hot"]["reports"] == 180
+
+
+@pytest.mark.parametrize("payload, message", [
+    ({"limit": "abc"}, "จำนวนรายการต่อหน้าไม่ถูกต้อง"),
+    ({"limit": [5]}, "จำนวนรายการต่อหน้าไม่ถูกต้อง"),
+    ({"year": "2567x"}, "ปีไม่ถูกต้อง"),
+    ({"month": "มกราคม"}, "เดือนไม่ถูกต้อง"),
+    ({"month": 13}, "เดือนไม่ถูกต้อง"),
+])
+def test_archive_page_rejects_bad_filters(client, payload, message):
+    assert client.call("get_archive_page", payload) == {"status": "error", "message": message}
+
+
+def test_report_replaced_during_tiering_is_not_duplicated(archives, monkeypatch):
+    day, department = archives.execute("SELECT date, department FROM main.archived_reports ORDER BY date LIMIT 1").fetchone()
+    replacement = {"date": day, "department": department, "rank": "ร.ต.", "first_name": "ใหม่", "last_name": "ล่าสุด",
+                   "items": [{"personnel_id": "p0", "status": "ไปราชการ"}], "timestamp": f"{day} 09:00:00"}
+
+    def archive_again():
+        with web_server.DB_POOL.connection() as conn:
+            web_server.handle_archive_reports({"reports": [replacement]}, conn, conn.cursor())
+
+    real_zlib, writer = zlib, threading.Thread(target=archive_again)
+    def compress(data, level):
+        if not writer.is_alive() and writer.ident is None:
+            writer.start()
+            writer.join(0.5) # Blocked on the tiering write lock, or done if the rows were read unlocked
+        return real_zlib.compress(data, level)
+    monkeypatch.setattr(web_server, "zlib", SimpleNamespace(compress=compress, decompress=real_zlib.decompress))
+    web_server.tier_archives(archives, 119)
+    writer.join()
+
+    rows = archives.execute("SELECT submitted_by, report_data FROM all_archived_reports WHERE date = ? AND department = ?", (day, department)).fetchall()
+    assert [(row[0], web_server.decode_archive_json(row[1])) for row in rows] == [("ร.ต. ใหม่ ล่าสุด", replacement["items"])]
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import http.client
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+import web_server
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ["main.html", "daily.html", "login.html"]
+needs_node = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+
+@pytest.fixture
+def in_repo(monkeypatch):
+    monkeypatch.chdir(REPO)
+    monkeypatch.setattr(web_server, "ASSET_BUNDLER", web_server.AssetBundler())
+
+
+def run_node(tmp_path, name, source):
+    path = tmp_path / name
+    path.write_text(source, encoding="utf-8")
+    result = subprocess.run(["node", str(path)], capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def node_check(tmp_path, name, source):
+    path = tmp_path / name
+    path.write_text(source, encoding="utf-8")
+    result = subprocess.run(["node", "--check", str(path)], capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+
+
+def page_bundles(page_entry):
+    """(url, is_module) for each bundled script tag on a page."""
+    html = page_entry["body"].decode("utf-8")
+    return [(match.group(2), 'type="module"' in match.group(0))
+            for match in re.finditer(r'<script\b[^>]*\bsrc="(' + re.escape(web_server.ASSET_URL_PREFIX) + r')?([^"]+)"[^>]*>', html)
+            if match.group(1)]
+
+
+@needs_node
+@pytest.mark.parametrize("page", PAGES)
+def test_real_entry_points_bundle_to_valid_javascript(in_repo, tmp_path, page):
+    entry = web_server.ASSET_BUNDLER.page(page)
+    assert entry is not None
+    bundles = page_bundles(entry)
+    assert bundles
+    for name, is_module in bundles:
+        body = web_server.ASSET_BUNDLER.asset(web_server.ASSET_URL_PREFIX + name)["body"]
+        node_check(tmp_path, name[:-3] + (".mjs" if is_module else ".js"), body.decode("utf-8"))
+
+
+def test_asset_urls_round_trip_through_the_server(in_repo, server):
+    connection = http.client.HTTPConnection("127.0.0.1", server, timeout=10)
+    connection.request("GET", "/main")
+    response = connection.getresponse()
+    html = response.read().decode("utf-8")
+    assert response.status == 200
+    urls = re.findall(r'src="(' + re.escape(web_server.ASSET_URL_PREFIX) + r'[^"]+)"', html)
+    assert [os.path.basename(url).split(".")[0] for url in urls] == ["app"]
+    for url in urls:
+        connection.request("GET", url)
+        response = connection.getresponse()
+        body = response.read()
+        assert response.status == 200
+        assert response.getheader("Cache-Control") == web_server.ASSET_CACHE_CONTROL
+        assert url.split(".")[-2] == hashlib.sha256(body).hexdigest()[:12]
+        assert b"import " not in body.split(b"\n")[0] and b"__modules" in body
+    connection.request("GET", web_server.ASSET_URL_PREFIX + "app.000000000000.js")
+    response = connection.getresponse()
+    response.read()
+    assert response.status == 404
+    connection.close()
+
+
+TRICKY_SOURCE = r"""
+// A line comment
+const url = "http://example.com/*not a comment*/"; /* block
+comment */ const quote = 'it\'s // still a string';
+const re1 = /[/]\/+(?:a|b)/g, re2 = /\*+/;
+const half = 10 / 2 / 5;
+function pick(x) { return /^a/.test(x) ? x.replace(/a/g, "b") : typeof x / 1; }
+const nested = `outer ${`inner ${half} // not a comment`} ${ {a: 1}.a } /* kept */`;
+const tagged = ((s, ...v) => s.raw.join("|") + v.join(","))`x${1}y${"}"}z`;
+let asi = 1
+let next = asi
+++next
+const arrow = (a) => { return a
+}
+console.log(JSON.stringify([url, quote, re1.source, re1.flags, re2.test("**"), half, pick("abc"), pick(4),
+                            nested, tagged, asi, next, arrow(3), "/* in a string */".length]));
+"""
+
+
+@needs_node
+def test_minified_tricky_source_behaves_the_same(tmp_path):
+    minified = web_server.minify_js(TRICKY_SOURCE)
+    assert "A line comment" not in minified and "block\ncomment" not in minified
+    assert "http://example.com/*not a comment*/" in minified and "// not a comment" in minified
+    assert run_node(tmp_path, "minified.js", minified) == run_node(tmp_path, "source.js", TRICKY_SOURCE)
+
+
+@pytest.mark.parametrize("source", ['const s = "open', "const t = `open", "/* open", "const r = /open\n"])
+def test_minifier_rejects_unterminated_tokens(source):
+    with pytest.raises(ValueError):
+        web_server.minify_js(source)
+
+
+@needs_node
+def test_imports_and_exports_are_rewritten(tmp_path):
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "lib" / "math.js").write_text(
+        "export const base = 40;\nexport function add(a, b) { return a + b; }\nexport async function later() { return 1; }\n"
+        "export class Box { constructor(v) { this.v = v; } }\nconst hidden = 'private';\n", encoding="utf-8")
+    (tmp_path / "lib" / "names.js").write_text("import { base } from './math.js';\nexport const label = `base=${base}`;\n", encoding="utf-8")
+    (tmp_path / "entry.js").write_text(
+        "import { add, base as start, Box } from './lib/math.js';\nimport * as names from './lib/names.js';\nimport './lib/names.js';\n"
+        "console.log(JSON.stringify([add(start, 2), new Box(5).v, names.label, typeof hidden]));\n", encoding="utf-8")
+    source, files = web_server.bundle_es_modules(str(tmp_path / "entry.js"))
+    assert files == [os.path.normpath(str(tmp_path / name)) for name in ("lib/math.js", "lib/names.js", "entry.js")]
+    assert not re.search(r"^\s*(import|export)\b", source, re.M)
+    expected = '[42,5,"base=40","undefined"]\n'
+    assert run_node(tmp_path, "bundle.js", source) == expected
+    assert run_node(tmp_path, "bundle.min.js", web_server.minify_js(source)) == expected
+
+
+@pytest.mark.parametrize("files, message", [
+    ({"entry.js": "export default 1;\n"}, "Unsupported import/export"),
+    ({"entry.js": "import { b } from './b.js';\nexport const a = 1;\n", "b.js": "import { a } from './entry.js';\nexport const b = 2;\n"}, "Circular import"),
+])
+def test_bundler_rejects_unsupported_modules(tmp_path, files, message):
+    for name, text in files.items():
+        (tmp_path / name).write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError, match=message):
+        web_server.bundle_es_modules(str(tmp_path / "entry.js"))
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+# The groups app.js and daily.js prefetch in one batch when an admin opens them
+STARTUP_GROUPS = [
+    ["get_dashboard_summary", "get_active_statuses", "get_status_reports"],
+    ["get_daily_dashboard_summary", "get_daily_final_report", "get_daily_submission_history"],
+]
+
+
+def test_startup_groups_run_in_one_batch(client):
+    for group in STARTUP_GROUPS:
+        result = client.call("batch", {"actions": [{"action": action, "payload": {}} for action in group], "read_transaction": True})
+        assert result["status"] == "success"
+        assert [item["action"] for item in result["results"]] == group
+        for item in result["results"]:
+            assert item["status_code"] == 200
+            assert item["response"]["status"] == "success"
+            assert item["response"] == client.call(item["action"])
+
+
+def test_batch_rejects_login_and_unknown_actions(client):
+    result = client.call("batch", {"actions": [{"action": "login", "payload": {}}, {"action": "no_such_action", "payload": {}}]})
+    assert [item["status_code"] for item in result["results"]] == [400, 404]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import socket
+import threading
+import time
+
+import pytest
+
+import web_server
+
+
+@pytest.fixture
+def broadcaster():
+    events = web_server.EventBroadcaster(heartbeat=60, buffer_limit=16 * 1024)
+    yield events
+    events.close()
+
+
+def subscribed_pair(events):
+    server_side, client_side = socket.socketpair()
+    server_side.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    assert events.subscribe(server_side)
+    return client_side
+
+
+def read_events(sock, count, received):
+    buffer = b""
+    sock.settimeout(5)
+    while len(received) < count:
+        chunk = sock.recv(65536)
+        if not chunk: break
+        *events, buffer = (buffer + chunk).split(b"\n\n")
+        received.extend(events)
+
+
+def test_stalled_client_is_dropped_without_delaying_a_live_one(broadcaster):
+    stalled = subscribed_pair(broadcaster) # Never read
+    live = subscribed_pair(broadcaster)
+    received, count = [], 400
+    reader = threading.Thread(target=read_events, args=(live, count, received))
+    reader.start()
+
+    start = time.monotonic()
+    for n in range(count):
+        broadcaster.publish("report_submitted", {"n": n, "padding": "x" * 1000})
+        while n - len(received) > 4 and time.monotonic() - start < 5: time.sleep(0.001) # Publish about as fast as a live dashboard reads
+    reader.join(5)
+    elapsed = time.monotonic() - start
+
+    assert len(received) == count and received[-1].startswith(f"id: {count}\n".encode())
+    assert elapsed < 2
+    stats = broadcaster.stats()
+    assert stats["clients"] == 1 and stats["slow_drops"] == 1
+    stalled.settimeout(5)
+    while stalled.recv(65536): pass # The dropped client sees its connection closed
+
+
+def test_client_that_catches_up_keeps_its_events(broadcaster):
+    slow = subscribed_pair(broadcaster)
+    for n in range(8):
+        broadcaster.publish("report_submitted", {"n": n, "padding": "x" * 1000})
+    time.sleep(0.2) # Some events wait in the client's buffer while its socket is full
+    received = []
+    read_events(slow, 8, received)
+    assert [event.split(b"\n")[0] for event in received] == [f"id: {n}".encode() for n in range(1, 9)]
+    assert broadcaster.stats()["clients"] == 1
+
+
+def test_events_endpoint_streams_published_events(client, server):
+    stream = socket.create_connection(('127.0.0.1', server), timeout=5)
+    stream.sendall(f"GET /events HTTP/1.1\r\nHost: localhost\r\nCookie: {client.cookie}\r\n\r\n".encode())
+    received = b""
+    while b"retry: 5000\n\n" not in received:
+        received += stream.recv(65536)
+    assert received.startswith(b"HTTP/1.1 200") and b"text/event-stream" in received
+    deadline = time.monotonic() + 5
+    while not web_server.EVENT_BROADCASTER.has_subscribers() and time.monotonic() < deadline: time.sleep(0.01)
+    web_server.EVENT_BROADCASTER.publish("reports_archived", {"kind": "weekly"})
+    while b"event: reports_archived" not in received:
+        received += stream.recv(65536)
+    assert b'data: {"kind": "weekly"}\n\n' in received
+    stream.close()
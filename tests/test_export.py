@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def export(client, query):
+    client.connection.request('GET', f'/api/export?{query}', headers={'Cookie': client.cookie})
+    response = client.connection.getresponse()
+    response.read()
+    return response
+
+
+@pytest.mark.parametrize("query", [
+    "kind=weekly&format=csv&date_from=2024-01-01%0d%0aX-Injected:%20yes",
+    "kind=weekly&format=csv&date_to=2024-13-01",
+    "kind=daily&format=xlsx&date_from=yesterday",
+])
+def test_invalid_dates_are_rejected(client, query):
+    response = export(client, query)
+    assert response.status == 400
+    assert response.getheader('X-Injected') is None
+
+
+def test_filename_uses_validated_dates(client):
+    response = export(client, "kind=weekly&format=csv&date_from=2024-01-01&date_to=2024-12-31")
+    assert response.status == 200
+    assert response.getheader('Content-Disposition') == 'attachment; filename="archive-weekly-2024-01-01-2024-12-31.csv"'
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+
+@pytest.mark.parametrize("year", ["abc", [2026], 0, "2026.5"])
+def test_import_rejects_bad_year(client, year):
+    result = client.call("import_holidays", {"year": year, "holidays": [{"date": "2026-01-01", "description": "ปีใหม่"}]})
+    assert result == {"status": "error", "message": "ปีไม่ถูกต้อง"}
+
+
+def test_import_rejects_non_object_rows(client):
+    assert client.call("import_holidays", {"holidays": ["2026-01-01"]})["status"] == "error"
+
+
+def test_import_replaces_a_year(client):
+    client.call("import_holidays", {"holidays": [{"date": "2026-01-01", "description": "ปีใหม่"}, {"date": "2026-04-13", "description": "สงกรานต์"}]})
+    result = client.call("import_holidays", {"year": "2026", "replace": True, "holidays": [{"date": "2026-05-01", "description": "แรงงาน"}]})
+    assert result["status"] == "success" and result["removed"] == 2
+    assert [h["date"] for h in client.call("list_holidays")["holidays"]] == ["2026-05-01"]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import json
+import socket
+import statistics
+import time
+
+import web_server
+
+
+def test_requests_reuse_one_connection(client):
+    sock = client.connection.sock
+    for _ in range(5):
+        assert client.call("list_holidays")["status"] == "success"
+    assert client.connection.sock is sock
+
+
+def test_kept_alive_requests_are_not_delayed_by_nagle(client):
+    # With Nagle on, every response on a reused connection waited ~40 ms for a delayed ACK
+    latencies = []
+    for _ in range(20):
+        started = time.perf_counter()
+        client.call("list_holidays")
+        latencies.append(time.perf_counter() - started)
+    assert statistics.median(latencies) < 0.02
+
+
+def test_connection_closes_after_max_requests(client, monkeypatch):
+    monkeypatch.setattr(web_server, "KEEPALIVE_MAX_REQUESTS", 3)
+    client.connection.close()
+    client.call("list_holidays")
+    client.call("list_holidays")
+    response, _ = client.post('/api', json.dumps({"action": "list_holidays", "payload": {}}))
+    assert response.getheader('Connection') == 'close'
+
+
+def test_http10_connection_closes_after_response(server):
+    with socket.create_connection(('127.0.0.1', server), timeout=10) as sock:
+        sock.sendall(b"GET /login.html HTTP/1.0\r\nHost: localhost\r\n\r\n")
+        received = b""
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk: break # The server closed the connection
+            received += chunk
+    assert received.startswith(b"HTTP/1.1 200")
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import web_server
+
+ADMIN_SESSION = {"role": "admin", "department": "ส่วนกลาง", "username": "jeerawut"}
+RANKS = list(web_server.RANK_ORDINAL)
+
+
+@pytest.fixture
+def personnel(db):
+    """40 people whose names match "สมชาย" with different relevance, plus 20 who do not match."""
+    rows = []
+    for i in range(60):
+        matches = i < 40
+        first_name = ("สมชาย" * (1 + i % 3)) if matches else "วิชัย"
+        position = "ผู้ช่วยสมชาย" if matches and i % 4 == 0 else "เจ้าหน้าที่"
+        rows.append((f"p{i:03d}", RANKS[i % len(RANKS)], first_name, f"นามสกุล{i % 7}", position, "", f"แผนก{i % 3}"))
+    db.executemany("INSERT INTO personnel (id, rank, first_name, last_name, position, specialty, department) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    db.commit()
+    web_server.RESPONSE_CACHE.clear()
+    web_server.LIST_TOTAL_CACHE.clear()
+    return rows
+
+
+def page_through(handler, key, payload, use_cursor):
+    seen, cursor_token, page = [], None, 1
+    while True:
+        request = dict(payload, cursor=cursor_token) if use_cursor else dict(payload, page=page)
+        result = handler(request)
+        assert result["status"] == "success"
+        seen += [row["id" if key == "personnel" else "username"] for row in result[key]]
+        if use_cursor:
+            cursor_token = result["next_cursor"]
+            if not cursor_token: return seen, result["total"]
+        else:
+            if page * web_server.ITEMS_PER_PAGE >= result["total"]: return seen, result["total"]
+            page += 1
+
+
+def list_personnel(db):
+    return lambda payload: web_server.handle_list_personnel(payload, db, db.cursor(), ADMIN_SESSION)
+
+
+@pytest.mark.parametrize("search_term", ["", "สมชาย", "สมชาย นามสกุล1", "สม"])
+def test_keyset_pages_return_every_row_once_in_page_order(db, personnel, search_term):
+    handler = list_personnel(db)
+    by_cursor, total = page_through(handler, "personnel", {"searchTerm": search_term}, use_cursor=True)
+    by_page, _ = page_through(handler, "personnel", {"searchTerm": search_term}, use_cursor=False)
+    assert len(by_cursor) == len(set(by_cursor)) == total
+    assert by_cursor == by_page
+
+
+def test_search_matches_like_filter(db, personnel):
+    handler = list_personnel(db)
+    found, total = page_through(handler, "personnel", {"searchTerm": "สมชาย"}, use_cursor=True)
+    assert set(found) == {row[0] for row in personnel if "สมชาย" in row[2] + row[4]}
+    assert total == 40
+
+
+def test_user_keyset_pages_with_search(db):
+    db.executemany("INSERT INTO users (username, salt, key, rank, first_name, last_name, position, department, role) VALUES (?, x'00', x'00', ?, ?, ?, '', ?, 'user')",
+                   [(f"user{i:02d}", RANKS[i % len(RANKS)], "ทดสอบ" * (1 + i % 2), f"ผู้ใช้{i}", "แผนกทดสอบ" if i % 5 == 0 else "แผนกอื่น") for i in range(35)])
+    db.commit()
+    handler = lambda payload: web_server.handle_list_users(payload, db, db.cursor())
+    by_cursor, total = page_through(handler, "users", {"searchTerm": "ทดสอบ"}, use_cursor=True)
+    by_page, _ = page_through(handler, "users", {"searchTerm": "ทดสอบ"}, use_cursor=False)
+    assert len(by_cursor) == len(set(by_cursor)) == total == 35
+    assert by_cursor == by_page
+
+
+def test_cursor_from_another_query_is_rejected(db, personnel):
+    handler = list_personnel(db)
+    token = handler({"cursor": None})["next_cursor"]
+    assert handler({"searchTerm": "สมชาย", "cursor": token})["status"] == "error"
+    assert handler({"cursor": "garbage"})["status"] == "error"
+
+
+def test_list_totals_stay_out_of_the_response_cache(db, personnel):
+    handler = list_personnel(db)
+    before, totals_before = web_server.RESPONSE_CACHE.stats(), web_server.LIST_TOTAL_CACHE.stats()
+    assert handler({"page": 1})["total"] == 60
+    assert handler({"page": 2})["total"] == 60
+    after = web_server.RESPONSE_CACHE.stats()
+    assert (after["entries"], after["hits"], after["misses"]) == (before["entries"], before["hits"], before["misses"])
+    totals = web_server.LIST_TOTAL_CACHE.stats()
+    assert totals["entries"] == 1
+    assert (totals["hits"] - totals_before["hits"], totals["misses"] - totals_before["misses"]) == (1, 1)
+
+    db.execute("DELETE FROM personnel WHERE id = 'p000'")
+    db.commit()
+    web_server.RESPONSE_CACHE.bump(["personnel"])
+    assert handler({"page": 2})["total"] == 59
+    assert web_server.LIST_TOTAL_CACHE.stats()["stale"] == totals["stale"] + 1
+
+
+def drop_search_indexes(db):
+    for table in web_server.SEARCH_COLUMNS:
+        for trigger in ("insert", "delete", "update"):
+            db.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{trigger}")
+        db.execute(f"DROP TABLE IF EXISTS {table}_fts")
+    db.commit()
+
+
+def test_search_index_is_created_at_startup_after_the_migration(db, personnel):
+    drop_search_indexes(db) # As left by migration 6 on a SQLite without FTS5
+    assert db.execute("SELECT 1 FROM schema_version WHERE version = 6").fetchone()
+    web_server.sync_search_index(db)
+    assert web_server.FULL_TEXT_SEARCH
+    found, total = page_through(list_personnel(db), "personnel", {"searchTerm": "สมชาย"}, use_cursor=True)
+    assert total == 40
+    db.execute("UPDATE personnel SET first_name = 'สมชายใหม่' WHERE id = 'p050'")
+    db.commit()
+    web_server.RESPONSE_CACHE.bump(["personnel"])
+    assert page_through(list_personnel(db), "personnel", {"searchTerm": "สมชาย"}, use_cursor=True)[1] == 41
+
+
+class NoFTS5:
+    """Connection wrapper that fails like a SQLite built without FTS5."""
+    def __init__(self, conn): self.conn = conn
+    def execute(self, sql, *args):
+        if "USING fts5" in sql: raise web_server.sqlite3.OperationalError("no such module: fts5")
+        return self.conn.execute(sql, *args)
+    def __getattr__(self, name): return getattr(self.conn, name)
+
+
+def test_search_falls_back_to_like_without_fts5(db, personnel, monkeypatch, capsys):
+    monkeypatch.setattr(web_server, "FULL_TEXT_SEARCH", True)
+    drop_search_indexes(db)
+    web_server.sync_search_index(NoFTS5(db))
+    assert not web_server.FULL_TEXT_SEARCH
+    assert "personnel_fts" in capsys.readouterr().out
+    assert page_through(list_personnel(db), "personnel", {"searchTerm": "สมชาย"}, use_cursor=True)[1] == 40
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import http.client
+
+import web_server
+
+
+def get_metrics(port, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    connection.request('GET', '/metrics', headers=headers or {})
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status
+
+
+def test_loopback_needs_auth_by_default(server):
+    assert get_metrics(server) == 403
+
+
+def test_loopback_bypass_is_opt_in(server, monkeypatch):
+    monkeypatch.setattr(web_server, "METRICS_ALLOW_LOOPBACK", True)
+    assert get_metrics(server) == 200
+
+
+def test_bearer_token(server, monkeypatch):
+    monkeypatch.setattr(web_server, "METRICS_TOKEN", "s3cret")
+    assert get_metrics(server, {'Authorization': 'Bearer s3cret'}) == 200
+    assert get_metrics(server, {'Authorization': 'Bearer wrong'}) == 403
+
+
+def test_admin_session(client):
+    assert get_metrics(client.connection.port, {'Cookie': client.cookie}) == 200
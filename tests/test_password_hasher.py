@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import web_server
+
+
+class BrokenPool:
+    def submit(self, *args):
+        raise BrokenProcessPool("worker died")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+class InlinePool:
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def test_broken_pool_is_replaced_once(monkeypatch):
+    hasher = web_server.PasswordHasher(queue_limit=16)
+    created = []
+    monkeypatch.setattr(hasher, "_new_pool", lambda: created.append(InlinePool()) or created[-1])
+    broken = BrokenPool()
+    hasher._pool = broken
+    results, barrier = [], threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        results.append(hasher.hash("Passw0rd", b"0" * 16))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert len(created) == 1
+    assert hasher._pool is created[0]
+    assert broken.shut_down
+    assert results == [web_server.hash_password("Passw0rd", b"0" * 16)] * 8
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+import web_server
+
+
+def person(first_name, last_name, department="แผนก1", position="เจ้าหน้าที่"):
+    return {"rank": "ร.ต.", "first_name": first_name, "last_name": last_name, "position": position, "specialty": "", "department": department}
+
+
+@pytest.fixture
+def roster(db):
+    web_server.import_personnel_rows(db.cursor(), [person("สมชาย", "ใจดี"), person("วิชัย", "มั่นคง"), person("กิตติ", "ทองดี")])
+    db.execute("INSERT INTO persistent_statuses (id, personnel_id, department, status, details, start_date, end_date) "
+               "SELECT 'st1', id, department, 'ลาพักผ่อน', '', '2099-01-01', '2099-01-31' FROM personnel WHERE first_name = 'กิตติ'")
+    db.commit()
+    return db
+
+
+def names(db):
+    return sorted(row[0] for row in db.execute("SELECT first_name FROM personnel"))
+
+
+def run_import(db, **payload):
+    return web_server.handle_import_personnel(payload, db, db.cursor())
+
+
+def test_default_mode_never_deletes(roster):
+    result = run_import(roster, personnel=[person("สมชาย", "ใจดี", position="หัวหน้า"), person("อนุชา", "บุญมา")])
+    assert result["status"] == "success"
+    assert result["counts"] == {"added": 1, "updated": 1, "unchanged": 0, "deleted": 0}
+    assert names(roster) == sorted(["สมชาย", "วิชัย", "กิตติ", "อนุชา"])
+
+
+def test_sync_requires_confirmed_dry_run(roster):
+    rows = [person("สมชาย", "ใจดี")]
+    assert run_import(roster, personnel=rows, mode="sync")["status"] == "error"
+    assert len(names(roster)) == 3
+
+    preview = run_import(roster, personnel=rows, mode="sync", dry_run=True)
+    assert preview["counts"]["deleted"] == 2
+    assert sorted(p["first_name"] for p in preview["deleted_personnel"]) == ["กิตติ", "วิชัย"]
+    assert len(names(roster)) == 3
+
+    assert run_import(roster, personnel=rows, mode="sync", confirm_deleted=1)["status"] == "error"
+    assert len(names(roster)) == 3
+    assert run_import(roster, personnel=rows, mode="sync", confirm_deleted=2)["status"] == "success"
+    assert names(roster) == ["สมชาย"]
+    assert roster.execute("SELECT COUNT(*) FROM persistent_statuses").fetchone()[0] == 0
+
+
+def test_replace_lists_everyone_in_dry_run(roster):
+    preview = run_import(roster, personnel=[person("อนุชา", "บุญมา")], mode="replace", dry_run=True)
+    assert len(preview["deleted_personnel"]) == 3
+    assert run_import(roster, personnel=[person("อนุชา", "บุญมา")], mode="replace", confirm_deleted=3)["status"] == "success"
+    assert names(roster) == ["อนุชา"]
+
+
+def test_rejects_rows_that_are_not_objects(roster):
+    assert run_import(roster, personnel=[["สมชาย"]])["status"] == "error"
+
+
+def upload(client, query, lines):
+    return client.post(f"/api/import_personnel{query}", "\n".join(lines), 'application/x-ndjson')
+
+
+def test_upload_defaults_to_upsert(client, roster):
+    response, body = upload(client, "", [json.dumps(person("อนุชา", "บุญมา"), ensure_ascii=False)])
+    assert response.status == 200
+    assert json.loads(body)["counts"]["deleted"] == 0
+    assert len(names(roster)) == 4
+
+
+@pytest.mark.parametrize("bad_line", ['["not", "an", "object"]', '42', '{"broken": '])
+def test_upload_rejects_bad_ndjson_line_with_its_number(client, roster, bad_line):
+    response, body = upload(client, "", [json.dumps(person("อนุชา", "บุญมา"), ensure_ascii=False), "", bad_line])
+    result = json.loads(body)
+    assert response.status == 400
+    assert result["line"] == 3 and "บรรทัดที่ 3" in result["message"]
+    assert len(names(roster)) == 3
+
+
+def test_upload_sync_needs_confirmation(client, roster):
+    lines = [json.dumps(person("สมชาย", "ใจดี"), ensure_ascii=False)]
+    response, _ = upload(client, "?mode=sync", lines)
+    assert response.status == 409
+    response, body = upload(client, "?mode=sync&dry_run=1", lines)
+    assert json.loads(body)["counts"]["deleted"] == 2
+    response, _ = upload(client, "?mode=sync&confirm_deleted=2", lines)
+    assert response.status == 200
+    assert names(roster) == ["สมชาย"]
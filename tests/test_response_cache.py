@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import web_server
+
+NEW_PERSON = {"rank": "ร.ต.", "first_name": "ทดสอบ", "last_name": "แคช", "position": "นายทหาร", "specialty": "-", "department": "แผนกแคช"}
+
+
+def cache_counts(cache=web_server.RESPONSE_CACHE):
+    stats = cache.stats()
+    return stats["hits"], stats["misses"]
+
+
+def test_repeated_read_is_served_from_the_cache(client):
+    first = client.call("list_holidays")
+    hits, misses = cache_counts()
+    assert client.call("list_holidays") == first
+    assert cache_counts() == (hits + 1, misses)
+
+
+@pytest.mark.parametrize("read_action, write_action, payload", [
+    ("list_holidays", "add_holiday", {"date": "2026-12-31", "description": "วันสิ้นปี"}),
+    ("get_dashboard_summary", "add_personnel", {"data": NEW_PERSON}),
+    ("get_daily_dashboard_summary", "add_personnel", {"data": NEW_PERSON}),
+])
+def test_write_makes_the_next_read_miss(client, read_action, write_action, payload):
+    write_tables = web_server.APIHandler.ACTION_MAP[write_action]["writes"]
+    assert set(write_tables) & set(web_server.APIHandler.ACTION_MAP[read_action]["cache_tables"])
+    before = client.call(read_action)
+    client.call(read_action)
+    assert client.call(write_action, payload)["status"] == "success"
+    hits, misses = cache_counts()
+    after = client.call(read_action)
+    assert cache_counts() == (hits, misses + 1)
+    assert after != before
+
+
+def test_list_personnel_total_follows_add_personnel(client):
+    total = client.call("list_personnel", {"page": 1})["total"]
+    hits, misses = cache_counts(web_server.LIST_TOTAL_CACHE)
+    assert client.call("list_personnel", {"page": 1})["total"] == total
+    assert cache_counts(web_server.LIST_TOTAL_CACHE) == (hits + 1, misses)
+
+    assert client.call("add_personnel", {"data": NEW_PERSON})["status"] == "success"
+    assert client.call("list_personnel", {"page": 1})["total"] == total + 1
+    assert cache_counts(web_server.LIST_TOTAL_CACHE) == (hits + 1, misses + 1)
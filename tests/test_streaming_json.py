@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import json
+import socket
+import uuid
+
+import pytest
+
+import web_server
+
+
+def decode_chunks(raw):
+    """Splits an HTTP/1.1 chunked body into its chunks; the terminating chunk must end it."""
+    chunks = []
+    while True:
+        size_line, raw = raw.split(b"\r\n", 1)
+        size = int(size_line, 16)
+        if size == 0:
+            assert raw == b"\r\n"
+            return chunks
+        chunks.append(raw[:size])
+        assert raw[size:size + 2] == b"\r\n"
+        raw = raw[size + 2:]
+
+
+STREAM = web_server.JSONObjectStream
+
+
+@pytest.mark.parametrize("make_value", [
+    lambda: {"status": "success", "archives": STREAM(iter([]))},
+    lambda: {"status": "success", "rows": iter([])},
+    lambda: {"status": "success", "archives": STREAM(iter([("2567", STREAM(iter([("5", [{"id": "ก", "n": 1.5, "none": None}])])))]))},
+    lambda: {"nested": iter([iter([1, 2]), {"a": "ข\"\n"}, STREAM(iter([(3, True)]))])},
+])
+def test_iter_json_matches_json_dumps(make_value):
+    expected = json.dumps(web_server.materialize_json(make_value()))
+    assert "".join(web_server.iter_json(make_value())) == expected
+
+
+@pytest.mark.parametrize("encoding", [None, "gzip"])
+@pytest.mark.parametrize("size", [0, 100, web_server.STREAM_CHUNK_SIZE * 3 + 10])
+def test_chunked_body_writer_frames_and_compresses(encoding, size):
+    sink = io.BytesIO()
+    writer = web_server.ChunkedBodyWriter(sink, chunked=True, encoding=encoding)
+    data = bytes(range(256)) * (size // 256) + bytes(size % 256)
+    for start in range(0, size, 1000):
+        writer.write(data[start:start + 1000])
+    writer.close()
+    chunks = decode_chunks(sink.getvalue())
+    body = b"".join(chunks)
+    assert (gzip.decompress(body) if encoding else body) == data
+    if encoding: return
+    if size <= web_server.STREAM_CHUNK_SIZE:
+        assert len(chunks) == (1 if size else 0)
+    else:
+        assert len(chunks) > 1 and all(len(chunk) >= web_server.STREAM_CHUNK_SIZE for chunk in chunks[:-1])
+
+
+def test_unchunked_writer_writes_the_plain_body():
+    sink = io.BytesIO()
+    writer = web_server.ChunkedBodyWriter(sink, chunked=False, encoding="gzip")
+    writer.write('{"a": "ข"}')
+    writer.close()
+    assert gzip.decompress(sink.getvalue()) == '{"a": "ข"}'.encode("utf-8")
+
+
+def add_archives(db, count, items_per_report=1):
+    for n in range(count):
+        day = f"2024-{1 + n % 12:02d}-{1 + n % 28:02d}"
+        items = [{"personnel_id": f"p{n}-{i}", "personnel_name": "ร.ต. ทดสอบ", "status": "ลาพักผ่อน", "details": "x" * 50} for i in range(items_per_report)]
+        db.execute("INSERT INTO archived_reports (id, year, month, date, department, submitted_by, report_data, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                   (str(uuid.uuid4()), int(day[:4]), int(day[5:7]), day, f"แผนก{n}", "user", json.dumps(items), f"{day} 08:00:00"))
+    db.commit()
+
+
+def fetch_raw(port, cookie, action):
+    body = json.dumps({"action": action, "payload": {}}).encode()
+    with socket.create_connection(("127.0.0.1", port), timeout=10) as sock:
+        sock.sendall(b"POST /api HTTP/1.1\r\nHost: localhost\r\nAccept-Encoding: gzip\r\nConnection: close\r\n"
+                     + f"Cookie: {cookie}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        raw = b""
+        while True:
+            data = sock.recv(65536)
+            if not data: break
+            raw += data
+    head, payload = raw.split(b"\r\n\r\n", 1)
+    headers = dict(line.split(": ", 1) for line in head.decode("latin-1").split("\r\n")[1:])
+    return {key.lower(): value for key, value in headers.items()}, payload
+
+
+@pytest.mark.parametrize("reports, multiple_chunks", [(0, False), (3, False), (120, True)])
+def test_archived_reports_stream_as_gzip_chunks(client, server, db, reports, multiple_chunks):
+    add_archives(db, reports, items_per_report=20)
+    headers, payload = fetch_raw(server, client.cookie, "get_archived_reports")
+    assert headers["transfer-encoding"] == "chunked" and headers["content-encoding"] == "gzip"
+    chunks = decode_chunks(payload)
+    assert (len(chunks) > 1) == multiple_chunks
+    expected = json.dumps(web_server.materialize_json(web_server.handle_get_archived_reports({}, db, db.cursor())))
+    assert gzip.decompress(b"".join(chunks)).decode("utf-8") == expected
+    if not reports:
+        assert json.loads(expected) == {"status": "success", "archives": {}}
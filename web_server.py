@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
 import json
 import hashlib
 import os
@@ -9,22 +9,118 @@ import uuid
 import sqlite3
 import secrets
 from html import escape
+from xml.sax.saxutils import escape as xml_escape
 from datetime import datetime, date, timedelta
-from collections import defaultdict
+from collections import defaultdict, Counter, OrderedDict
+from collections.abc import Iterator
+from itertools import groupby
 import time
 import re
-from email.utils import formatdate
-from urllib.parse import urlparse
+import csv
+import io
+import queue
+import signal
+import threading
+import socket
+import selectors
+import multiprocessing
+import gzip
+import zlib
+import zipfile
+import random
+import cProfile
+import pstats
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlparse, parse_qs
+
+try:
+    import brotli # Optional: enables "br" content encoding when installed
+except ImportError:
+    brotli = None
 
 # --- Database Setup ---
 DB_FILE = "database.db"
 
 # --- Configuration ---
-FAILED_LOGIN_ATTEMPTS = {}
 LOCKOUT_TIME = 300
 MAX_ATTEMPTS = 5
+LOGIN_ATTEMPT_BUCKET_SECONDS = 60 # Failed logins are counted per IP in buckets of this many seconds
+HASH_WORKERS = max(2, min(4, os.cpu_count() or 2)) # Processes reserved for PBKDF2 password hashing
+HASH_QUEUE_LIMIT = 32 # Hashing jobs allowed in flight before new ones are turned away
 SESSION_TIMEOUT_SECONDS = 1800 # 30 minutes
 ITEMS_PER_PAGE = 15 # Pagination limit
+SEARCH_MIN_TRIGRAM_LENGTH = 3 # Shorter search words cannot use the trigram index and fall back to LIKE
+ARCHIVE_PAGE_SIZE = 50 # Default number of reports per archive page
+ARCHIVE_PAGE_MAX = 200 # Largest archive page a client may ask for
+IMPORT_BATCH_SIZE = 500 # Rows per executemany() call during personnel imports
+XLSX_MAX_ROWS = 1048576 # Excel's per-sheet row limit; exports roll over to a new sheet
+CALENDAR_SPAN_YEARS = 3 # Years before and after today precomputed by the working-day calendar
+SESSION_CACHE_TTL = 60 # Seconds a cached session is trusted before re-reading it from the database
+MAINTENANCE_INTERVAL = 300 # Seconds between background sweeps of expired sessions and login attempts
+ARCHIVE_COLD_AFTER_DAYS = 365 # Archived reports older than this move to the compressed cold tier; None keeps them all in database.db
+ARCHIVE_TIER_BATCH = 200 # Reports moved per transaction by the tiering job
+ARCHIVE_TIER_SAMPLE = 20 # Reports read per tier when measuring read latency for the tier report
+
+# --- Server Configuration ---
+SERVER_MODE = "pooled" # "pooled" (bounded worker pool), "threaded" (thread per request) or "single"
+WORKER_THREADS = 16 # Number of worker threads in pooled mode
+REQUEST_QUEUE_SIZE = 64 # Accepted connections waiting for a worker before answering 503
+SHUTDOWN_GRACE_SECONDS = 10 # How long shutdown waits for queued requests to finish
+SERVER_BUSY_MESSAGE = "เซิร์ฟเวอร์มีผู้ใช้งานจำนวนมาก กรุณาลองใหม่อีกครั้ง"
+DB_BUSY_TIMEOUT = 10 # Seconds a connection waits for another writer before "database is locked"
+STREAM_CHUNK_SIZE = 16384 # Bytes buffered before a streamed response writes a chunk
+KEEPALIVE_TIMEOUT = 5 # Seconds an idle persistent connection waits for its next request
+KEEPALIVE_MAX_REQUESTS = 100 # Requests served on one connection before it is closed
+KEEPALIVE_POLL_INTERVAL = 0.1 # How often an idle connection checks whether others are queued for a worker
+BATCH_MAX_ACTIONS = 20 # Most actions a single "batch" request may carry
+SSE_MAX_CLIENTS = 200 # Dashboards that may hold an /events connection open at once
+SSE_HEARTBEAT_SECONDS = 15 # Idle interval before a keep-alive comment is sent to /events clients
+SSE_CLIENT_BUFFER_BYTES = 64 * 1024 # Undelivered bytes an /events client may fall behind by before it is dropped
+SSE_FLUSH_INTERVAL = 0.05 # Seconds between retries for /events clients whose socket was full
+RESPONSE_CACHE_MAX_BYTES = 8 * 1024 * 1024 # Memory budget of the response cache, measured as JSON size
+RESPONSE_CACHE_MAX_ENTRY_BYTES = 1024 * 1024 # Responses larger than this are never cached
+LIST_TOTAL_CACHE_MAX_ENTRIES = 2048 # Filtered list totals kept by fetch_list_page, apart from the response cache
+
+# --- Metrics Configuration ---
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Seconds
+METRICS_SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760) # Response bytes
+METRICS_TOKEN = None # Bearer token a scraper can send instead of an admin session cookie
+METRICS_ALLOW_LOOPBACK = False # Open /metrics to 127.0.0.1 and ::1 without auth; never behind a reverse proxy on the same host
+SLOW_REQUEST_SECONDS = 1.0 # Requests slower than this are logged with their query breakdown
+SLOW_REQUEST_TOP_QUERIES = 5 # Statements listed per slow request, most expensive first
+PROFILE_SAMPLE_RATE = 0.01 # Default share of requests run under cProfile once profiling is enabled
+PROFILE_REPORT_LINES = 40 # Functions listed by get_profile_report
+
+# --- Compression Configuration ---
+COMPRESSION_MIN_SIZE = 1024 # Responses smaller than this are sent uncompressed
+COMPRESSION_LEVEL = 6 # gzip level for API responses compressed on the fly
+BROTLI_QUALITY = 5 # brotli quality for API responses compressed on the fly
+STATIC_COMPRESSION_LEVEL = 9 # gzip level for static files, compressed once and cached
+STATIC_BROTLI_QUALITY = 11 # brotli quality for static files, compressed once and cached
+COMPRESSIBLE_MIMETYPES = {'text/html', 'application/javascript', 'text/css', 'application/json'}
+
+# --- Static File Configuration ---
+STATIC_PATH_MAP = {'/': '/login.html', '/main': '/main.html', '/daily': '/daily.html'}
+STATIC_MIMETYPES = {'.html': 'text/html', '.js': 'application/javascript', '.css': 'text/css'}
+STATIC_CACHE_CONTROL = "no-cache" # Browsers keep the files but revalidate them with ETag on every use
+ASSET_BUNDLING = True # Serve pages with one minified bundle per script; False serves the ES modules as they are
+ASSET_URL_PREFIX = "/assets/" # URL prefix of the content-hashed bundles
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable" # A bundle's URL changes whenever its content does
+
+# --- Database Pool Configuration ---
+DB_POOL_SIZE = WORKER_THREADS + 4 # Upper bound on open SQLite connections
+DB_POOL_TIMEOUT = 5 # Seconds a request waits for a free connection before giving up
+DB_PRAGMAS = [
+    ("journal_mode", "WAL"), # Readers never block the writer and vice versa
+    ("synchronous", "NORMAL"), # Safe with WAL; fsync only at checkpoints
+    ("cache_size", -16000), # 16 MB page cache per connection
+    ("mmap_size", 268435456), # Map up to 256 MB of the database file
+    ("busy_timeout", DB_BUSY_TIMEOUT * 1000),
+    ("temp_store", "MEMORY"),
+]
 
 RANK_ORDER = [
     'น.อ.(พ)', 'น.อ.(พ).หญิง', 'น.อ.หม่อมหลวง', 'น.อ.', 'น.อ.หญิง',
@@ -44,6 +140,11 @@ RANK_CLASSIFICATION = {
             'พ.อ.อ.หญิง', 'พ.อ.ท.หญิง', 'พ.อ.ต.หญิง', 'จ.อ.หญิง', 'จ.ท.หญิง', 'จ.ต.หญิง'],
     'civilian': ['นาย', 'นาง', 'นางสาว']
 }
+# Precomputed lookups: rank -> position in RANK_ORDER and rank -> personnel type.
+# The same data is mirrored into the `ranks` table by sync_ranks() for SQL joins.
+RANK_ORDINAL = {rank: ordinal for ordinal, rank in enumerate(RANK_ORDER)}
+RANK_CATEGORY = {rank: category for category, ranks in RANK_CLASSIFICATION.items() for rank in ranks}
+UNKNOWN_RANK_ORDINAL = len(RANK_ORDER) # Sorts ranks missing from RANK_ORDER last
 # --- END: NEW CONFIGURATION FOR DAILY SYSTEM ---
 
 
@@ -76,42 +177,506 @@ def get_next_week_range_str():
     return f"{start_day} - {end_day} {end_month} {end_year_be}"
 
 # --- START: NEW HELPER FOR DAILY SYSTEM LOGIC ---
-def get_daily_target_date(cursor):
+class WorkingDayCalendar:
     """
-    Determines the next working day for daily reports, skipping weekends and holidays.
+    Precomputed business-day calendar (weekends and `holidays` rows excluded).
+    For every day in the covered span it keeps the offset of the next working day
+    and a running count of working days, so both lookups are O(1). The holiday
+    table and the latest daily/archived report dates are loaded once and cached
+    until invalidate() / invalidate_reports() is called after a write.
     """
-    cursor.execute("SELECT date FROM holidays")
-    holidays = {date.fromisoformat(row['date']) for row in cursor.fetchall()}
-
-    cursor.execute("SELECT MAX(report_date) FROM archived_daily_reports")
-    last_archived_row = cursor.fetchone()
-    start_date = date.today()
-    if last_archived_row and last_archived_row[0]:
-        start_date = date.fromisoformat(last_archived_row[0])
-
-    cursor.execute("SELECT MAX(report_date) FROM daily_reports")
-    last_daily_row = cursor.fetchone()
-    if last_daily_row and last_daily_row[0]:
-        last_daily_date = date.fromisoformat(last_daily_row[0])
-        if last_daily_date > start_date:
-            return last_daily_date
-
-    next_day = start_date
-    while True:
-        next_day += timedelta(days=1)
+    def __init__(self, span_years=CALENDAR_SPAN_YEARS):
+        self.span_years = span_years
+        self._lock = threading.Lock()
+        self._calendar = None # (first day, next-working-day offsets, working-day prefix counts, holiday set)
+        self._anchors = None # (latest archived report date, latest daily report date)
+        self._generation = 0
+
+    def invalidate(self):
+        """Drops the calendar; call after the holidays table changes."""
+        with self._lock:
+            self._calendar, self._generation = None, self._generation + 1
+
+    def invalidate_reports(self):
+        """Drops the cached report dates; call after daily_reports or archived_daily_reports change."""
+        with self._lock:
+            self._anchors, self._generation = None, self._generation + 1
+
+    @staticmethod
+    def _is_working_day(day, holidays):
         # weekday() -> Monday is 0 and Sunday is 6
-        if next_day.weekday() >= 5 or next_day in holidays:
-            continue
+        return day.weekday() < 5 and day not in holidays
+
+    def _load_calendar(self, cursor):
+        with self._lock:
+            if self._calendar: return self._calendar
+            generation = self._generation
+        cursor.execute("SELECT date FROM holidays")
+        holidays = {date.fromisoformat(row['date']) for row in cursor.fetchall()}
+        today = date.today()
+        first_year = min([today.year - self.span_years] + [d.year for d in holidays])
+        last_year = max([today.year + self.span_years] + [d.year for d in holidays])
+        first_day = date(first_year, 1, 1)
+        span = (date(last_year, 12, 31) - first_day).days + 1
+
+        working = [self._is_working_day(first_day + timedelta(days=i), holidays) for i in range(span)]
+        prefix = [0] * (span + 1) # prefix[i] = working days in [first_day, first_day + i)
+        for i, is_working in enumerate(working):
+            prefix[i + 1] = prefix[i] + is_working
+        next_offset = [None] * span # next_offset[i] = offset of the first working day after day i
+        upcoming = None
+        for i in range(span - 1, -1, -1):
+            next_offset[i] = upcoming
+            if working[i]: upcoming = i
+
+        calendar = (first_day, next_offset, prefix, holidays)
+        with self._lock:
+            if generation == self._generation: self._calendar = calendar
+        return calendar
+
+    def _load_anchors(self, cursor):
+        with self._lock:
+            if self._anchors: return self._anchors
+            generation = self._generation
+        cursor.execute("SELECT MAX(last) FROM (SELECT MAX(report_date) AS last FROM main.archived_daily_reports UNION ALL SELECT MAX(report_date) FROM cold.archived_daily_reports)")
+        last_archived = cursor.fetchone()[0]
+        cursor.execute("SELECT MAX(report_date) FROM daily_reports")
+        last_daily = cursor.fetchone()[0]
+        anchors = (date.fromisoformat(last_archived) if last_archived else None,
+                   date.fromisoformat(last_daily) if last_daily else None)
+        with self._lock:
+            if generation == self._generation: self._anchors = anchors
+        return anchors
+
+    def next_working_day(self, cursor, day):
+        """Returns the first working day strictly after `day`."""
+        first_day, next_offset, _, holidays = self._load_calendar(cursor)
+        offset = (day - first_day).days
+        if 0 <= offset < len(next_offset) and next_offset[offset] is not None:
+            return first_day + timedelta(days=next_offset[offset])
+        next_day = day + timedelta(days=1) # Outside the precomputed span
+        while not self._is_working_day(next_day, holidays):
+            next_day += timedelta(days=1)
         return next_day
+
+    def working_days_between(self, cursor, start, end):
+        """Counts working days from `start` to `end`, both inclusive (0 if end < start)."""
+        if end < start: return 0
+        first_day, _, prefix, holidays = self._load_calendar(cursor)
+        start_offset, end_offset = (start - first_day).days, (end - first_day).days
+        if 0 <= start_offset and end_offset < len(prefix) - 1:
+            return prefix[end_offset + 1] - prefix[start_offset]
+        return sum(self._is_working_day(start + timedelta(days=i), holidays) for i in range((end - start).days + 1))
+
+    def target_date(self, cursor):
+        """The day daily reports are currently collected for; see get_daily_target_date()."""
+        last_archived, last_daily = self._load_anchors(cursor)
+        start_date = last_archived or date.today()
+        if last_daily and last_daily > start_date:
+            return last_daily
+        return self.next_working_day(cursor, start_date)
+
+WORKING_DAY_CALENDAR = WorkingDayCalendar()
+
+def get_daily_target_date(cursor):
+    """
+    Determines the next working day for daily reports, skipping weekends and holidays.
+    """
+    return WORKING_DAY_CALENDAR.target_date(cursor)
 # --- END: NEW HELPER FOR DAILY SYSTEM LOGIC ---
 
 
 # --- Database Functions ---
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
+    conn = sqlite3.connect(DB_FILE, timeout=DB_BUSY_TIMEOUT)
     conn.row_factory = sqlite3.Row
+    attach_cold_archive(conn, DB_FILE)
+    create_archive_views(conn)
     return conn
 
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes free within DB_POOL_TIMEOUT."""
+
+class ConnectionPool:
+    """
+    Hands out long-lived SQLite connections tuned with DB_PRAGMAS.
+    Connections are opened lazily up to max_size and reused afterwards; when all of
+    them are checked out, callers wait up to `timeout` seconds for one to come back.
+    """
+    def __init__(self, db_file=None, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.db_file = db_file
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._stats = {"checkouts": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0, "exhausted": 0, "timeouts": 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file or DB_FILE, timeout=DB_BUSY_TIMEOUT, check_same_thread=False, factory=InstrumentedConnection)
+        conn.row_factory = sqlite3.Row
+        attach_cold_archive(conn, self.db_file or DB_FILE) # Before the pragmas so journal_mode applies to both files
+        for pragma, value in DB_PRAGMAS:
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        create_archive_views(conn)
+        return conn
+
+    def acquire(self):
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create: self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock: self._created -= 1
+                    raise
+            else:
+                with self._lock: self._stats["exhausted"] += 1
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock: self._stats["timeouts"] += 1
+                    print(f"DB pool exhausted: no connection free after {self.timeout}s ({self.max_size} in use)")
+                    raise PoolTimeoutError("database connection pool exhausted")
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+        return conn
+
+    def release(self, conn):
+        try:
+            # A handler that failed mid-transaction must not leak its locks to the next user
+            if conn.in_transaction: conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._lock: self._created -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open_connections"] = self._created
+        stats["idle_connections"] = self._idle.qsize()
+        stats["max_size"] = self.max_size
+        stats["wait_seconds_avg"] = stats["wait_seconds_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock: self._created -= 1
+
+DB_POOL = ConnectionPool()
+
+# --- Request Metrics ---
+_request_local = threading.local()
+
+class RequestProfile:
+    """Per-request counters filled in while an API request is handled on this thread."""
+    def __init__(self, action):
+        self.action = action
+        self.started = time.perf_counter()
+        self.status_code = None
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.queries = {} # statement -> [executions, seconds]
+        self.json_decode_seconds = 0.0
+        self.json_encode_seconds = 0.0
+        self.response_bytes = 0
+        self.profiler = None
+
+    def record_sql(self, sql, seconds, executed=True):
+        self.sql_seconds += seconds
+        entry = self.queries.setdefault(sql, [0, 0.0])
+        entry[1] += seconds
+        if executed:
+            self.sql_count += 1
+            entry[0] += 1
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that charges statement and fetch time to the current RequestProfile.
+    Rows consumed by iterating the cursor are not timed; fetchall()/fetchone() are.
+    """
+    _last_sql = None
+
+    def _timed(self, method, sql, *args, executed=True):
+        profile = getattr(_request_local, 'profile', None)
+        if profile is None: return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            profile.record_sql(sql, time.perf_counter() - started, executed)
+
+    def execute(self, sql, parameters=()):
+        self._last_sql = sql
+        return self._timed(super().execute, sql, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._last_sql = sql
+        return self._timed(super().executemany, sql, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._timed(super().executescript, sql_script, sql_script)
+
+    def fetchone(self):
+        return self._timed(super().fetchone, self._last_sql, executed=False)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, self._last_sql, *(() if size is None else (size,)), executed=False)
+
+    def fetchall(self):
+        return self._timed(super().fetchall, self._last_sql, executed=False)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including the implicit ones of conn.execute) are InstrumentedCursor."""
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The C implementations of these shortcuts bypass cursor(), so route them through it
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+class RequestMetrics:
+    """
+    Aggregates RequestProfile results per action for /metrics and writes the slow-request
+    log. Optionally runs a sampled share of requests under cProfile and merges the results.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._actions = {}
+        self.slow_requests = 0
+        self.profile_sample_rate = 0.0
+        self._profile_stats = None
+        self.profiled_requests = 0
+
+    def begin(self, action="unknown"):
+        profile = RequestProfile(action)
+        if self.profile_sample_rate and random.random() < self.profile_sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                profile.profiler = profiler
+            except ValueError:
+                pass # Another profiler is already active on this interpreter
+        _request_local.profile = profile
+        return profile
+
+    def current(self):
+        return getattr(_request_local, 'profile', None)
+
+    @staticmethod
+    def _observe(buckets, counts, value):
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+                return
+        counts[-1] += 1
+
+    def finish(self, profile):
+        if profile.profiler:
+            profile.profiler.disable()
+        _request_local.profile = None
+        duration = time.perf_counter() - profile.started
+        with self._lock:
+            stats = self._actions.get(profile.action)
+            if stats is None:
+                stats = self._actions[profile.action] = {
+                    "codes": Counter(), "latency": [0] * (len(METRICS_LATENCY_BUCKETS) + 1), "latency_sum": 0.0,
+                    "sizes": [0] * (len(METRICS_SIZE_BUCKETS) + 1), "size_sum": 0, "sql_count": 0, "sql_seconds": 0.0,
+                    "json_decode_seconds": 0.0, "json_encode_seconds": 0.0,
+                }
+            stats["codes"][str(profile.status_code or 0)] += 1
+            self._observe(METRICS_LATENCY_BUCKETS, stats["latency"], duration)
+            stats["latency_sum"] += duration
+            self._observe(METRICS_SIZE_BUCKETS, stats["sizes"], profile.response_bytes)
+            stats["size_sum"] += profile.response_bytes
+            stats["sql_count"] += profile.sql_count
+            stats["sql_seconds"] += profile.sql_seconds
+            stats["json_decode_seconds"] += profile.json_decode_seconds
+            stats["json_encode_seconds"] += profile.json_encode_seconds
+            if profile.profiler:
+                self.profiled_requests += 1
+                if self._profile_stats is None:
+                    self._profile_stats = pstats.Stats(profile.profiler)
+                else:
+                    self._profile_stats.add(profile.profiler)
+            if duration >= SLOW_REQUEST_SECONDS:
+                self.slow_requests += 1
+        if duration >= SLOW_REQUEST_SECONDS:
+            self._log_slow_request(profile, duration)
+
+    @staticmethod
+    def _log_slow_request(profile, duration):
+        top_queries = sorted(profile.queries.items(), key=lambda item: item[1][1], reverse=True)[:SLOW_REQUEST_TOP_QUERIES]
+        print(f"Slow request: action '{profile.action}' took {duration * 1000:.0f} ms "
+              f"(sql {profile.sql_count} statements / {profile.sql_seconds * 1000:.0f} ms, "
+              f"json decode {profile.json_decode_seconds * 1000:.1f} ms, encode {profile.json_encode_seconds * 1000:.1f} ms, "
+              f"{profile.response_bytes} bytes)")
+        for sql, (executions, seconds) in top_queries:
+            print(f"    {seconds * 1000:8.1f} ms x{executions:<4} {' '.join(str(sql).split())[:200]}")
+
+    def set_profiling(self, sample_rate, reset=False):
+        with self._lock:
+            self.profile_sample_rate = max(0.0, min(1.0, sample_rate))
+            if reset:
+                self._profile_stats, self.profiled_requests = None, 0
+
+    def profile_report(self, sort_key="cumulative", limit=PROFILE_REPORT_LINES):
+        with self._lock:
+            if self._profile_stats is None: return ""
+            output = io.StringIO()
+            self._profile_stats.stream = output
+            self._profile_stats.sort_stats(sort_key).print_stats(limit)
+        return output.getvalue()
+
+    def snapshot(self):
+        with self._lock:
+            return {action: {**stats, "codes": dict(stats["codes"]), "latency": list(stats["latency"]), "sizes": list(stats["sizes"])}
+                    for action, stats in self._actions.items()}
+
+REQUEST_METRICS = RequestMetrics()
+
+# --- Session Store ---
+class SessionStore:
+    """
+    In-process cache of logged-in sessions keyed by token, written through to the
+    `sessions` table. Expired rows are removed by a background sweep instead of on
+    every request; entries are dropped on logout and whenever their user changes.
+    """
+    def __init__(self, ttl=SESSION_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {} # token -> (session dict, session expiry, cache expiry)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _expires_at(created_at):
+        if isinstance(created_at, str): created_at = datetime.fromisoformat(created_at)
+        return created_at.timestamp() + SESSION_TIMEOUT_SECONDS
+
+    def get(self, cursor, token):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+        if entry and now < entry[1] and now < entry[2]:
+            return dict(entry[0])
+
+        cursor.execute("SELECT u.username, u.role, u.department, s.created_at FROM sessions s JOIN users u ON s.username = u.username WHERE s.token = ?", (token,))
+        row = cursor.fetchone()
+        if not row or self._expires_at(row['created_at']) <= now:
+            with self._lock: self._entries.pop(token, None)
+            return None
+        session = dict(row)
+        session['token'] = token
+        with self._lock:
+            self._entries[token] = (session, self._expires_at(row['created_at']), now + self.ttl)
+        return dict(session)
+
+    def create(self, conn, token, user_data):
+        created_at = datetime.now()
+        conn.execute("INSERT INTO sessions (token, username, created_at) VALUES (?, ?, ?)", (token, user_data['username'], created_at))
+        conn.commit()
+        session = {'username': user_data['username'], 'role': user_data['role'], 'department': user_data['department'], 'created_at': str(created_at), 'token': token}
+        with self._lock:
+            self._entries[token] = (session, self._expires_at(created_at), time.time() + self.ttl)
+
+    def delete(self, conn, token):
+        conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+        conn.commit()
+        with self._lock: self._entries.pop(token, None)
+
+    def invalidate_user(self, username):
+        """Drops cached sessions of `username` so the next request re-reads role and department."""
+        with self._lock:
+            for token in [t for t, entry in self._entries.items() if entry[0]['username'] == username]:
+                del self._entries[token]
+
+    def sweep(self, conn):
+        expiry_limit = datetime.now() - timedelta(seconds=SESSION_TIMEOUT_SECONDS)
+        conn.execute("DELETE FROM sessions WHERE created_at < ?", (expiry_limit,))
+        conn.commit()
+        now = time.time()
+        with self._lock:
+            for token in [t for t, entry in self._entries.items() if entry[1] <= now]:
+                del self._entries[token]
+
+SESSION_STORE = SessionStore()
+
+# --- Login Rate Limiting ---
+class LoginRateLimiter:
+    """
+    Counts failed logins per IP address in time buckets stored in `login_attempts`.
+    An address is locked out while its failures within the last LOCKOUT_TIME seconds
+    reach MAX_ATTEMPTS; buckets older than that are evicted by the maintenance thread.
+    """
+    @staticmethod
+    def _bucket(timestamp):
+        return int(timestamp // LOGIN_ATTEMPT_BUCKET_SECONDS)
+
+    def is_locked(self, cursor, ip_address):
+        cursor.execute("SELECT COALESCE(SUM(failures), 0) FROM login_attempts WHERE ip = ? AND bucket >= ?",
+                       (ip_address, self._bucket(time.time() - LOCKOUT_TIME)))
+        return cursor.fetchone()[0] >= MAX_ATTEMPTS
+
+    def record_failure(self, conn, ip_address):
+        conn.execute("INSERT INTO login_attempts (ip, bucket, failures) VALUES (?, ?, 1) ON CONFLICT (ip, bucket) DO UPDATE SET failures = failures + 1",
+                     (ip_address, self._bucket(time.time())))
+        conn.commit()
+
+    def reset(self, conn, ip_address):
+        conn.execute("DELETE FROM login_attempts WHERE ip = ?", (ip_address,))
+        conn.commit()
+
+    def evict(self, conn):
+        conn.execute("DELETE FROM login_attempts WHERE bucket < ?", (self._bucket(time.time() - LOCKOUT_TIME),))
+        conn.commit()
+
+LOGIN_LIMITER = LoginRateLimiter()
+
+# --- Background Maintenance ---
+def run_maintenance():
+    with DB_POOL.connection() as conn:
+        for task in (SESSION_STORE.sweep, LOGIN_LIMITER.evict, tier_archives):
+            try:
+                task(conn)
+            except Exception as e:
+                print(f"Maintenance task {task.__qualname__} failed: {e}")
+
+def _maintenance_loop():
+    while True:
+        time.sleep(MAINTENANCE_INTERVAL)
+        run_maintenance()
+
+def start_maintenance_thread():
+    threading.Thread(target=_maintenance_loop, name="maintenance", daemon=True).start()
+
 def init_db():
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -167,6 +732,11 @@ def init_db():
         )
     ''')
 
+    run_migrations(conn)
+    sync_ranks(conn)
+    enable_incremental_vacuum(conn)
+    sync_search_index(conn)
+
     cursor.execute("SELECT * FROM users WHERE username = ?", ('jeerawut',))
     if not cursor.fetchone():
         print("กำลังสร้างผู้ดูแลระบบ 'jeerawut'...")
@@ -177,14 +747,1119 @@ def init_db():
     conn.close()
     print("ฐานข้อมูล SQLite พร้อมใช้งาน")
 
+# --- Schema Migrations ---
+# Each migration runs once, in version order, inside its own transaction. To change the
+# schema, append a new (version, description, function) entry; never edit an applied one.
+def _migration_hot_query_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_status_reports_department ON status_reports (department, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_reports_date_department ON daily_reports (report_date, department)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_persistent_statuses_department_end ON persistent_statuses (department, end_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_persistent_statuses_end ON persistent_statuses (end_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_archived_reports_date_department ON archived_reports (date, department)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_archived_reports_department_timestamp ON archived_reports (department, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_archived_daily_reports_date_department ON archived_daily_reports (report_date, department)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_personnel_department ON personnel (department)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_username ON sessions (username)")
+
+def _migration_status_report_counts(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS status_report_counts (
+            department TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (department, status)
+        )
+    ''')
+    cursor.execute("SELECT department, report_data FROM status_reports")
+    for row in cursor.fetchall():
+        replace_status_counts(cursor, row['department'], json.loads(row['report_data']))
+
+def _migration_report_items(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_items (
+            report_id TEXT NOT NULL,
+            report_table TEXT NOT NULL,
+            category TEXT,
+            personnel_id TEXT,
+            personnel_name TEXT,
+            department TEXT NOT NULL,
+            report_date TEXT NOT NULL,
+            status TEXT,
+            details TEXT,
+            start_date TEXT,
+            end_date TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_report_items_report ON report_items (report_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_report_items_status_dates ON report_items (status, start_date, end_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_report_items_personnel ON report_items (personnel_id, start_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_report_items_table_department_date ON report_items (report_table, department, report_date)")
+    for table in ('status_reports', 'archived_reports'):
+        cursor.execute(f"SELECT id, department, date, report_data FROM {table}")
+        for row in cursor.fetchall():
+            write_report_items(cursor, table, row['id'], row['department'], row['date'], json.loads(row['report_data']))
+    for table in ('daily_reports', 'archived_daily_reports'):
+        cursor.execute(f"SELECT id, department, report_date, report_data FROM {table}")
+        for row in cursor.fetchall():
+            write_report_items(cursor, table, row['id'], row['department'], row['report_date'], json.loads(row['report_data']))
+
+def _migration_login_attempts(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS login_attempts (ip TEXT NOT NULL, bucket INTEGER NOT NULL, failures INTEGER NOT NULL, PRIMARY KEY (ip, bucket))")
+
+def _migration_ranks(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS ranks (rank TEXT PRIMARY KEY, ordinal INTEGER NOT NULL, category TEXT NOT NULL) WITHOUT ROWID")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ranks_category ON ranks (category, ordinal)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_personnel_rank ON personnel (rank)")
+
+# Columns indexed for the admin search boxes, per table
+SEARCH_COLUMNS = {
+    'personnel': ('first_name', 'last_name', 'position'),
+    'users': ('username', 'first_name', 'last_name', 'department'),
+}
+
+def _migration_search_index(cursor):
+    # The indexes are created by sync_search_index on every startup, so a SQLite upgraded
+    # later still gets them; this version only marks the schema that expects them.
+    pass
+
+def create_search_index(conn, table, columns):
+    """Creates {table}_fts and the triggers that keep it in step with `table`, if missing."""
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f"new.{column}" for column in columns)
+    old_values = ', '.join(f"old.{column}" for column in columns)
+    conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5({column_list}, content='{table}', tokenize='trigram')")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+                 f"INSERT INTO {table}_fts (rowid, {column_list}) VALUES (new.rowid, {new_values}); END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+                 f"INSERT INTO {table}_fts ({table}_fts, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values}); END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {column_list} ON {table} BEGIN "
+                 f"INSERT INTO {table}_fts ({table}_fts, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values}); "
+                 f"INSERT INTO {table}_fts (rowid, {column_list}) VALUES (new.rowid, {new_values}); END")
+
+MIGRATIONS = [
+    (1, "Indexes for dashboard, submission and archive queries", _migration_hot_query_indexes),
+    (2, "Per-department status counts for the weekly dashboard", _migration_status_report_counts),
+    (3, "Normalized report_items backfilled from report_data", _migration_report_items),
+    (4, "Persisted failed-login counters", _migration_login_attempts),
+    (5, "Rank reference table for SQL-side ordering and classification", _migration_ranks),
+    (6, "Trigram full-text indexes for personnel and user search", _migration_search_index),
+]
+
+def run_migrations(conn):
+    """Applies every migration in MIGRATIONS that is not yet recorded in schema_version."""
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at DATETIME DEFAULT CURRENT_TIMESTAMP)")
+    conn.commit()
+    cursor.execute("SELECT version FROM schema_version")
+    applied = {row[0] for row in cursor.fetchall()}
+    for version, description, migrate in MIGRATIONS:
+        if version in applied: continue
+        print(f"กำลังปรับปรุงโครงสร้างฐานข้อมูลเป็นเวอร์ชัน {version}: {description}")
+        try:
+            cursor.execute("BEGIN")
+            migrate(cursor)
+            cursor.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def sync_ranks(conn):
+    """Mirrors RANK_ORDER and RANK_CLASSIFICATION into the ranks table so edits to the constants take effect on restart."""
+    rows = [(rank, ordinal, RANK_CATEGORY.get(rank, 'other')) for rank, ordinal in RANK_ORDINAL.items()]
+    conn.executemany(
+        "INSERT INTO ranks (rank, ordinal, category) VALUES (?, ?, ?) ON CONFLICT(rank) DO UPDATE SET ordinal = excluded.ordinal, category = excluded.category",
+        rows
+    )
+    conn.execute(f"DELETE FROM ranks WHERE rank NOT IN ({', '.join('?' for _ in rows)})", [row[0] for row in rows])
+    conn.commit()
+
+FULL_TEXT_SEARCH = False # Set by sync_search_index once the trigram indexes exist
+
+def sync_search_index(conn):
+    """
+    Creates the trigram search indexes if this SQLite supports them, then rebuilds them
+    from their tables. Doing both on every startup means an upgraded SQLite picks the
+    indexes up, and the rebuild realigns them with rowids that VACUUM may renumber.
+    """
+    global FULL_TEXT_SEARCH
+    available = True
+    for table, columns in SEARCH_COLUMNS.items():
+        try:
+            create_search_index(conn, table, columns)
+        except sqlite3.OperationalError as e:
+            # FTS5 and its trigram tokenizer need SQLite 3.34+; search keeps using LIKE without them
+            conn.rollback()
+            print(f"ไม่สามารถสร้างดัชนีค้นหา {table}_fts ได้ (SQLite {sqlite3.sqlite_version}: {e}) ระบบจะค้นหาแบบ LIKE แทน")
+            available = False
+            continue
+        conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+    conn.commit()
+    FULL_TEXT_SEARCH = available
+
+def search_filter(table, alias, search_term):
+    """
+    Builds the filter for an admin search box: every whitespace-separated word must
+    occur in one of the table's SEARCH_COLUMNS. Returns (join, condition, params, order):
+    with the trigram index the join and order rank rows by relevance; words shorter than
+    a trigram use a LIKE scan instead and order is None.
+    """
+    words = search_term.split()
+    if FULL_TEXT_SEARCH and all(len(word) >= SEARCH_MIN_TRIGRAM_LENGTH for word in words):
+        index = f"{table}_fts"
+        query = ' '.join('"' + word.replace('"', '""') + '"' for word in words)
+        return f" JOIN {index} ON {index}.rowid = {alias}.rowid", f"{index} MATCH ?", [query], f"{index}.rank"
+    conditions, params = [], []
+    for word in words:
+        conditions.append("(" + " OR ".join(f"{alias}.{column} LIKE ?" for column in SEARCH_COLUMNS[table]) + ")")
+        params.extend([f"%{word}%"] * len(SEARCH_COLUMNS[table]))
+    return "", " AND ".join(conditions), params, None
+
+def replace_status_counts(cursor, department, items):
+    """Rewrites the status_report_counts rows of one department from its submitted items."""
+    counts = Counter(item.get('status', 'ไม่ระบุ') for item in items)
+    cursor.execute("DELETE FROM status_report_counts WHERE department = ?", (department,))
+    cursor.executemany("INSERT INTO status_report_counts (department, status, count) VALUES (?, ?, ?)",
+                       [(department, status, count) for status, count in counts.items()])
+
+def write_report_items(cursor, report_table, report_id, department, report_date, report_data):
+    """
+    Stores one row per status item of a report in report_items.
+    Weekly reports carry a flat item list; daily reports group items by personnel category.
+    """
+    if isinstance(report_data, dict):
+        items = [(category, item) for category, category_items in report_data.items() for item in category_items]
+    else:
+        items = [(None, item) for item in report_data]
+    cursor.executemany(
+        """INSERT INTO report_items
+           (report_id, report_table, category, personnel_id, personnel_name, department, report_date, status, details, start_date, end_date)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        [(report_id, report_table, category, item.get('personnel_id'), item.get('personnel_name'), department, report_date,
+          item.get('status'), item.get('details'), item.get('start_date'), item.get('end_date')) for category, item in items]
+    )
+
+def encode_cursor(values):
+    """Packs the sort key of the last returned row into an opaque continuation token."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError):
+        return None
+
+# --- Archive Cold Storage ---
+ARCHIVE_KINDS = {
+    'weekly': {'table': 'archived_reports', 'view': 'all_archived_reports', 'date_column': 'date',
+               'columns': ('id', 'year', 'month', 'date', 'department', 'submitted_by', 'report_data', 'timestamp'),
+               'json_columns': ('report_data',)},
+    'daily': {'table': 'archived_daily_reports', 'view': 'all_archived_daily_reports', 'date_column': 'report_date',
+              'columns': ('id', 'year', 'month', 'report_date', 'department', 'submitted_by', 'timestamp', 'summary_data', 'report_data'),
+              'json_columns': ('summary_data', 'report_data')},
+}
+
+def cold_archive_file(db_file):
+    """Returns the path of the cold-tier database that sits next to `db_file`."""
+    root, ext = os.path.splitext(db_file)
+    return f"{root}.cold{ext or '.db'}"
+
+def attach_cold_archive(conn, db_file):
+    """
+    Attaches the cold tier as schema `cold`. Its tables mirror the hot archive tables,
+    but JSON columns hold zlib-compressed BLOBs and raw_bytes records their original size.
+    """
+    conn.execute("ATTACH DATABASE ? AS cold", (cold_archive_file(db_file),))
+    conn.execute("PRAGMA cold.auto_vacuum = INCREMENTAL") # Takes effect only while the file is still empty
+    for spec in ARCHIVE_KINDS.values():
+        table, date_column, columns = spec['table'], spec['date_column'], spec['columns']
+        column_defs = ', '.join(
+            'id TEXT PRIMARY KEY' if column == 'id' else
+            f"{column} BLOB" if column in spec['json_columns'] else
+            f"{column} INTEGER NOT NULL" if column in ('year', 'month') else f"{column} TEXT"
+            for column in columns
+        )
+        conn.execute(f"CREATE TABLE IF NOT EXISTS cold.{table} ({column_defs}, raw_bytes INTEGER NOT NULL)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS cold.idx_{table}_date_department ON {table} ({date_column}, department)")
+    conn.commit()
+
+def create_archive_views(conn):
+    """
+    Defines the per-connection views that archive readers use: hot rows plus cold ones,
+    which decode_archive_json unpacks. A report copied to cold but not yet deleted from
+    hot is only returned once. Changing temp_store drops these, so call it after DB_PRAGMAS.
+    """
+    for spec in ARCHIVE_KINDS.values():
+        table, column_list = spec['table'], ', '.join(spec['columns'])
+        conn.execute(f"""CREATE TEMP VIEW IF NOT EXISTS {spec['view']} AS
+            SELECT {column_list} FROM main.{table}
+            UNION ALL
+            SELECT {column_list} FROM cold.{table} WHERE id NOT IN (SELECT id FROM main.{table})""")
+
+def archive_tiers_query(kind, where_clause_str=""):
+    """
+    Returns a SELECT over both tiers with `where_clause_str` applied to each, so an outer
+    ORDER BY ... LIMIT can merge the two index-ordered scans. The views sort the whole
+    union instead; pass the WHERE parameters twice.
+    """
+    spec = ARCHIVE_KINDS[kind]
+    table, column_list = spec['table'], ', '.join(spec['columns'])
+    cold_where = f"{where_clause_str} AND" if where_clause_str else " WHERE"
+    return (f"SELECT {column_list} FROM main.{table}{where_clause_str} UNION ALL "
+            f"SELECT {column_list} FROM cold.{table}{cold_where} id NOT IN (SELECT id FROM main.{table})")
+
+def decode_archive_json(value):
+    """Parses an archived JSON column from either tier."""
+    if isinstance(value, bytes):
+        value = zlib.decompress(value)
+    return json.loads(value)
+
+def tier_archives(conn, older_than_days=None):
+    """
+    Moves archived reports dated more than `older_than_days` (default ARCHIVE_COLD_AFTER_DAYS)
+    ago into the cold tier, ARCHIVE_TIER_BATCH reports per transaction. Each batch is
+    read and copied to cold under one write lock (BEGIN IMMEDIATE), so a report replaced
+    by handle_archive_reports meanwhile is never copied stale. The copy is committed
+    before the rows are deleted from hot, so an interruption never loses a report; a
+    report present in both tiers is read from hot.
+    """
+    if older_than_days is None: older_than_days = ARCHIVE_COLD_AFTER_DAYS
+    if older_than_days is None: return {}
+    cutoff = (date.today() - timedelta(days=older_than_days)).isoformat()
+    moved = {}
+    for kind, spec in ARCHIVE_KINDS.items():
+        table, date_column, columns = spec['table'], spec['date_column'], spec['columns']
+        json_positions = [columns.index(column) for column in spec['json_columns']]
+        moved[kind] = 0
+        while True:
+            conn.commit()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(f"SELECT {', '.join(columns)} FROM main.{table} WHERE {date_column} < ? ORDER BY {date_column} LIMIT ?",
+                                    (cutoff, ARCHIVE_TIER_BATCH)).fetchall()
+                cold_rows = []
+                for row in rows:
+                    values = list(row)
+                    raw_bytes = 0
+                    for position in json_positions:
+                        raw = (values[position] or 'null').encode('utf-8')
+                        raw_bytes += len(raw)
+                        values[position] = zlib.compress(raw, 9)
+                    cold_rows.append(values + [raw_bytes])
+                conn.executemany(f"INSERT OR REPLACE INTO cold.{table} ({', '.join(columns)}, raw_bytes) VALUES ({', '.join('?' for _ in range(len(columns) + 1))})",
+                                 cold_rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            if not rows: break
+            # A report replaced since the copy has a new id and stays in hot
+            ids = [row[0] for row in rows]
+            conn.execute(f"DELETE FROM main.{table} WHERE id IN ({', '.join('?' for _ in ids)})", ids)
+            conn.commit()
+            moved[kind] += len(rows)
+    if any(moved.values()):
+        reclaimed = reclaim_free_pages(conn)
+        print(f"ย้ายรายงานที่เก็บถาวรไปยังที่เก็บข้อมูลเย็น: {moved}, คืนพื้นที่ {reclaimed} ไบต์")
+    return moved
+
+def reclaim_free_pages(conn):
+    """
+    Hands the pages freed in database.db back to the filesystem (auto_vacuum is
+    INCREMENTAL, see enable_incremental_vacuum) and checkpoints the WAL so the file
+    itself shrinks. Returns the bytes released.
+    """
+    page_size = conn.execute("PRAGMA main.page_size").fetchone()[0]
+    free_pages = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+    # executescript steps the pragma to completion; execute() frees a single page
+    conn.commit()
+    conn.executescript("PRAGMA main.incremental_vacuum;")
+    conn.execute("PRAGMA main.wal_checkpoint(PASSIVE)").fetchall()
+    return (free_pages - conn.execute("PRAGMA main.freelist_count").fetchone()[0]) * page_size
+
+def enable_incremental_vacuum(conn):
+    """
+    Switches database.db to auto_vacuum=INCREMENTAL so reclaim_free_pages can shrink it.
+    An existing file only changes mode through one full VACUUM, which runs here once.
+    Call before sync_search_index: VACUUM may renumber rowids.
+    """
+    if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] == 2: return
+    print("กำลังเปิดใช้ auto_vacuum แบบ INCREMENTAL (VACUUM ครั้งเดียว)...")
+    conn.commit()
+    conn.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM main")
+
+def _read_latency(conn, schema, spec):
+    """Times id lookups plus decoding of up to ARCHIVE_TIER_SAMPLE reports in one tier."""
+    ids = [row[0] for row in conn.execute(f"SELECT id FROM {schema}.{spec['table']} ORDER BY random() LIMIT ?", (ARCHIVE_TIER_SAMPLE,))]
+    timings = []
+    for report_id in ids:
+        start = time.perf_counter()
+        row = conn.execute(f"SELECT {', '.join(spec['json_columns'])} FROM {schema}.{spec['table']} WHERE id = ?", (report_id,)).fetchone()
+        for value in row: decode_archive_json(value)
+        timings.append((time.perf_counter() - start) * 1000)
+    if not timings: return {"samples": 0, "mean_ms": None, "p95_ms": None}
+    timings.sort()
+    return {"samples": len(timings), "mean_ms": round(sum(timings) / len(timings), 3),
+            "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3)}
+
+REPORT_ITEM_TEXT_COLUMNS = ('report_id', 'report_table', 'category', 'personnel_id', 'personnel_name', 'department',
+                            'report_date', 'status', 'details', 'start_date', 'end_date')
+
+def archive_tier_report(conn):
+    """
+    Counts, sizes and sampled read latency of both archive tiers. Moved reports keep
+    their normalized rows in main.report_items (queries and exports read them there);
+    "items_in_main" sizes that uncompressed copy, which moving does not save.
+    """
+    report = {"cold_after_days": ARCHIVE_COLD_AFTER_DAYS, "kinds": {}}
+    item_bytes = ' + '.join(f"COALESCE(length(CAST(ri.{column} AS BLOB)), 0)" for column in REPORT_ITEM_TEXT_COLUMNS)
+    for kind, spec in ARCHIVE_KINDS.items():
+        stored = ' + '.join(f"COALESCE(length(CAST({column} AS BLOB)), 0)" for column in spec['json_columns'])
+        hot = conn.execute(f"SELECT COUNT(*), COALESCE(SUM({stored}), 0), MIN({spec['date_column']}) FROM main.{spec['table']}").fetchone()
+        cold = conn.execute(f"SELECT COUNT(*), COALESCE(SUM({stored}), 0), COALESCE(SUM(raw_bytes), 0), MIN({spec['date_column']}), MAX({spec['date_column']}) FROM cold.{spec['table']}").fetchone()
+        items = conn.execute(f"SELECT COUNT(*), COALESCE(SUM({item_bytes}), 0) FROM main.report_items ri "
+                             f"WHERE ri.report_table = ? AND ri.report_id IN (SELECT id FROM cold.{spec['table']})", (spec['table'],)).fetchone()
+        report["kinds"][kind] = {
+            "hot": {"reports": hot[0], "stored_bytes": hot[1], "oldest": hot[2], "read_latency": _read_latency(conn, 'main', spec)},
+            "cold": {"reports": cold[0], "raw_bytes": cold[2], "stored_bytes": cold[1], "saved_bytes": cold[2] - cold[1],
+                     "compression_ratio": round(cold[2] / cold[1], 2) if cold[1] else None,
+                     "oldest": cold[3], "newest": cold[4], "read_latency": _read_latency(conn, 'cold', spec),
+                     "items_in_main": {"rows": items[0], "bytes": items[1]}},
+        }
+    files = {}
+    for _, schema, path in conn.execute("PRAGMA database_list").fetchall():
+        if schema not in ('main', 'cold') or not path: continue
+        page_size = conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+        free_pages = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+        files[schema] = {"path": path, "bytes": os.path.getsize(path), "free_bytes": page_size * free_pages}
+    report["files"] = files
+    return report
+
+# --- Streaming JSON ---
+class JSONObjectStream:
+    """Wraps an iterator of (key, value) pairs that should be streamed as a JSON object."""
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+def is_stream(value):
+    return isinstance(value, (JSONObjectStream, Iterator))
+
+def iter_json(value):
+    """
+    Yields the JSON text of `value` piece by piece. Iterators are consumed lazily as
+    arrays and JSONObjectStream as objects, so a handler can stream cursor rows
+    instead of building the whole response in memory first.
+    """
+    if isinstance(value, JSONObjectStream) or (isinstance(value, dict) and any(is_stream(v) for v in value.values())):
+        pairs = value.pairs if isinstance(value, JSONObjectStream) else value.items()
+        yield '{'
+        for i, (key, item) in enumerate(pairs):
+            yield (', ' if i else '') + json.dumps(str(key)) + ': '
+            yield from iter_json(item)
+        yield '}'
+    elif isinstance(value, Iterator):
+        yield '['
+        for i, item in enumerate(value):
+            if i: yield ', '
+            yield from iter_json(item)
+        yield ']'
+    else:
+        yield json.dumps(value)
+
+def materialize_json(value):
+    """Consumes any streams inside `value` into plain lists and dicts, e.g. before the cursor they read from is reused."""
+    if isinstance(value, JSONObjectStream):
+        return {str(key): materialize_json(item) for key, item in value.pairs}
+    if isinstance(value, Iterator):
+        return [materialize_json(item) for item in value]
+    if isinstance(value, dict) and any(is_stream(v) for v in value.values()):
+        return {key: materialize_json(item) for key, item in value.items()}
+    return value
+
+def group_by_year_month(rows, key_func, row_func):
+    """
+    Streams rows that are already sorted newest first as {year: {month: [rows]}}.
+    Only one month of rows is held in memory at a time.
+    """
+    for year, year_rows in groupby(rows, key=lambda row: key_func(row)[0]):
+        months = ((month, [row_func(row) for row in month_rows]) for month, month_rows in groupby(year_rows, key=lambda row: key_func(row)[1]))
+        yield year, JSONObjectStream(months)
+
+# --- Compression ---
+def choose_encoding(accept_encoding):
+    """Picks "br" or "gzip" from an Accept-Encoding header using its q-values; None means identity."""
+    if not accept_encoding: return None
+    preferences = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        preferences[name.strip().lower()] = quality
+    supported = ['br', 'gzip'] if brotli else ['gzip']
+    ranked = [(preferences.get(enc, preferences.get('*', 0.0)), enc) for enc in supported]
+    ranked = [item for item in ranked if item[0] > 0]
+    if not ranked: return None
+    return max(ranked, key=lambda item: item[0])[1] # max() keeps the first on ties, so "br" wins
+
+def compress_body(body, encoding, static=False):
+    if encoding == 'br':
+        return brotli.compress(body, quality=STATIC_BROTLI_QUALITY if static else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=STATIC_COMPRESSION_LEVEL if static else COMPRESSION_LEVEL, mtime=0)
+
+class StreamCompressor:
+    """Incremental compressor for streamed responses, with the same interface for gzip and brotli."""
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.compress, self.finish = self._compressor.process, self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 31) # 31 = gzip container
+            self.compress, self.finish = self._compressor.compress, self._compressor.flush
+
+class ChunkedBodyWriter:
+    """
+    File-like sink for a response body of unknown length. Data is buffered into
+    STREAM_CHUNK_SIZE pieces, optionally compressed, and written as HTTP/1.1 chunks
+    (or as-is for HTTP/1.0 clients, where closing the connection ends the body).
+    """
+    def __init__(self, wfile, chunked, encoding=None):
+        self.wfile = wfile
+        self.chunked = chunked
+        self.encoding = encoding
+        self._compressor = StreamCompressor(encoding) if encoding else None
+        self._buffer = []
+        self._buffered = 0
+        self._totals = {"in": 0, "out": 0, "cpu": 0.0}
+
+    def write(self, data):
+        if isinstance(data, str): data = data.encode('utf-8')
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= STREAM_CHUNK_SIZE:
+            self._emit(b''.join(self._buffer))
+            self._buffer, self._buffered = [], 0
+        return len(data)
+
+    def flush(self):
+        pass # Chunks are sized by STREAM_CHUNK_SIZE, not by the caller's flushes
+
+    def _emit(self, payload, final=False):
+        self._totals["in"] += len(payload)
+        if self._compressor:
+            started = time.thread_time()
+            payload = self._compressor.compress(payload) + (self._compressor.finish() if final else b"")
+            self._totals["cpu"] += time.thread_time() - started
+        self._totals["out"] += len(payload)
+        if not payload: return # An empty chunk would end a chunked body early
+        if self.chunked:
+            self.wfile.write(f"{len(payload):X}\r\n".encode('ascii') + payload + b"\r\n")
+        else:
+            self.wfile.write(payload)
+
+    def close(self):
+        self._emit(b''.join(self._buffer), final=True)
+        self._buffer, self._buffered = [], 0
+        if self.chunked:
+            self.wfile.write(b"0\r\n\r\n")
+        profile = REQUEST_METRICS.current()
+        if profile: profile.response_bytes += self._totals["out"]
+        if self._compressor:
+            COMPRESSION_STATS.record(self.encoding, self._totals["in"], self._totals["out"], self._totals["cpu"])
+
+class CompressionStats:
+    """Running totals of bytes in/out and CPU time spent compressing, per encoding."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def record(self, encoding, bytes_in, bytes_out, cpu_seconds):
+        with self._lock:
+            totals = self._totals.setdefault(encoding, {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0})
+            totals["responses"] += 1
+            totals["bytes_in"] += bytes_in
+            totals["bytes_out"] += bytes_out
+            totals["cpu_seconds"] += cpu_seconds
+
+    def snapshot(self):
+        with self._lock:
+            stats = {enc: dict(totals) for enc, totals in self._totals.items()}
+        for totals in stats.values():
+            totals["ratio"] = totals["bytes_out"] / totals["bytes_in"] if totals["bytes_in"] else 1.0
+        return stats
+
+COMPRESSION_STATS = CompressionStats()
+
+class ConnectionStats:
+    """Counts HTTP connections, the requests they carried and why persistent ones were closed."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections = self.requests = self.reused_requests = 0
+        self.closes = Counter()
+
+    def opened(self):
+        with self._lock: self.connections += 1
+
+    def request(self, reused):
+        with self._lock:
+            self.requests += 1
+            if reused: self.reused_requests += 1
+
+    def closed(self, reason):
+        with self._lock: self.closes[reason] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"connections": self.connections, "requests": self.requests, "reused_requests": self.reused_requests,
+                    "requests_per_connection": round(self.requests / self.connections, 2) if self.connections else 0.0,
+                    "closes": dict(self.closes)}
+
+CONNECTION_STATS = ConnectionStats()
+
+# --- Static File Cache ---
+class StaticFileCache:
+    """
+    Keeps the site's HTML/JS/CSS files in memory together with their validators
+    (strong ETag, Last-Modified) and compressed variants. A file is re-read only
+    when its mtime changes.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, filepath):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            with self._lock: self._entries.pop(filepath, None)
+            return None
+        with self._lock:
+            entry = self._entries.get(filepath)
+        if entry and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry
+        with open(filepath, 'rb') as f:
+            body = f.read()
+        entry = make_static_entry(body, STATIC_MIMETYPES.get(os.path.splitext(filepath)[1], 'application/octet-stream'), stat.st_mtime)
+        entry['mtime_ns'] = stat.st_mtime_ns
+        with self._lock: self._entries[filepath] = entry
+        return entry
+
+    def encoded(self, entry, encoding):
+        """Returns the entry's body compressed with `encoding`, compressing each file version only once."""
+        compressed = entry['encoded'].get(encoding)
+        if compressed is None:
+            started = time.thread_time()
+            compressed = compress_body(entry['body'], encoding, static=True)
+            COMPRESSION_STATS.record(encoding, len(entry['body']), len(compressed), time.thread_time() - started)
+            entry['encoded'][encoding] = compressed
+        return compressed
+
+    def stats(self):
+        with self._lock:
+            entries = list(self._entries.values())
+        return {"entries": len(entries), "bytes": sum(len(entry['body']) + sum(map(len, entry['encoded'].values())) for entry in entries)}
+
+    def precompress(self, entry):
+        if entry['mimetype'] in COMPRESSIBLE_MIMETYPES and len(entry['body']) >= COMPRESSION_MIN_SIZE:
+            for encoding in (['br', 'gzip'] if brotli else ['gzip']):
+                self.encoded(entry, encoding)
+
+    def warm(self, filepaths):
+        for filepath in filepaths:
+            entry = self.get(filepath)
+            if entry: self.precompress(entry)
+
+STATIC_FILE_CACHE = StaticFileCache()
+
+def make_static_entry(body, mimetype, mtime):
+    """A static response body with its validators, in the form _serve_static_file expects."""
+    return {
+        'mtime': int(mtime),
+        'body': body,
+        'etag': '"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+        'last_modified': formatdate(mtime, usegmt=True),
+        'mimetype': mimetype,
+        'encoded': {},
+    }
+
+def static_files_to_warm():
+    """The pages in STATIC_PATH_MAP plus every script and stylesheet next to them."""
+    filepaths = {path.lstrip('/') for path in STATIC_PATH_MAP.values()}
+    filepaths.update(name for name in os.listdir('.') if os.path.splitext(name)[1] in STATIC_MIMETYPES)
+    return sorted(filepaths)
+
+# --- Asset Bundling ---
+# Keywords after which a "/" starts a regular expression rather than a division
+JS_REGEX_KEYWORDS = frozenset(['return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw', 'case', 'do', 'else', 'yield', 'await'])
+JS_IMPORT_RE = re.compile(r"""^import\s+(?:([\w$*\s{},]+?)\s+from\s+)?['"](\./[\w./-]+)['"];?[ \t]*$""", re.M)
+JS_EXPORT_RE = re.compile(r'^export\s+((?:async\s+)?function\*?\s+|const\s+|class\s+)([\w$]+)', re.M)
+HTML_SCRIPT_RE = re.compile(r'(<script\b[^>]*\bsrc=")([^":/]+\.js)("[^>]*>)')
+
+def _is_identifier_char(char):
+    return char.isalnum() or char in '_$' or ord(char) > 127
+
+def minify_js(source):
+    """
+    Conservative minifier: drops comments and collapses whitespace outside strings,
+    template literals and regular expressions. Line breaks are kept, so automatic
+    semicolon insertion behaves exactly as in the source.
+    """
+    out, i, n = [], 0, len(source)
+    prev = '' # Last token written, to tell a regular expression from a division
+    template_braces = [] # Open "{" inside each enclosing template literal's ${...}
+    space = ''
+
+    def skip_quoted(j, quote):
+        j += 1
+        while j < n:
+            if source[j] == '\\': j += 2; continue
+            if source[j] == quote: return j + 1
+            if source[j] == '\n': break
+            j += 1
+        raise ValueError("Unterminated string literal")
+
+    def skip_template(j):
+        """Scans template text from j; returns the index after "`" or "${" and whether an expression opened."""
+        while j < n:
+            if source[j] == '\\': j += 2; continue
+            if source[j] == '`': return j + 1, False
+            if source.startswith('${', j): return j + 2, True
+            j += 1
+        raise ValueError("Unterminated template literal")
+
+    def skip_regex(j):
+        j, in_class = j + 1, False
+        while j < n and source[j] != '\n':
+            char = source[j]
+            if char == '\\': j += 2; continue
+            if char == '[': in_class = True
+            elif char == ']': in_class = False
+            elif char == '/' and not in_class:
+                j += 1
+                while j < n and _is_identifier_char(source[j]): j += 1
+                return j
+            j += 1
+        raise ValueError("Unterminated regular expression")
+
+    while i < n:
+        char = source[i]
+        if char in ' \t\r\n':
+            j = i
+            while j < n and source[j] in ' \t\r\n': j += 1
+            space = '\n' if '\n' in source[i:j] or space == '\n' else ' '
+            i = j
+            continue
+        if source.startswith('//', i):
+            j = source.find('\n', i)
+            i = n if j < 0 else j
+            continue
+        if source.startswith('/*', i):
+            j = source.find('*/', i + 2)
+            if j < 0: raise ValueError("Unterminated comment")
+            space = '\n' if '\n' in source[i:j] or space == '\n' else ' '
+            i = j + 2
+            continue
+
+        if space and out: out.append(space)
+        space = ''
+        if char in '"\'':
+            j, prev = skip_quoted(i, char), '"'
+        elif char == '`' or (char == '}' and template_braces and template_braces[-1] == 0):
+            if char == '}': template_braces.pop()
+            j, opened = skip_template(i + 1)
+            if opened: template_braces.append(0)
+            prev = '{' if opened else '"'
+        elif char == '/' and (not prev or prev in JS_REGEX_KEYWORDS or not (_is_identifier_char(prev[-1]) or prev in ')]}"')):
+            j, prev = skip_regex(i), '"'
+        elif _is_identifier_char(char):
+            j = i + 1
+            while j < n and _is_identifier_char(source[j]): j += 1
+            prev = source[i:j]
+        else:
+            if template_braces and char in '{}':
+                template_braces[-1] += 1 if char == '{' else -1
+            j, prev = i + 1, char
+        out.append(source[i:j])
+        i = j
+    return ''.join(out) + '\n'
+
+def _import_bindings(clause, module_ref):
+    """Turns an import clause (`* as ns` or `{ a, b as c }`) into a const declaration reading module_ref."""
+    clause = ' '.join(clause.split())
+    if clause.startswith('* as '):
+        return f"const {clause[5:]} = {module_ref};"
+    if clause.startswith('{') and clause.endswith('}'):
+        names = [name.strip() for name in clause[1:-1].split(',') if name.strip()]
+        return "const { " + ", ".join(name.replace(' as ', ': ') for name in names) + " } = " + module_ref + ";"
+    raise ValueError(f"Unsupported import clause: {clause}")
+
+def bundle_es_modules(entry_path):
+    """
+    Concatenates an ES module and everything it imports into one script. Each module
+    runs in its own function scope, in dependency order, and hands its exports to its
+    importers through a shared table. Returns (source, files included).
+    """
+    modules, visiting = {}, set()
+
+    def visit(path):
+        if path in modules: return
+        if path in visiting: raise ValueError(f"Circular import of {path}")
+        visiting.add(path)
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+        def replace_import(match):
+            dependency = os.path.normpath(os.path.join(os.path.dirname(path), match.group(2)))
+            visit(dependency)
+            return _import_bindings(match.group(1), f"__modules[{json.dumps(dependency)}]") if match.group(1) else ''
+        source = JS_IMPORT_RE.sub(replace_import, source)
+        exports = []
+        def replace_export(match):
+            exports.append(match.group(2))
+            return match.group(1) + match.group(2)
+        source = JS_EXPORT_RE.sub(replace_export, source)
+        if re.search(r'^\s*(import|export)\b', source, re.M):
+            raise ValueError(f"Unsupported import/export syntax in {path}")
+        visiting.discard(path)
+        modules[path] = (source, exports) # Insertion order is dependency order
+
+    visit(os.path.normpath(entry_path))
+    parts = ["const __modules = {};"]
+    for path, (source, exports) in modules.items():
+        parts.append(f"__modules[{json.dumps(path)}] = (() => {{\n{source}\nreturn {{ {', '.join(exports)} }};\n}})();")
+    return "\n".join(parts), list(modules)
+
+class AssetBundler:
+    """
+    Serves each page with its local scripts replaced by minified bundles under
+    content-hashed /assets/ URLs (an ES module is bundled together with its imports).
+    A page is rebuilt when it or any file in its bundles changes; earlier bundles stay
+    available for pages that are still open.
+    """
+    def __init__(self):
+        self._pages = {} # html path -> (files, mtimes, entry or None)
+        self._assets = {} # url path -> entry
+        self._lock = threading.Lock()
+
+    def page(self, filepath):
+        """The page's entry with rewritten script tags, or None when it has no local scripts or bundling failed."""
+        with self._lock:
+            cached = self._pages.get(filepath)
+        if cached:
+            try:
+                if [os.stat(path).st_mtime_ns for path in cached[0]] == cached[1]:
+                    return cached[2]
+            except OSError:
+                pass
+        try:
+            files, entry = self._build_page(filepath)
+            mtimes = [os.stat(path).st_mtime_ns for path in files]
+        except (OSError, ValueError) as e:
+            print(f"Asset bundling skipped for {filepath}: {e}")
+            files, entry = [filepath], None
+            mtimes = [os.stat(filepath).st_mtime_ns] if os.path.exists(filepath) else [None]
+        with self._lock:
+            self._pages[filepath] = (files, mtimes, entry)
+        return entry
+
+    def _build_page(self, filepath):
+        with open(filepath, encoding='utf-8') as f:
+            html = f.read()
+        files = [filepath]
+        def replace_script(match):
+            script_path = os.path.normpath(os.path.join(os.path.dirname(filepath), match.group(2)))
+            if 'type="module"' in match.group(0):
+                source, included = bundle_es_modules(script_path)
+            else:
+                with open(script_path, encoding='utf-8') as f:
+                    source, included = f.read(), [script_path]
+            files.extend(included)
+            url = self._add_asset(os.path.splitext(os.path.basename(script_path))[0], minify_js(source))
+            return match.group(1) + url + match.group(3)
+        html = HTML_SCRIPT_RE.sub(replace_script, html)
+        if len(files) == 1:
+            return files, None
+        entry = make_static_entry(html.encode('utf-8'), 'text/html', max(os.stat(path).st_mtime for path in files))
+        STATIC_FILE_CACHE.precompress(entry)
+        return files, entry
+
+    def _add_asset(self, name, source):
+        body = source.encode('utf-8')
+        url = f"{ASSET_URL_PREFIX}{name}.{hashlib.sha256(body).hexdigest()[:12]}.js"
+        with self._lock:
+            if url in self._assets: return url
+        entry = make_static_entry(body, 'application/javascript', time.time())
+        entry['cache_control'] = ASSET_CACHE_CONTROL
+        STATIC_FILE_CACHE.precompress(entry)
+        with self._lock:
+            self._assets.setdefault(url, entry)
+        return url
+
+    def asset(self, url_path):
+        with self._lock:
+            return self._assets.get(url_path)
+
+    def build(self, filepaths):
+        """Bundles every page up front so the first visitors do not pay for it."""
+        for filepath in filepaths:
+            if filepath.endswith('.html'):
+                self.page(filepath)
+
+    def stats(self):
+        with self._lock:
+            pages = sum(1 for cached in self._pages.values() if cached[2])
+            assets = list(self._assets.values())
+        return {"pages": pages, "bundles": len(assets), "bundle_bytes": sum(len(entry['body']) for entry in assets)}
+
+ASSET_BUNDLER = AssetBundler()
+
+# --- Response Cache ---
+class ResponseCache:
+    """
+    LRU cache of read-only action responses. Every entry remembers the generation of
+    the tables it was computed from; write actions bump those generations, so a stale
+    entry is dropped on its next lookup instead of being served. Writes made outside
+    this process (e.g. clear_history.py) are not seen until the server restarts.
+    A cache built with generations_from follows that cache's table generations, so
+    bumping the other cache invalidates its entries too.
+    """
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, max_entry_bytes=RESPONSE_CACHE_MAX_ENTRY_BYTES, max_entries=None, generations_from=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.max_entries = max_entries
+        self._generations_from = generations_from
+        self._entries = OrderedDict() # key -> (generations, response, size)
+        self._generations = defaultdict(int)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = self.evictions = self.invalidations = 0
+
+    def generations(self, tables):
+        """Snapshot of the tables' generations; take it before running the handler whose result is stored."""
+        if self._generations_from is not None: return self._generations_from.generations(tables)
+        with self._lock:
+            return tuple(self._generations[table] for table in tables)
+
+    def get(self, key, tables):
+        current = self.generations(tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != current:
+                self._remove(key)
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, generations, response):
+        size = len(json.dumps(response))
+        if size > self.max_entry_bytes: return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (generations, response, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes or (self.max_entries is not None and len(self._entries) > self.max_entries):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def bump(self, tables):
+        """Marks every entry computed from any of `tables` as stale."""
+        with self._lock:
+            for table in tables:
+                self._generations[table] += 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry: self._bytes -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "stale": self.stale, "evictions": self.evictions,
+                    "invalidations": self.invalidations, "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+RESPONSE_CACHE = ResponseCache()
+# Row counts behind paged lists; kept apart so they neither evict responses nor skew the response cache stats
+LIST_TOTAL_CACHE = ResponseCache(max_entries=LIST_TOTAL_CACHE_MAX_ENTRIES, generations_from=RESPONSE_CACHE)
+# Tables behind the admin summaries; the daily ones also depend on the working-day calendar
+WEEKLY_SUMMARY_TABLES = ("personnel", "status_reports", "status_report_counts", "users")
+DAILY_SUMMARY_TABLES = ("personnel", "daily_reports", "archived_daily_reports", "holidays", "users")
+
+# --- Server-Sent Events ---
+class EventBroadcaster:
+    """
+    Pushes small JSON events to every connected /events client from a single thread.
+    Subscribed sockets are detached from their HTTP worker, so open dashboards do not
+    tie up the worker pool; a periodic keep-alive comment weeds out dead connections.
+    Sockets are non-blocking: what a client's socket cannot take yet waits in its own
+    buffer, and a client that falls more than buffer_limit bytes behind is dropped, so
+    one stalled dashboard never delays the others.
+    """
+    def __init__(self, max_clients=SSE_MAX_CLIENTS, heartbeat=SSE_HEARTBEAT_SECONDS, buffer_limit=SSE_CLIENT_BUFFER_BYTES):
+        self.max_clients = max_clients
+        self.heartbeat = heartbeat
+        self.buffer_limit = buffer_limit
+        self._clients = {} # socket -> bytearray of bytes the socket has not accepted yet
+        self._messages = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._next_id = 0
+        self.slow_drops = 0
+
+    def has_capacity(self):
+        with self._lock: return len(self._clients) < self.max_clients
+
+    def has_subscribers(self):
+        return bool(self._clients)
+
+    def subscribe(self, sock):
+        with self._lock:
+            if len(self._clients) >= self.max_clients: return False
+            sock.setblocking(False)
+            self._clients[sock] = bytearray()
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, name="sse-broadcaster", daemon=True)
+                self._thread.start()
+        return True
+
+    def publish(self, event, data):
+        """Queues `data` for every subscriber; returns immediately and is a no-op without subscribers."""
+        if not self._clients: return
+        with self._lock:
+            self._next_id += 1
+            event_id = self._next_id
+        self._messages.put(f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8'))
+
+    def _run(self):
+        last_sent = time.monotonic()
+        while True:
+            with self._lock: backlog = any(self._clients.values())
+            wait = SSE_FLUSH_INTERVAL if backlog else max(0, self.heartbeat - (time.monotonic() - last_sent))
+            try:
+                message = self._messages.get(timeout=wait)
+            except queue.Empty:
+                message = b": keep-alive\n\n" if time.monotonic() - last_sent >= self.heartbeat else b""
+            if message is None: break
+            if message: last_sent = time.monotonic()
+            with self._lock: clients = list(self._clients.items())
+            for sock, pending in clients:
+                pending += message
+                if len(pending) > self.buffer_limit:
+                    self.slow_drops += 1
+                    self._drop(sock)
+                    continue
+                if not pending: continue
+                try:
+                    del pending[:sock.send(pending)]
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    self._drop(sock)
+
+    def _drop(self, sock):
+        with self._lock: self._clients.pop(sock, None)
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+    def stats(self):
+        with self._lock:
+            return {"clients": len(self._clients), "buffered_bytes": sum(len(pending) for pending in self._clients.values()),
+                    "slow_drops": self.slow_drops}
+
+    def close(self):
+        if self._thread:
+            self._messages.put(None)
+            self._thread.join(SHUTDOWN_GRACE_SECONDS)
+        for sock in list(self._clients):
+            self._drop(sock)
+
+EVENT_BROADCASTER = EventBroadcaster()
+
 # --- Security Functions ---
 def hash_password(password, salt=None):
     if salt is None: salt = os.urandom(16)
     key = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 100000)
     return salt, key
 
+class HashQueueFullError(Exception):
+    """Raised when HASH_QUEUE_LIMIT hashing jobs are already waiting for the hash pool."""
+
+class PasswordHasher:
+    """
+    Runs hash_password in a dedicated process pool so PBKDF2 never ties up a request
+    thread. run() calls start() when the server starts; until then (as in the
+    maintenance scripts) hashing simply runs inline.
+    """
+    def __init__(self, workers=HASH_WORKERS, queue_limit=HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _new_pool(self):
+        # "spawn" keeps the children free of the parent's threads and open SQLite handles
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def start(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._new_pool()
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _replace_broken(self, broken):
+        """Swaps in a new pool unless another thread already replaced `broken`."""
+        with self._lock:
+            if self._pool is not broken: return False
+            self._pool = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+        return True
+
+    def hash(self, password, salt=None):
+        if salt is None: salt = os.urandom(16)
+        pool = self._pool
+        if pool is None:
+            return hash_password(password, salt)
+        if not self._slots.acquire(blocking=False):
+            raise HashQueueFullError("password hashing queue is full")
+        try:
+            return pool.submit(hash_password, password, salt).result()
+        except BrokenProcessPool:
+            # A worker died; replace the pool for later calls and finish this one inline
+            if self._replace_broken(pool):
+                print("Password hash pool broke; restarting it")
+            return hash_password(password, salt)
+        finally:
+            self._slots.release()
+
+PASSWORD_HASHER = PasswordHasher()
+
 def verify_password(salt, key, password_to_check):
-    return hmac.compare_digest(key, hash_password(password_to_check, salt)[1])
+    return hmac.compare_digest(key, PASSWORD_HASHER.hash(password_to_check, salt)[1])
 
 def is_password_complex(password):
     if len(password) < 8: return False
@@ -202,13 +1877,9 @@ def classify_personnel(personnel_list):
         'civilian': []
     }
     for p in personnel_list:
-        person_rank = p.get('rank')
-        if person_rank in RANK_CLASSIFICATION['officer']:
-            classified['officer'].append(p)
-        elif person_rank in RANK_CLASSIFICATION['nco']:
-            classified['nco'].append(p)
-        elif person_rank in RANK_CLASSIFICATION['civilian']:
-            classified['civilian'].append(p)
+        category = RANK_CATEGORY.get(p.get('rank'))
+        if category:
+            classified[category].append(p)
     return classified
 # --- END: NEW HELPER FUNCTION ---
 
@@ -216,21 +1887,17 @@ def classify_personnel(personnel_list):
 # --- Action Handlers ---
 def handle_login(payload, conn, cursor, client_address):
     ip_address = client_address[0]
-    if ip_address in FAILED_LOGIN_ATTEMPTS:
-        attempts, last_attempt_time = FAILED_LOGIN_ATTEMPTS[ip_address]
-        if attempts >= MAX_ATTEMPTS and time.time() - last_attempt_time < LOCKOUT_TIME:
-            return {"status": "error", "message": "คุณพยายามล็อกอินผิดพลาดบ่อยเกินไป กรุณาลองใหม่อีกครั้งใน 5 นาที"}, None
+    if LOGIN_LIMITER.is_locked(cursor, ip_address):
+        return {"status": "error", "message": "คุณพยายามล็อกอินผิดพลาดบ่อยเกินไป กรุณาลองใหม่อีกครั้งใน 5 นาที"}, None
     
     username, password = payload.get("username"), payload.get("password")
     cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
     user_data = cursor.fetchone()
     
     if user_data and verify_password(user_data['salt'], user_data['key'], password):
-        if ip_address in FAILED_LOGIN_ATTEMPTS: del FAILED_LOGIN_ATTEMPTS[ip_address]
+        LOGIN_LIMITER.reset(conn, ip_address)
         session_token = secrets.token_hex(16)
-        cursor.execute("INSERT INTO sessions (token, username, created_at) VALUES (?, ?, ?)",
-                       (session_token, user_data["username"], datetime.now()))
-        conn.commit()
+        SESSION_STORE.create(conn, session_token, user_data)
         user_info = {k: user_data[k] for k in user_data.keys() if k not in ['salt', 'key']}
         expires_time = time.time() + SESSION_TIMEOUT_SECONDS
         cookie_attrs = [
@@ -240,58 +1907,109 @@ def handle_login(payload, conn, cursor, client_address):
         headers = [('Set-Cookie', '; '.join(cookie_attrs))]
         return {"status": "success", "user": user_info}, headers
     else:
-        if ip_address in FAILED_LOGIN_ATTEMPTS: FAILED_LOGIN_ATTEMPTS[ip_address] = (FAILED_LOGIN_ATTEMPTS[ip_address][0] + 1, time.time())
-        else: FAILED_LOGIN_ATTEMPTS[ip_address] = (1, time.time())
+        LOGIN_LIMITER.record_failure(conn, ip_address)
         return {"status": "error", "message": "ชื่อผู้ใช้หรือรหัสผ่านไม่ถูกต้อง"}, None
 
 def handle_logout(payload, conn, cursor, session):
     token_to_delete = session.get("token")
     if token_to_delete:
-        cursor.execute("DELETE FROM sessions WHERE token = ?", (token_to_delete,))
-        conn.commit()
+        SESSION_STORE.delete(conn, token_to_delete)
     headers = [('Set-Cookie', 'session_token=; HttpOnly; Path=/; SameSite=Strict; Expires=Thu, 01 Jan 1970 00:00:00 GMT')]
     return {"status": "success", "message": "ออกจากระบบสำเร็จ"}, headers
 
 def handle_get_dashboard_summary(payload, conn, cursor):
     cursor.execute("SELECT DISTINCT department FROM personnel WHERE department IS NOT NULL AND department != ''")
     all_departments = [row['department'] for row in cursor.fetchall()]
-    query = "SELECT sr.department, sr.report_data, sr.timestamp, u.rank, u.first_name, u.last_name FROM status_reports sr JOIN users u ON sr.submitted_by = u.username WHERE sr.timestamp = (SELECT MAX(timestamp) FROM status_reports WHERE department = sr.department)"
+    cursor.execute("SELECT department, SUM(count) AS total FROM status_report_counts GROUP BY department")
+    status_counts = {row['department']: row['total'] for row in cursor.fetchall()}
+    # Submitting replaces a department's report, so ordering by timestamp leaves the latest one per department
+    query = "SELECT sr.department, sr.timestamp, u.rank, u.first_name, u.last_name FROM status_reports sr JOIN users u ON sr.submitted_by = u.username ORDER BY sr.timestamp"
     cursor.execute(query)
     submitted_info = {}
     for row in cursor.fetchall():
-        items = json.loads(row['report_data'])
         submitter_fullname = f"{row['rank']} {row['first_name']} {row['last_name']}"
-        submitted_info[row['department']] = {'submitter_fullname': submitter_fullname, 'timestamp': row['timestamp'], 'status_count': len(items)}
-    cursor.execute("SELECT report_data FROM status_reports")
-    status_summary = defaultdict(int)
-    for report in cursor.fetchall():
-        for item in json.loads(report['report_data']):
-            status_summary[item.get('status', 'ไม่ระบุ')] += 1
+        submitted_info[row['department']] = {'submitter_fullname': submitter_fullname, 'timestamp': row['timestamp'], 'status_count': status_counts.get(row['department'], 0)}
+    cursor.execute("SELECT status, SUM(count) AS total FROM status_report_counts GROUP BY status")
+    status_summary = {row['status']: row['total'] for row in cursor.fetchall()}
     cursor.execute("SELECT COUNT(id) as total FROM personnel")
     total_personnel = cursor.fetchone()['total']
     total_on_duty = total_personnel - sum(status_summary.values())
-    summary = {"all_departments": all_departments, "submitted_info": submitted_info, "status_summary": dict(status_summary), "total_personnel": total_personnel, "total_on_duty": total_on_duty, "weekly_date_range": get_next_week_range_str()}
+    summary = {"all_departments": all_departments, "submitted_info": submitted_info, "status_summary": status_summary, "total_personnel": total_personnel, "total_on_duty": total_on_duty, "weekly_date_range": get_next_week_range_str()}
     return {"status": "success", "summary": summary}
 
+# Stable list orders: rank seniority, then name, ending in the primary key so that every
+# row has a distinct sort key for keyset pagination. NULL names sort as empty strings.
+PERSONNEL_SORT_KEY = (f"COALESCE(r.ordinal, {UNKNOWN_RANK_ORDINAL})", "COALESCE(p.first_name, '')", "COALESCE(p.last_name, '')", "p.id")
+USERS_SORT_KEY = (f"COALESCE(r.ordinal, {UNKNOWN_RANK_ORDINAL})", "COALESCE(u.first_name, '')", "COALESCE(u.last_name, '')", "u.username")
+
+def fetch_list_page(cursor, columns, from_clause, conditions, params, sort_key, count_tables, limit=None, offset=0, after=None):
+    """
+    Returns (rows, total, next_key) for one page of a list ordered by sort_key. With
+    `after` (the sort key of the previous page's last row) the page is found by keyset;
+    otherwise by `offset`. A search relevance expression belongs at the front of sort_key,
+    so that numbered and keyset pages walk the same order. The total
+    per filter is kept in LIST_TOTAL_CACHE until one of count_tables is written; on a miss
+    the first page computes it in the same query with COUNT(*) OVER ().
+    """
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    count_key = ("list_total", from_clause + where, json.dumps(params, default=str))
+    total = LIST_TOTAL_CACHE.get(count_key, count_tables)
+    generations = LIST_TOTAL_CACHE.generations(count_tables)
+
+    page_conditions, page_params = list(conditions), list(params)
+    if after is not None:
+        page_conditions.append(f"({', '.join(sort_key)}) > ({', '.join('?' for _ in sort_key)})")
+        page_params.extend(after)
+    counted_here = total is None and after is None
+    query = (f"SELECT {columns}, " + ", ".join(f"{expr} AS sort_key_{i}" for i, expr in enumerate(sort_key))
+             + (", COUNT(*) OVER () AS total_count" if counted_here else "") + f" {from_clause}"
+             + (" WHERE " + " AND ".join(page_conditions) if page_conditions else "")
+             + " ORDER BY " + ", ".join(sort_key))
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        page_params.extend([limit + 1, offset]) # One extra row tells whether another page follows
+    cursor.execute(query, page_params)
+    rows = [dict(row) for row in cursor.fetchall()]
+
+    if total is None:
+        if counted_here and rows:
+            total = rows[0]['total_count']
+        else:
+            cursor.execute(f"SELECT COUNT(*) {from_clause}{where}", params)
+            total = cursor.fetchone()[0]
+        LIST_TOTAL_CACHE.put(count_key, generations, total)
+    has_more = limit is not None and len(rows) > limit
+    rows = rows[:limit] if limit is not None else rows
+    next_key = None
+    for row in rows:
+        row.pop('total_count', None)
+        next_key = [row.pop(f"sort_key_{i}") for i in range(len(sort_key))]
+    return rows, total, next_key if has_more else None
+
 def handle_list_users(payload, conn, cursor):
+    """
+    Lists users in rank order, page by page. Pass "page" for numbered pages, or "cursor"
+    (null for the first page, then the returned next_cursor) to page by keyset.
+    """
     page = payload.get("page", 1)
     search_term = payload.get("searchTerm", "").strip()
-    offset = (page - 1) * ITEMS_PER_PAGE
-    count_query = "SELECT COUNT(*) as total FROM users"
-    data_query = "SELECT username, rank, first_name, last_name, position, department, role FROM users"
-    params = []
-    where_clause = ""
+    from_clause = "FROM users u LEFT JOIN ranks r ON r.rank = u.rank"
+    conditions, params, relevance = [], [], None
     if search_term:
-        where_clause = " WHERE username LIKE ? OR first_name LIKE ? OR last_name LIKE ? OR department LIKE ?"
-        term = f"%{search_term}%"
-        params.extend([term, term, term, term])
-    cursor.execute(count_query + where_clause, params)
-    total_items = cursor.fetchone()['total']
-    data_query += where_clause + " LIMIT ? OFFSET ?"
-    params.extend([ITEMS_PER_PAGE, offset])
-    cursor.execute(data_query, params)
-    users = [{k: escape(str(v)) if v is not None else '' for k, v in dict(row).items()} for row in cursor.fetchall()]
-    return {"status": "success", "users": users, "total": total_items, "page": page}
+        join, condition, params, relevance = search_filter('users', 'u', search_term)
+        from_clause += join; conditions.append(condition)
+    sort_key = ((relevance,) if relevance else ()) + USERS_SORT_KEY
+    after = None
+    if payload.get("cursor"):
+        after = decode_cursor(payload["cursor"])
+        if not isinstance(after, list) or len(after) != len(sort_key):
+            return {"status": "error", "message": "cursor ไม่ถูกต้อง"}
+    offset = 0 if "cursor" in payload else (page - 1) * ITEMS_PER_PAGE
+    rows, total_items, next_key = fetch_list_page(
+        cursor, "u.username, u.rank, u.first_name, u.last_name, u.position, u.department, u.role", from_clause,
+        conditions, params, sort_key, ("users",), ITEMS_PER_PAGE, offset, after)
+    users = [{k: escape(str(v)) if v is not None else '' for k, v in row.items()} for row in rows]
+    return {"status": "success", "users": users, "total": total_items, "page": page, "next_cursor": encode_cursor(next_key) if next_key else None}
 
 def handle_add_user(payload, conn, cursor):
     data = payload.get("data", {}); username = data.get("username"); password = data.get("password")
@@ -299,7 +2017,7 @@ def handle_add_user(payload, conn, cursor):
     if not is_password_complex(password): return {"status": "error", "message": "รหัสผ่านต้องมีความยาวอย่างน้อย 8 ตัวอักษร และมีตัวพิมพ์เล็ก, พิมพ์ใหญ่, และตัวเลข"}
     cursor.execute("SELECT username FROM users WHERE username = ?", (username,))
     if cursor.fetchone(): return {"status": "error", "message": "Username นี้มีผู้ใช้อยู่แล้ว"}
-    salt, key = hash_password(password)
+    salt, key = PASSWORD_HASHER.hash(password)
     cursor.execute("INSERT INTO users (username, salt, key, rank, first_name, last_name, position, department, role) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
                    (username, salt, key, data.get('rank', ''), data.get('first_name', ''), data.get('last_name', ''), data.get('position', ''), data.get('department', ''), data.get('role', 'user')))
     conn.commit()
@@ -309,59 +2027,60 @@ def handle_update_user(payload, conn, cursor):
     data = payload.get("data", {}); username = data.get("username"); password = data.get("password")
     if password:
         if not is_password_complex(password): return {"status": "error", "message": "รหัสผ่านต้องมีความยาวอย่างน้อย 8 ตัวอักษร และมีตัวพิมพ์เล็ก, พิมพ์ใหญ่, และตัวเลข"}
-        salt, key = hash_password(password)
+        salt, key = PASSWORD_HASHER.hash(password)
         cursor.execute("UPDATE users SET rank=?, first_name=?, last_name=?, position=?, department=?, role=?, salt=?, key=? WHERE username=?",
                        (data.get('rank'), data.get('first_name'), data.get('last_name'), data.get('position', ''), data.get('department', ''), data.get('role', ''), salt, key, username))
     else:
         cursor.execute("UPDATE users SET rank=?, first_name=?, last_name=?, position=?, department=?, role=? WHERE username=?",
                        (data.get('rank'), data.get('first_name'), data.get('last_name', ''), data.get('position', ''), data.get('department', ''), data.get('role', ''), username))
     conn.commit()
+    SESSION_STORE.invalidate_user(username)
     return {"status": "success", "message": f"อัปเดตข้อมูล '{escape(username)}' สำเร็จ"}
 
 def handle_delete_user(payload, conn, cursor):
     username = payload.get("username")
     if username == 'jeerawut': return {"status": "error", "message": "ไม่สามารถลบบัญชีผู้ดูแลระบบหลักได้"}
     cursor.execute("DELETE FROM users WHERE username = ?", (username,))
+    cursor.execute("DELETE FROM sessions WHERE username = ?", (username,))
     conn.commit()
+    SESSION_STORE.invalidate_user(username)
     return {"status": "success", "message": f"ลบผู้ใช้ '{escape(username)}' สำเร็จ"}
 
 def handle_list_personnel(payload, conn, cursor, session):
+    """
+    Lists personnel in rank order. Pass "page" for numbered pages, or "cursor" (null for
+    the first page, then the returned next_cursor) to page by keyset; fetchAll returns
+    every officer for the weekly submission form.
+    """
     page = payload.get("page", 1)
     search_term = payload.get("searchTerm", "").strip()
     fetch_all = payload.get("fetchAll", False)
-    offset = (page - 1) * ITEMS_PER_PAGE
-    base_query = " FROM personnel"
-    params, where_clauses = [], []
+    from_clause = "FROM personnel p LEFT JOIN ranks r ON r.rank = p.rank"
+    params, where_clauses, relevance = [], [], None
     is_admin, department = session.get("role") == "admin", session.get("department")
     
     if not is_admin:
-        where_clauses.append("department = ?"); params.append(department)
+        where_clauses.append("p.department = ?"); params.append(department)
 
     if search_term:
-        where_clauses.append("(first_name LIKE ? OR last_name LIKE ? OR position LIKE ?)")
-        params.extend([f"%{search_term}%"] * 3)
+        join, condition, search_params, relevance = search_filter('personnel', 'p', search_term)
+        from_clause += join
+        where_clauses.append(condition); params.extend(search_params)
         
     # แก้ไข: กรองให้แสดงเฉพาะนายทหารสัญญาบัตรในหน้าส่งยอดประจำสัปดาห์
     if fetch_all:
-        officer_ranks = RANK_CLASSIFICATION['officer']
-        placeholders = ', '.join('?' for _ in officer_ranks)
-        where_clauses.append(f"rank IN ({placeholders})")
-        params.extend(officer_ranks)
-
-    where_clause_str = ""
-    if where_clauses: where_clause_str = " WHERE " + " AND ".join(where_clauses)
-    
-    count_query = "SELECT COUNT(*) as total" + base_query + where_clause_str
-    cursor.execute(count_query, params)
-    total_items = cursor.fetchone()['total']
-    
-    data_query = "SELECT *" + base_query + where_clause_str
-    if not fetch_all:
-        data_query += " LIMIT ? OFFSET ?"
-        params.extend([ITEMS_PER_PAGE, offset])
-    
-    cursor.execute(data_query, params)
-    personnel = [{k: escape(str(v)) if v is not None else '' for k, v in dict(row).items()} for row in cursor.fetchall()]
+        where_clauses.append("r.category = 'officer'")
+
+    sort_key = ((relevance,) if relevance else ()) + PERSONNEL_SORT_KEY
+    after = None
+    if payload.get("cursor"):
+        after = decode_cursor(payload["cursor"])
+        if not isinstance(after, list) or len(after) != len(sort_key):
+            return {"status": "error", "message": "cursor ไม่ถูกต้อง"}
+    offset = 0 if "cursor" in payload else (page - 1) * ITEMS_PER_PAGE
+    rows, total_items, next_key = fetch_list_page(cursor, "p.*", from_clause, where_clauses, params, sort_key, ("personnel",),
+                                                  None if fetch_all else ITEMS_PER_PAGE, offset, after)
+    personnel = [{k: escape(str(v)) if v is not None else '' for k, v in row.items()} for row in rows]
     
     submission_status = None
     if not is_admin:
@@ -396,6 +2115,7 @@ def handle_list_personnel(payload, conn, cursor, session):
         "personnel": personnel,
         "total": total_items,
         "page": page,
+        "next_cursor": encode_cursor(next_key) if next_key else None,
         "submission_status": submission_status,
         "weekly_date_range": get_next_week_range_str(),
         "persistent_statuses": persistent_statuses
@@ -437,14 +2157,163 @@ def handle_delete_personnel(payload, conn, cursor):
     conn.commit()
     return {"status": "success", "message": "ลบข้อมูลสำเร็จ"}
 
+PERSONNEL_FIELDS = ('rank', 'first_name', 'last_name', 'position', 'specialty', 'department')
+# Column headers of the Excel template, accepted as CSV headers by the streamed import
+PERSONNEL_IMPORT_HEADERS = {'ยศ-คำนำหน้า': 'rank', 'ชื่อ': 'first_name', 'นามสกุล': 'last_name', 'ตำแหน่ง': 'position', 'เหล่า': 'specialty', 'แผนก': 'department'}
+IMPORT_MODES = ('upsert', 'sync', 'replace')
+DESTRUCTIVE_IMPORT_MODES = ('sync', 'replace') # Run only with confirm_deleted taken from a dry run
+
+class UploadRowError(ValueError):
+    """Raised for an uploaded personnel row that is not a JSON object."""
+    def __init__(self, line_number, reason):
+        super().__init__(f"บรรทัดที่ {line_number}: {reason}")
+        self.line_number = line_number
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def import_personnel_rows(cursor, rows, mode="upsert", dry_run=False):
+    """
+    Imports personnel rows in IMPORT_BATCH_SIZE batches. People are matched to existing
+    records by first and last name (department breaks ties), so their IDs and the
+    persistent statuses pointing at them survive the import.
+      upsert  - add new people and update changed ones; nobody is deleted
+      sync    - upsert, then delete people missing from the import
+      replace - delete everyone and insert the import with new IDs (the old behaviour)
+    With dry_run nothing is written; the returned counts say what would happen, and
+    counts["deleted_personnel"] lists who would be deleted. The caller commits.
+    """
+    counts = {"added": 0, "updated": 0, "unchanged": 0, "deleted": 0, "deleted_personnel": []}
+    insert_sql = "INSERT INTO personnel (id, rank, first_name, last_name, position, specialty, department) VALUES (?, ?, ?, ?, ?, ?, ?)"
+    if mode == "replace":
+        cursor.execute("SELECT id, rank, first_name, last_name, department FROM personnel")
+        counts["deleted_personnel"] = [dict(row) for row in cursor.fetchall()]
+        counts["deleted"] = len(counts["deleted_personnel"])
+        if not dry_run: cursor.execute("DELETE FROM personnel")
+        for batch in _batched(rows, IMPORT_BATCH_SIZE):
+            counts["added"] += len(batch)
+            if not dry_run:
+                cursor.executemany(insert_sql, [(str(uuid.uuid4()),) + tuple(str(p.get(f) or '').strip() for f in PERSONNEL_FIELDS) for p in batch])
+        return counts
+
+    cursor.execute("SELECT id, rank, first_name, last_name, position, specialty, department FROM personnel")
+    existing = defaultdict(list)
+    for row in cursor.fetchall():
+        existing[((row['first_name'] or '').strip(), (row['last_name'] or '').strip())].append(row)
+
+    for batch in _batched(rows, IMPORT_BATCH_SIZE):
+        inserts, updates = [], []
+        for p in batch:
+            values = tuple(str(p.get(f) or '').strip() for f in PERSONNEL_FIELDS)
+            candidates = existing.get((values[1], values[2]))
+            if not candidates:
+                inserts.append((str(uuid.uuid4()),) + values)
+                continue
+            match = next((row for row in candidates if row['department'] == values[5]), candidates[0])
+            candidates.remove(match)
+            if tuple(match[f] or '' for f in PERSONNEL_FIELDS) == values:
+                counts["unchanged"] += 1
+            else:
+                updates.append(values + (match['id'],))
+        counts["added"] += len(inserts)
+        counts["updated"] += len(updates)
+        if not dry_run:
+            cursor.executemany(insert_sql, inserts)
+            cursor.executemany("UPDATE personnel SET rank=?, first_name=?, last_name=?, position=?, specialty=?, department=? WHERE id=?", updates)
+
+    if mode == "sync":
+        # Whatever was not matched by the import is no longer on the roster
+        missing = [row for candidates in existing.values() for row in candidates]
+        counts["deleted_personnel"] = [{f: row[f] for f in ('id', 'rank', 'first_name', 'last_name', 'department')} for row in missing]
+        missing_ids = [(row['id'],) for row in missing]
+        counts["deleted"] = len(missing_ids)
+        if not dry_run:
+            for batch in _batched(missing_ids, IMPORT_BATCH_SIZE):
+                cursor.executemany("DELETE FROM persistent_statuses WHERE personnel_id = ?", batch)
+                cursor.executemany("DELETE FROM personnel WHERE id = ?", batch)
+    return counts
+
+def _import_confirmation_error(mode, dry_run, confirm_deleted, counts):
+    """
+    Destructive modes must be confirmed with the number of deletions their dry run
+    reported; returns the error message when that number is missing or out of date.
+    """
+    if dry_run or mode not in DESTRUCTIVE_IMPORT_MODES: return None
+    if confirm_deleted is None:
+        return "การนำเข้าแบบลบข้อมูลต้องตรวจสอบผล (dry_run) และยืนยันจำนวนที่จะถูกลบก่อน"
+    if confirm_deleted != counts["deleted"]:
+        return f"จำนวนกำลังพลที่จะถูกลบเปลี่ยนไปจากที่ยืนยันไว้ ({confirm_deleted} เป็น {counts['deleted']}) กรุณาตรวจสอบใหม่อีกครั้ง"
+    return None
+
+def _import_personnel_response(counts, dry_run):
+    deleted_personnel = counts.pop("deleted_personnel")
+    summary = f"เพิ่ม {counts['added']} แก้ไข {counts['updated']} ลบ {counts['deleted']} ไม่เปลี่ยนแปลง {counts['unchanged']} รายการ"
+    if dry_run:
+        return {"status": "success", "dry_run": True, "counts": counts, "deleted_personnel": deleted_personnel, "message": f"ผลการตรวจสอบก่อนนำเข้า: {summary}"}
+    return {"status": "success", "counts": counts, "message": f"นำเข้าข้อมูลกำลังพลสำเร็จ: {summary}"}
+
+def _parse_confirm_deleted(value):
+    if value is None or value == '': return None
+    return int(value)
+
 def handle_import_personnel(payload, conn, cursor):
-    new_data = payload.get("personnel", [])
-    cursor.execute("DELETE FROM personnel")
-    for p in new_data:
-        cursor.execute("INSERT INTO personnel (id, rank, first_name, last_name, position, specialty, department) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                       (str(uuid.uuid4()), p['rank'], p['first_name'], p['last_name'], p['position'], p['specialty'], p['department']))
-    conn.commit()
-    return {"status": "success", "message": f"นำเข้าข้อมูลกำลังพลจำนวน {len(new_data)} รายการสำเร็จ"}
+    mode = payload.get("mode", "upsert")
+    if mode not in IMPORT_MODES: return {"status": "error", "message": "ไม่รู้จักรูปแบบการนำเข้าข้อมูล"}
+    rows = payload.get("personnel", [])
+    if not isinstance(rows, list) or not all(isinstance(p, dict) for p in rows):
+        return {"status": "error", "message": "รูปแบบข้อมูลที่นำเข้าไม่ถูกต้อง"}
+    try:
+        confirm_deleted = _parse_confirm_deleted(payload.get("confirm_deleted"))
+    except (TypeError, ValueError):
+        return {"status": "error", "message": "จำนวนที่ยืนยันไม่ถูกต้อง"}
+    dry_run = bool(payload.get("dry_run"))
+    counts = import_personnel_rows(cursor, rows, mode, dry_run)
+    error = _import_confirmation_error(mode, dry_run, confirm_deleted, counts)
+    if dry_run or error: conn.rollback()
+    else: conn.commit()
+    if error: return {"status": "error", "message": error}
+    return _import_personnel_response(counts, dry_run)
+
+def _user_fullname(cursor, username):
+    cursor.execute("SELECT rank, first_name, last_name FROM users WHERE username = ?", (username,))
+    row = cursor.fetchone()
+    return f"{row['rank']} {row['first_name']} {row['last_name']}" if row else username
+
+def publish_weekly_submission(cursor, department, username, timestamp, item_count):
+    """Sends connected weekly dashboards the new department entry and the totals it changes."""
+    if not EVENT_BROADCASTER.has_subscribers(): return
+    cursor.execute("SELECT status, SUM(count) AS total FROM status_report_counts GROUP BY status")
+    status_summary = {row['status']: row['total'] for row in cursor.fetchall()}
+    cursor.execute("SELECT COUNT(id) AS total FROM personnel")
+    total_personnel = cursor.fetchone()['total']
+    EVENT_BROADCASTER.publish("report_submitted", {
+        "kind": "weekly",
+        "department": department,
+        "submitted_info": {"submitter_fullname": _user_fullname(cursor, username), "timestamp": timestamp, "status_count": item_count},
+        "status_summary": status_summary,
+        "total_on_duty": total_personnel - sum(status_summary.values())
+    })
+
+def publish_daily_submission(cursor, department, report_date, username, timestamp, summary_data):
+    """Sends connected daily dashboards the department entry of a newly submitted report."""
+    if not EVENT_BROADCASTER.has_subscribers(): return
+    EVENT_BROADCASTER.publish("report_submitted", {
+        "kind": "daily",
+        "department": department,
+        "report_date": report_date,
+        "submitted_info": {
+            "submitter_fullname": _user_fullname(cursor, username),
+            "timestamp": timestamp,
+            "summary": {category: summary_data.get(category, {}) for category in ('officer', 'nco', 'civilian')}
+        }
+    })
 
 def handle_submit_status_report(payload, conn, cursor, session):
     report_data = payload.get("report", {})
@@ -454,9 +2323,13 @@ def handle_submit_status_report(payload, conn, cursor, session):
     date_str = server_now.strftime('%Y-%m-%d')
     timestamp_str = server_now.strftime('%Y-%m-%d %H:%M:%S')
     
+    report_id = str(uuid.uuid4())
     cursor.execute("DELETE FROM status_reports WHERE department = ?", (user_department,))
+    cursor.execute("DELETE FROM report_items WHERE report_table = 'status_reports' AND department = ?", (user_department,))
     cursor.execute("INSERT INTO status_reports (id, date, submitted_by, department, report_data, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
-                   (str(uuid.uuid4()), date_str, submitted_by, user_department, json.dumps(report_data["items"]), timestamp_str))
+                   (report_id, date_str, submitted_by, user_department, json.dumps(report_data["items"]), timestamp_str))
+    write_report_items(cursor, 'status_reports', report_id, user_department, date_str, report_data["items"])
+    replace_status_counts(cursor, user_department, report_data["items"])
     
     today_str = date.today().isoformat()
     cursor.execute("DELETE FROM persistent_statuses WHERE department = ?", (user_department,))
@@ -479,6 +2352,7 @@ def handle_submit_status_report(payload, conn, cursor, session):
             )
     
     conn.commit()
+    publish_weekly_submission(cursor, user_department, submitted_by, timestamp_str, len(report_data["items"]))
     return {"status": "success", "message": "ส่งยอดกำลังพลสำเร็จ"}
 
 def handle_get_status_reports(payload, conn, cursor):
@@ -508,23 +2382,30 @@ def handle_archive_reports(payload, conn, cursor):
         report_date = report["date"]
         department = report["department"]
         cursor.execute("DELETE FROM archived_reports WHERE date = ? AND department = ?", (report_date, department))
+        cursor.execute("DELETE FROM cold.archived_reports WHERE date = ? AND department = ?", (report_date, department))
+        cursor.execute("DELETE FROM report_items WHERE report_table = 'archived_reports' AND department = ? AND report_date = ?", (department, report_date))
         year, month = map(int, report_date.split('-')[:2])
         submitted_by = f"{report['rank']} {report['first_name']} {report['last_name']}"
+        archive_id = str(uuid.uuid4())
         cursor.execute("INSERT INTO archived_reports (id, year, month, date, department, submitted_by, report_data, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                       (str(uuid.uuid4()), year, month, report_date, department, submitted_by, json.dumps(report["items"]), report["timestamp"]))
+                       (archive_id, year, month, report_date, department, submitted_by, json.dumps(report["items"]), report["timestamp"]))
+        write_report_items(cursor, 'archived_reports', archive_id, department, report_date, report["items"])
     cursor.execute("DELETE FROM status_reports")
+    cursor.execute("DELETE FROM status_report_counts")
+    cursor.execute("DELETE FROM report_items WHERE report_table = 'status_reports'")
     conn.commit()
+    EVENT_BROADCASTER.publish("reports_archived", {"kind": "weekly"})
     return {"status": "success", "message": "เก็บรายงานและรีเซ็ตแดชบอร์ดสำเร็จ"}
 
 def handle_get_archived_reports(payload, conn, cursor):
-    cursor.execute("SELECT * FROM archived_reports ORDER BY year DESC, month DESC, date DESC")
-    archives = defaultdict(lambda: defaultdict(list))
-    for row in cursor.fetchall():
+    cursor.execute("SELECT * FROM all_archived_reports ORDER BY year DESC, month DESC, date DESC")
+    def decode(row):
         report = dict(row)
-        report["items"] = json.loads(report["report_data"])
+        report["items"] = decode_archive_json(report["report_data"])
         del report["report_data"]
-        archives[str(report["year"])][str(report["month"])].append(report)
-    return {"status": "success", "archives": dict(archives)}
+        return report
+    archives = group_by_year_month(cursor, lambda row: (str(row["year"]), str(row["month"])), decode)
+    return {"status": "success", "archives": JSONObjectStream(archives)}
 
 def handle_get_submission_history(payload, conn, cursor, session):
     user_dept = session.get("department")
@@ -534,25 +2415,22 @@ def handle_get_submission_history(payload, conn, cursor, session):
     FROM status_reports WHERE department = :dept
     UNION ALL
     SELECT id, date, submitted_by, department, timestamp, report_data, 'archived' as source
-    FROM archived_reports WHERE department = :dept
+    FROM all_archived_reports WHERE department = :dept
     ORDER BY timestamp DESC
     """
     cursor.execute(query, {"dept": user_dept})
     
-    history_by_month = defaultdict(lambda: defaultdict(list))
-    
-    for row in cursor.fetchall():
+    def year_month(row):
+        timestamp_dt = datetime.strptime(row["timestamp"].split('.')[0], '%Y-%m-%d %H:%M:%S')
+        return str(timestamp_dt.year + 543), str(timestamp_dt.month)
+
+    def decode(row):
         report = dict(row)
-        report["items"] = json.loads(report["report_data"])
+        report["items"] = decode_archive_json(report["report_data"])
         del report["report_data"]
+        return report
         
-        timestamp_dt = datetime.strptime(report["timestamp"].split('.')[0], '%Y-%m-%d %H:%M:%S')
-        year_be = str(timestamp_dt.year + 543)
-        month = str(timestamp_dt.month)
-        
-        history_by_month[year_be][month].append(report)
-        
-    return {"status": "success", "history": dict(history_by_month)}
+    return {"status": "success", "history": JSONObjectStream(group_by_year_month(cursor, year_month, decode))}
 
 def handle_get_report_for_editing(payload, conn, cursor):
     report_id = payload.get("id")
@@ -560,10 +2438,10 @@ def handle_get_report_for_editing(payload, conn, cursor):
     cursor.execute("SELECT report_data, department FROM status_reports WHERE id = ?", (report_id,))
     report = cursor.fetchone()
     if not report:
-        cursor.execute("SELECT report_data, department FROM archived_reports WHERE id = ?", (report_id,))
+        cursor.execute("SELECT report_data, department FROM all_archived_reports WHERE id = ?", (report_id,))
         report = cursor.fetchone()
     if report:
-        return {"status": "success", "report": {"items": json.loads(report['report_data']), "department": report['department']}}
+        return {"status": "success", "report": {"items": decode_archive_json(report['report_data']), "department": report['department']}}
     return {"status": "error", "message": "ไม่พบข้อมูลรายงาน"}
 
 def handle_get_active_statuses(payload, conn, cursor, session):
@@ -577,36 +2455,30 @@ def handle_get_active_statuses(payload, conn, cursor, session):
             p.rank, p.first_name, p.last_name, p.department
         FROM persistent_statuses ps
         JOIN personnel p ON ps.personnel_id = p.id
+        LEFT JOIN ranks r ON r.rank = p.rank
         WHERE ps.end_date >= ?
     """
     params_unavailable = [today_str]
     if not is_admin:
         query_unavailable += " AND ps.department = ?"
         params_unavailable.append(department)
+    query_unavailable += f" ORDER BY COALESCE(r.ordinal, {UNKNOWN_RANK_ORDINAL}), p.first_name, p.last_name"
     
     cursor.execute(query_unavailable, params_unavailable)
     unavailable_personnel = [dict(row) for row in cursor.fetchall()]
     unavailable_ids = {p['personnel_id'] for p in unavailable_personnel}
 
-    query_all = "SELECT id, rank, first_name, last_name, department FROM personnel"
+    query_all = "SELECT p.id, p.rank, p.first_name, p.last_name, p.department FROM personnel p LEFT JOIN ranks r ON r.rank = p.rank"
     params_all = []
     if not is_admin:
-        query_all += " WHERE department = ?"
+        query_all += " WHERE p.department = ?"
         params_all.append(department)
+    query_all += f" ORDER BY COALESCE(r.ordinal, {UNKNOWN_RANK_ORDINAL}), p.first_name, p.last_name"
 
     cursor.execute(query_all, params_all)
     all_personnel = [dict(row) for row in cursor.fetchall()]
 
     available_personnel = [p for p in all_personnel if p['id'] not in unavailable_ids]
-
-    def get_rank_index(item):
-        try:
-            return RANK_ORDER.index(item['rank'])
-        except ValueError:
-            return len(RANK_ORDER)
-
-    unavailable_personnel.sort(key=get_rank_index)
-    available_personnel.sort(key=get_rank_index)
     
     total_personnel_in_scope = len(all_personnel)
 
@@ -677,7 +2549,8 @@ def handle_get_daily_personnel_for_submission(payload, conn, cursor, session):
         if last_submission:
             submission_status = {"timestamp": last_submission['timestamp']}
 
-    cursor.execute("SELECT * FROM personnel WHERE department = ?", (department_to_view,))
+    cursor.execute(f"SELECT p.* FROM personnel p LEFT JOIN ranks r ON r.rank = p.rank WHERE p.department = ? ORDER BY COALESCE(r.ordinal, {UNKNOWN_RANK_ORDINAL}), p.first_name, p.last_name",
+                   (department_to_view,))
     personnel_in_dept = [dict(row) for row in cursor.fetchall()]
     classified_personnel = classify_personnel(personnel_in_dept)
     
@@ -723,20 +2596,18 @@ def handle_submit_daily_report(payload, conn, cursor, session):
     server_now = datetime.utcnow() + timedelta(hours=7)
     timestamp_str = server_now.strftime('%Y-%m-%d %H:%M:%S')
 
+    report_id = str(uuid.uuid4())
     cursor.execute("DELETE FROM daily_reports WHERE department = ? AND report_date = ?", (department, report_date_str))
+    cursor.execute("DELETE FROM report_items WHERE report_table = 'daily_reports' AND department = ? AND report_date = ?", (department, report_date_str))
     cursor.execute(
         "INSERT INTO daily_reports (id, report_date, department, submitted_by, timestamp, summary_data, report_data) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (str(uuid.uuid4()), report_date_str, department, submitted_by, timestamp_str, json.dumps(data.get("summary_data", {})), json.dumps(data.get("report_data", {})))
+        (report_id, report_date_str, department, submitted_by, timestamp_str, json.dumps(data.get("summary_data", {})), json.dumps(data.get("report_data", {})))
     )
+    write_report_items(cursor, 'daily_reports', report_id, department, report_date_str, data.get("report_data", {}))
 
     # --- START: Update persistent_statuses for NCOs and Civilians ---
-    cursor.execute("SELECT id, rank FROM personnel WHERE department = ?", (department,))
-    personnel_in_dept = cursor.fetchall()
-    
-    nco_civ_ids = [
-        p['id'] for p in personnel_in_dept
-        if p['rank'] in RANK_CLASSIFICATION['nco'] or p['rank'] in RANK_CLASSIFICATION['civilian']
-    ]
+    cursor.execute("SELECT p.id FROM personnel p JOIN ranks r ON r.rank = p.rank WHERE p.department = ? AND r.category IN ('nco', 'civilian')", (department,))
+    nco_civ_ids = [row['id'] for row in cursor.fetchall()]
 
     if nco_civ_ids:
         placeholders = ', '.join('?' for _ in nco_civ_ids)
@@ -753,6 +2624,8 @@ def handle_submit_daily_report(payload, conn, cursor, session):
     # --- END: Update persistent_statuses ---
 
     conn.commit()
+    WORKING_DAY_CALENDAR.invalidate_reports()
+    publish_daily_submission(cursor, department, report_date_str, submitted_by, timestamp_str, data.get("summary_data", {}))
     return {"status": "success", "message": f"ส่งยอดกำลังพลสำหรับวันที่ {report_date_str} สำเร็จ"}
 
 
@@ -770,20 +2643,17 @@ def handle_get_daily_submission_history(payload, conn, cursor, session):
     query += " ORDER BY report_date DESC"
     cursor.execute(query, params)
     
-    history_by_month = defaultdict(lambda: defaultdict(list))
-    
-    for row in cursor.fetchall():
+    def year_month(row):
+        report_dt = datetime.strptime(row["report_date"], '%Y-%m-%d')
+        return str(report_dt.year + 543), str(report_dt.month)
+
+    def decode(row):
         report = dict(row)
-        report_dt = datetime.strptime(report["report_date"], '%Y-%m-%d')
-        year_be = str(report_dt.year + 543)
-        month = str(report_dt.month)
-        
         report['summary'] = json.loads(report.get("summary_data", "{}"))
         del report["summary_data"]
+        return report
         
-        history_by_month[year_be][month].append(report)
-        
-    return {"status": "success", "history": dict(history_by_month)}
+    return {"status": "success", "history": JSONObjectStream(group_by_year_month(cursor, year_month, decode))}
 
 def handle_get_daily_final_report(payload, conn, cursor, session):
     target_date = get_daily_target_date(cursor)
@@ -823,35 +2693,230 @@ def handle_archive_daily_reports(payload, conn, cursor, session):
         report_date = report["report_date"]
         department = report["department"]
         cursor.execute("DELETE FROM archived_daily_reports WHERE report_date = ? AND department = ?", (report_date, department))
+        cursor.execute("DELETE FROM cold.archived_daily_reports WHERE report_date = ? AND department = ?", (report_date, department))
+        cursor.execute("DELETE FROM report_items WHERE report_table = 'archived_daily_reports' AND department = ? AND report_date = ?", (department, report_date))
         year, month, _ = map(int, report_date.split('-'))
         
         submitted_by = f"{report['rank']} {report['first_name']} {report['last_name']}"
+        archive_id = str(uuid.uuid4())
         
         cursor.execute(
             """INSERT INTO archived_daily_reports
                (id, year, month, report_date, department, submitted_by, timestamp, summary_data, report_data)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (
-                str(uuid.uuid4()), year, month, report_date, department,
+                archive_id, year, month, report_date, department,
                 submitted_by, report["timestamp"],
                 json.dumps(report["summary_data"]), json.dumps(report["report_data"])
             )
         )
+        write_report_items(cursor, 'archived_daily_reports', archive_id, department, report_date, report["report_data"])
     
     report_date_to_clear = reports_to_archive[0]["report_date"]
     cursor.execute("DELETE FROM daily_reports WHERE report_date = ?", (report_date_to_clear,))
+    cursor.execute("DELETE FROM report_items WHERE report_table = 'daily_reports' AND report_date = ?", (report_date_to_clear,))
     conn.commit()
+    WORKING_DAY_CALENDAR.invalidate_reports()
+    EVENT_BROADCASTER.publish("reports_archived", {"kind": "daily", "report_date": report_date_to_clear})
     return {"status": "success", "message": f"เก็บรายงานวันที่ {report_date_to_clear} และรีเซ็ตแดชบอร์ดสำเร็จ"}
 
 def handle_get_archived_daily_reports(payload, conn, cursor, session):
-    cursor.execute("SELECT * FROM archived_daily_reports ORDER BY year DESC, month DESC, report_date DESC")
-    archives = defaultdict(lambda: defaultdict(list))
-    for row in cursor.fetchall():
+    cursor.execute("SELECT * FROM all_archived_daily_reports ORDER BY year DESC, month DESC, report_date DESC")
+    def decode(row):
         report = dict(row)
-        report["summary_data"] = json.loads(report["summary_data"])
-        report["report_data"] = json.loads(report["report_data"])
-        archives[str(report["year"])][str(report["month"])].append(report)
-    return {"status": "success", "archives": dict(archives)}
+        report["summary_data"] = decode_archive_json(report["summary_data"])
+        report["report_data"] = decode_archive_json(report["report_data"])
+        return report
+    archives = group_by_year_month(cursor, lambda row: (str(row["year"]), str(row["month"])), decode)
+    return {"status": "success", "archives": JSONObjectStream(archives)}
+
+def handle_query_report_items(payload, conn, cursor):
+    """
+    Answers questions such as "who was on leave in March" straight from report_items.
+    Filters: status, department, date_from/date_to (overlapping the status period) and
+    source ("weekly", "daily" or both). Each person/status/period is returned once.
+    """
+    sources = {'weekly': ('status_reports', 'archived_reports'), 'daily': ('daily_reports', 'archived_daily_reports')}
+    tables = sources.get(payload.get("source"), sources['weekly'] + sources['daily'])
+    where_clauses = [f"ri.report_table IN ({', '.join('?' for _ in tables)})"]
+    params = list(tables)
+    if payload.get("status"):
+        where_clauses.append("ri.status = ?"); params.append(payload["status"])
+    if payload.get("department"):
+        where_clauses.append("ri.department = ?"); params.append(payload["department"])
+    if payload.get("date_to"):
+        where_clauses.append("ri.start_date <= ?"); params.append(payload["date_to"])
+    if payload.get("date_from"):
+        where_clauses.append("ri.end_date >= ?"); params.append(payload["date_from"])
+    query = f"""
+        SELECT DISTINCT ri.personnel_id, COALESCE(ri.personnel_name, p.rank || ' ' || p.first_name || ' ' || p.last_name) AS personnel_name,
+               ri.department, ri.status, ri.details, ri.start_date, ri.end_date
+        FROM report_items ri LEFT JOIN personnel p ON ri.personnel_id = p.id
+        WHERE {' AND '.join(where_clauses)}
+        ORDER BY ri.start_date, ri.department
+    """
+    cursor.execute(query, params)
+    return {"status": "success", "items": [dict(row) for row in cursor.fetchall()]}
+
+def _decode_archive_row(kind, row):
+    report = dict(row)
+    if kind == 'weekly':
+        report["items"] = decode_archive_json(report.pop("report_data"))
+    else:
+        report["summary_data"] = decode_archive_json(report["summary_data"])
+        report["report_data"] = decode_archive_json(report["report_data"])
+    return report
+
+def handle_get_archive_index(payload, conn, cursor):
+    """Returns how many archived reports exist per year, month and department, without report bodies."""
+    kind = payload.get("kind", "weekly")
+    if kind not in ARCHIVE_KINDS: return {"status": "error", "message": "ไม่รู้จักประเภทรายงาน"}
+    table = ARCHIVE_KINDS[kind]['view']
+    cursor.execute(f"SELECT year, month, department, COUNT(*) AS count FROM {table} GROUP BY year, month, department ORDER BY year DESC, month DESC, department")
+    return {"status": "success", "kind": kind, "index": [dict(row) for row in cursor.fetchall()]}
+
+def handle_get_archive_page(payload, conn, cursor):
+    """
+    Returns one page of archived reports, newest first, filtered by department, year/month
+    or date range. Pass the returned next_cursor back to fetch the following page.
+    """
+    kind = payload.get("kind", "weekly")
+    if kind not in ARCHIVE_KINDS: return {"status": "error", "message": "ไม่รู้จักประเภทรายงาน"}
+    date_column = ARCHIVE_KINDS[kind]['date_column']
+    try:
+        limit = max(1, min(int(payload.get("limit") or ARCHIVE_PAGE_SIZE), ARCHIVE_PAGE_MAX))
+    except (TypeError, ValueError):
+        return {"status": "error", "message": "จำนวนรายการต่อหน้าไม่ถูกต้อง"}
+
+    where_clauses, params = [], []
+    if payload.get("department"):
+        where_clauses.append("department = ?"); params.append(payload["department"])
+    if payload.get("year"):
+        try:
+            year = int(payload["year"])
+        except (TypeError, ValueError):
+            return {"status": "error", "message": "ปีไม่ถูกต้อง"}
+        where_clauses.append("year = ?"); params.append(year)
+    if payload.get("month"):
+        try:
+            month = int(payload["month"])
+            if not 1 <= month <= 12: raise ValueError(month)
+        except (TypeError, ValueError):
+            return {"status": "error", "message": "เดือนไม่ถูกต้อง"}
+        where_clauses.append("month = ?"); params.append(month)
+    if payload.get("date_from"):
+        where_clauses.append(f"{date_column} >= ?"); params.append(payload["date_from"])
+    if payload.get("date_to"):
+        where_clauses.append(f"{date_column} <= ?"); params.append(payload["date_to"])
+    if payload.get("cursor"):
+        last_key = decode_cursor(payload["cursor"])
+        if not isinstance(last_key, list) or len(last_key) != 2:
+            return {"status": "error", "message": "cursor ไม่ถูกต้อง"}
+        where_clauses.append(f"({date_column}, id) < (?, ?)"); params.extend(last_key)
+
+    where_clause_str = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    cursor.execute(f"{archive_tiers_query(kind, where_clause_str)} ORDER BY {date_column} DESC, id DESC LIMIT ?", params + params + [limit + 1])
+    rows = cursor.fetchall()
+    reports = [_decode_archive_row(kind, row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor([reports[-1][date_column], reports[-1]["id"]])
+    return {"status": "success", "kind": kind, "reports": reports, "next_cursor": next_cursor}
+
+def handle_tier_archives(payload, conn, cursor):
+    """Runs the cold-tier move now; `older_than_days` overrides ARCHIVE_COLD_AFTER_DAYS."""
+    older_than_days = payload.get("older_than_days")
+    if older_than_days is not None:
+        try:
+            older_than_days = max(0, int(older_than_days))
+        except (TypeError, ValueError):
+            return {"status": "error", "message": "จำนวนวันไม่ถูกต้อง"}
+    elif ARCHIVE_COLD_AFTER_DAYS is None:
+        return {"status": "error", "message": "ไม่ได้เปิดใช้การย้ายรายงานไปยังที่เก็บข้อมูลเย็น"}
+    moved = tier_archives(conn, older_than_days)
+    return {"status": "success", "moved": moved, "tiers": archive_tier_report(conn)}
+
+def handle_get_archive_tiers(payload, conn, cursor):
+    return {"status": "success", "tiers": archive_tier_report(conn)}
+
+def iter_export_rows(cursor, kind, date_from=None, date_to=None, department=None):
+    """Returns the export header and a lazy iterator over one row per archived report item."""
+    table = ARCHIVE_KINDS[kind]['table']
+    where_clauses, params = ["ri.report_table = ?"], [table]
+    if date_from:
+        where_clauses.append("ri.report_date >= ?"); params.append(date_from)
+    if date_to:
+        where_clauses.append("ri.report_date <= ?"); params.append(date_to)
+    if department:
+        where_clauses.append("ri.department = ?"); params.append(department)
+    cursor.execute(f"""
+        SELECT ri.report_date, ri.department, ri.category,
+               COALESCE(ri.personnel_name, p.rank || ' ' || p.first_name || ' ' || p.last_name, ri.personnel_id) AS personnel_name,
+               ri.status, ri.details, ri.start_date, ri.end_date
+        FROM report_items ri LEFT JOIN personnel p ON ri.personnel_id = p.id
+        WHERE {' AND '.join(where_clauses)}
+        ORDER BY ri.report_date, ri.department
+    """, params)
+    if kind == 'daily':
+        header = ['วันที่รายงาน', 'แผนก', 'ประเภท', 'ยศ-ชื่อ-สกุล', 'สถานะ', 'รายละเอียด', 'วันที่เริ่มต้น', 'วันที่สิ้นสุด']
+        return header, (tuple(row) for row in cursor)
+    header = ['วันที่รายงาน', 'แผนก', 'ยศ-ชื่อ-สกุล', 'สถานะ', 'รายละเอียด', 'วันที่เริ่มต้น', 'วันที่สิ้นสุด']
+    return header, ((row[0], row[1]) + tuple(row)[3:] for row in cursor)
+
+def write_csv(out, header, rows):
+    """Writes rows to `out` as UTF-8 CSV with a BOM so Excel shows Thai text correctly."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    out.write('\ufeff')
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            out.write(buffer.getvalue())
+            buffer.seek(0); buffer.truncate()
+    out.write(buffer.getvalue())
+
+_XLSX_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _xlsx_row(values):
+    cells = ''.join(f'<c t="inlineStr"><is><t xml:space="preserve">{xml_escape(_XLSX_ILLEGAL_CHARS.sub("", str(v)))}</t></is></c>' if v is not None else '<c/>' for v in values)
+    return f'<row>{cells}</row>'
+
+def write_xlsx(out, header, rows):
+    """
+    Writes a minimal XLSX workbook to `out` one row at a time. Cells use inline
+    strings, so no shared-string table has to be kept in memory; a new sheet is
+    started whenever XLSX_MAX_ROWS is reached.
+    """
+    main_ns = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    rel_ns = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        sheet_count, exhausted = 0, False
+        rows = iter(rows)
+        while not exhausted:
+            sheet_count += 1
+            with workbook.open(f'xl/worksheets/sheet{sheet_count}.xml', 'w', force_zip64=True) as sheet:
+                sheet.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet xmlns="{main_ns}"><sheetData>'.encode('utf-8'))
+                sheet.write(_xlsx_row(header).encode('utf-8'))
+                written = 1
+                for row in rows:
+                    sheet.write(_xlsx_row(row).encode('utf-8'))
+                    written += 1
+                    if written >= XLSX_MAX_ROWS: break
+                else:
+                    exhausted = True
+                sheet.write(b'</sheetData></worksheet>')
+
+        sheets = ''.join(f'<sheet name="รายงาน{i if i > 1 else ""}" sheetId="{i}" r:id="rId{i}"/>' for i in range(1, sheet_count + 1))
+        workbook.writestr('xl/workbook.xml', f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<workbook xmlns="{main_ns}" xmlns:r="{rel_ns}"><sheets>{sheets}</sheets></workbook>')
+        sheet_rels = ''.join(f'<Relationship Id="rId{i}" Type="{rel_ns}/worksheet" Target="worksheets/sheet{i}.xml"/>' for i in range(1, sheet_count + 1))
+        workbook.writestr('xl/_rels/workbook.xml.rels', f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{sheet_rels}</Relationships>')
+        workbook.writestr('_rels/.rels', f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships"><Relationship Id="rId1" Type="{rel_ns}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+        sheet_types = ''.join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>' for i in range(1, sheet_count + 1))
+        workbook.writestr('[Content_Types].xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                          '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/><Default Extension="xml" ContentType="application/xml"/>'
+                          '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                          f'{sheet_types}</Types>')
 
 def handle_list_holidays(payload, conn, cursor, session):
     cursor.execute("SELECT date, description FROM holidays ORDER BY date ASC")
@@ -866,6 +2931,7 @@ def handle_add_holiday(payload, conn, cursor, session):
     try:
         cursor.execute("INSERT INTO holidays (date, description) VALUES (?, ?)", (holiday_date, description))
         conn.commit()
+        WORKING_DAY_CALENDAR.invalidate()
         return {"status": "success", "message": f"เพิ่มวันหยุด '{escape(description)}' สำเร็จ"}
     except sqlite3.IntegrityError:
         return {"status": "error", "message": "วันหยุดนี้มีอยู่ในระบบแล้ว"}
@@ -876,157 +2942,904 @@ def handle_delete_holiday(payload, conn, cursor, session):
         return {"status": "error", "message": "ไม่พบข้อมูลวันที่ที่จะลบ"}
     cursor.execute("DELETE FROM holidays WHERE date = ?", (holiday_date,))
     conn.commit()
+    WORKING_DAY_CALENDAR.invalidate()
     return {"status": "success", "message": "ลบวันหยุดสำเร็จ"}
+
+def handle_import_holidays(payload, conn, cursor, session):
+    """
+    Adds or updates many holidays at once, e.g. a whole year's calendar.
+    payload: {"year": 2026, "holidays": [{"date": "2026-01-01", "description": "..."}], "replace": false}
+    With "replace", holidays of `year` that are not in the list are removed.
+    """
+    year = payload.get("year")
+    if year is not None and year != "":
+        try:
+            year = int(year)
+        except (TypeError, ValueError):
+            return {"status": "error", "message": "ปีไม่ถูกต้อง"}
+        if not 1 <= year <= 9999: return {"status": "error", "message": "ปีไม่ถูกต้อง"}
+    else:
+        year = None
+    holidays = payload.get("holidays") or []
+    if not isinstance(holidays, list):
+        return {"status": "error", "message": "รูปแบบรายการวันหยุดไม่ถูกต้อง"}
+    replace = bool(payload.get("replace"))
+    if replace and not year:
+        return {"status": "error", "message": "กรุณาระบุปีที่ต้องการแทนที่วันหยุด"}
+
+    rows = []
+    for index, holiday in enumerate(holidays, start=1):
+        if not isinstance(holiday, dict):
+            return {"status": "error", "message": f"รายการที่ {index} ไม่ถูกต้อง"}
+        description = str(holiday.get("description") or "").strip()
+        try:
+            holiday_date = date.fromisoformat(str(holiday.get("date") or ""))
+        except ValueError:
+            return {"status": "error", "message": f"วันที่ในรายการที่ {index} ไม่ถูกต้อง"}
+        if not description:
+            return {"status": "error", "message": f"กรุณากรอกคำอธิบายวันหยุดในรายการที่ {index}"}
+        if year and holiday_date.year != year:
+            return {"status": "error", "message": f"วันที่ {holiday_date.isoformat()} ไม่อยู่ในปี {year}"}
+        rows.append((holiday_date.isoformat(), description))
+
+    removed = 0
+    if replace:
+        cursor.execute("DELETE FROM holidays WHERE date BETWEEN ? AND ?", (f"{year:04d}-01-01", f"{year:04d}-12-31"))
+        removed = cursor.rowcount
+    cursor.executemany(
+        "INSERT INTO holidays (date, description) VALUES (?, ?) ON CONFLICT(date) DO UPDATE SET description = excluded.description",
+        rows
+    )
+    conn.commit()
+    WORKING_DAY_CALENDAR.invalidate()
+    return {"status": "success", "message": f"นำเข้าวันหยุด {len(rows)} รายการสำเร็จ", "imported": len(rows), "removed": removed}
 # --- END: DAILY SYSTEM ACTION HANDLERS ---
 
+def handle_set_profiling(payload, conn, cursor):
+    """Turns sampled cProfile collection on or off at runtime: {"enabled": true, "sample_rate": 0.05, "reset": false}."""
+    try:
+        sample_rate = float(payload.get("sample_rate", PROFILE_SAMPLE_RATE)) if payload.get("enabled") else 0.0
+    except (TypeError, ValueError):
+        return {"status": "error", "message": "อัตราการสุ่มไม่ถูกต้อง"}
+    REQUEST_METRICS.set_profiling(sample_rate, reset=bool(payload.get("reset")))
+    return {"status": "success", "sample_rate": REQUEST_METRICS.profile_sample_rate, "profiled_requests": REQUEST_METRICS.profiled_requests}
+
+def handle_get_profile_report(payload, conn, cursor):
+    sort_key = payload.get("sort", "cumulative")
+    if sort_key not in ("cumulative", "tottime", "calls"):
+        return {"status": "error", "message": "ไม่รู้จักรูปแบบการเรียงลำดับ"}
+    return {"status": "success", "profiled_requests": REQUEST_METRICS.profiled_requests, "report": REQUEST_METRICS.profile_report(sort_key)}
+
+def _metric_labels(labels):
+    if not labels: return ""
+    def escape_value(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return "{" + ",".join(f'{key}="{escape_value(value)}"' for key, value in labels.items()) + "}"
+
+def render_metrics(server=None):
+    """Formats request metrics and the server's other runtime statistics in the Prometheus text format."""
+    lines = []
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{_metric_labels(labels)} {value}")
+    def histogram(buckets, counts, total, labels):
+        samples, cumulative = [], 0
+        for bound, count in zip(list(buckets) + ["+Inf"], counts):
+            cumulative += count
+            samples.append(("_bucket", {**labels, "le": bound}, cumulative))
+        samples.append(("_sum", labels, total))
+        samples.append(("_count", labels, cumulative))
+        return samples
+
+    actions = REQUEST_METRICS.snapshot()
+    metric("ps_request_duration_seconds", "histogram", "API request latency by action.",
+           [sample for action, stats in sorted(actions.items())
+            for sample in histogram(METRICS_LATENCY_BUCKETS, stats["latency"], stats["latency_sum"], {"action": action})])
+    metric("ps_response_size_bytes", "histogram", "Response body bytes sent by action.",
+           [sample for action, stats in sorted(actions.items())
+            for sample in histogram(METRICS_SIZE_BUCKETS, stats["sizes"], stats["size_sum"], {"action": action})])
+    metric("ps_requests_total", "counter", "API requests by action and HTTP status.",
+           [("", {"action": action, "code": code}, count) for action, stats in sorted(actions.items()) for code, count in sorted(stats["codes"].items())])
+    for name, key, help_text in (
+        ("ps_sql_statements_total", "sql_count", "SQL statements executed by action."),
+        ("ps_sql_duration_seconds_total", "sql_seconds", "Time spent executing and fetching SQL by action."),
+        ("ps_json_decode_seconds_total", "json_decode_seconds", "Time spent parsing request JSON by action."),
+        ("ps_json_encode_seconds_total", "json_encode_seconds", "Time spent serializing response JSON by action."),
+    ):
+        metric(name, "counter", help_text, [("", {"action": action}, stats[key]) for action, stats in sorted(actions.items())])
+    metric("ps_slow_requests_total", "counter", f"Requests slower than {SLOW_REQUEST_SECONDS}s.", [("", None, REQUEST_METRICS.slow_requests)])
+    metric("ps_profile_sample_rate", "gauge", "Share of requests currently run under cProfile.", [("", None, REQUEST_METRICS.profile_sample_rate)])
+
+    pool = DB_POOL.stats()
+    metric("ps_db_pool_connections", "gauge", "Database pool connections by state.",
+           [("", {"state": "open"}, pool["open_connections"]), ("", {"state": "idle"}, pool["idle_connections"])])
+    metric("ps_db_pool_checkouts_total", "counter", "Database connections handed out.", [("", None, pool["checkouts"])])
+    metric("ps_db_pool_wait_seconds_total", "counter", "Time spent waiting for a pooled connection.", [("", None, pool["wait_seconds_total"])])
+    metric("ps_db_pool_timeouts_total", "counter", "Requests that found no free pooled connection.", [("", None, pool["timeouts"])])
+
+    compression = COMPRESSION_STATS.snapshot()
+    metric("ps_compression_bytes_total", "counter", "Bytes before and after response compression.",
+           [("", {"encoding": enc, "direction": direction}, totals[f"bytes_{direction}"]) for enc, totals in sorted(compression.items()) for direction in ("in", "out")])
+    metric("ps_compression_cpu_seconds_total", "counter", "CPU time spent compressing responses.",
+           [("", {"encoding": enc}, totals["cpu_seconds"]) for enc, totals in sorted(compression.items())])
+
+    static_cache = STATIC_FILE_CACHE.stats()
+    metric("ps_static_cache_entries", "gauge", "Static files held in memory.", [("", None, static_cache["entries"])])
+    metric("ps_static_cache_bytes", "gauge", "Bytes held by the static file cache, compressed variants included.", [("", None, static_cache["bytes"])])
+    response_cache = RESPONSE_CACHE.stats()
+    metric("ps_response_cache_lookups_total", "counter", "Response cache lookups by result.",
+           [("", {"result": "hit"}, response_cache["hits"]), ("", {"result": "miss"}, response_cache["misses"])])
+    metric("ps_response_cache_stale_total", "counter", "Cached responses dropped because a write changed their tables.", [("", None, response_cache["stale"])])
+    metric("ps_response_cache_evictions_total", "counter", "Cached responses evicted to stay within the memory budget.", [("", None, response_cache["evictions"])])
+    metric("ps_response_cache_bytes", "gauge", "JSON bytes held by the response cache.", [("", None, response_cache["bytes"])])
+    metric("ps_response_cache_entries", "gauge", "Responses held by the response cache.", [("", None, response_cache["entries"])])
+    list_totals = LIST_TOTAL_CACHE.stats()
+    metric("ps_list_total_cache_lookups_total", "counter", "List total cache lookups by result.",
+           [("", {"result": "hit"}, list_totals["hits"]), ("", {"result": "miss"}, list_totals["misses"])])
+    metric("ps_list_total_cache_entries", "gauge", "List totals held by the list total cache.", [("", None, list_totals["entries"])])
+    connections = CONNECTION_STATS.snapshot()
+    metric("ps_http_connections_total", "counter", "HTTP connections accepted by a worker.", [("", None, connections["connections"])])
+    metric("ps_http_requests_total", "counter", "HTTP requests by whether they reused an open connection.",
+           [("", {"reused": "false"}, connections["requests"] - connections["reused_requests"]), ("", {"reused": "true"}, connections["reused_requests"])])
+    metric("ps_http_connection_closes_total", "counter", "Closed HTTP connections by reason.",
+           [("", {"reason": reason}, count) for reason, count in sorted(connections["closes"].items())])
+    events = EVENT_BROADCASTER.stats()
+    metric("ps_sse_clients", "gauge", "Connected /events clients.", [("", None, events["clients"])])
+    metric("ps_sse_slow_drops_total", "counter", "/events clients dropped for falling too far behind.", [("", None, events["slow_drops"])])
+    if server is not None and hasattr(server, "stats"):
+        http_stats = server.stats()
+        metric("ps_http_workers", "gauge", "HTTP worker threads.", [("", None, http_stats["workers"])])
+        metric("ps_http_queue_depth", "gauge", "Accepted connections waiting for a worker.", [("", None, http_stats["queue_depth"])])
+        metric("ps_http_rejected_total", "counter", "Connections answered with 503 because the queue was full.", [("", None, http_stats["rejected"])])
+    return "\n".join(lines) + "\n"
+
+def handle_get_server_stats(payload, conn, cursor):
+    return {"status": "success", "stats": {"db_pool": DB_POOL.stats(), "compression": COMPRESSION_STATS.snapshot(), "events": EVENT_BROADCASTER.stats(), "response_cache": RESPONSE_CACHE.stats(), "list_total_cache": LIST_TOTAL_CACHE.stats(), "full_text_search": FULL_TEXT_SEARCH, "connections": CONNECTION_STATS.snapshot(), "assets": ASSET_BUNDLER.stats()}}
+
 
 # --- HTTP Request Handler ---
+# Same choice as socketserver: poll() has no descriptor limit and needs no setup per wait
+KeepAliveSelector = selectors.PollSelector if hasattr(selectors, 'PollSelector') else selectors.SelectSelector
+
 class APIHandler(BaseHTTPRequestHandler):
+    # "cache_tables" lists the tables a read-only action's response is computed from, which
+    # makes it eligible for RESPONSE_CACHE; "writes" lists the tables a write action changes.
     ACTION_MAP = {
         # Weekly System Actions
         "login": {"handler": handle_login, "auth_required": False},
         "logout": {"handler": handle_logout, "auth_required": True},
-        "get_dashboard_summary": {"handler": handle_get_dashboard_summary, "auth_required": True, "admin_only": True},
+        "get_dashboard_summary": {"handler": handle_get_dashboard_summary, "auth_required": True, "admin_only": True, "cache_tables": WEEKLY_SUMMARY_TABLES},
         "list_users": {"handler": handle_list_users, "auth_required": True, "admin_only": True},
-        "add_user": {"handler": handle_add_user, "auth_required": True, "admin_only": True},
-        "update_user": {"handler": handle_update_user, "auth_required": True, "admin_only": True},
-        "delete_user": {"handler": handle_delete_user, "auth_required": True, "admin_only": True},
+        "add_user": {"handler": handle_add_user, "auth_required": True, "admin_only": True, "writes": ("users",)},
+        "update_user": {"handler": handle_update_user, "auth_required": True, "admin_only": True, "writes": ("users",)},
+        "delete_user": {"handler": handle_delete_user, "auth_required": True, "admin_only": True, "writes": ("users",)},
         "list_personnel": {"handler": handle_list_personnel, "auth_required": True},
         "get_personnel_details": {"handler": handle_get_personnel_details, "auth_required": True, "admin_only": True},
-        "add_personnel": {"handler": handle_add_personnel, "auth_required": True, "admin_only": True},
-        "update_personnel": {"handler": handle_update_personnel, "auth_required": True, "admin_only": True},
-        "delete_personnel": {"handler": handle_delete_personnel, "auth_required": True, "admin_only": True},
-        "import_personnel": {"handler": handle_import_personnel, "auth_required": True, "admin_only": True},
-        "submit_status_report": {"handler": handle_submit_status_report, "auth_required": True},
-        "get_status_reports": {"handler": handle_get_status_reports, "auth_required": True, "admin_only": True},
-        "archive_reports": {"handler": handle_archive_reports, "auth_required": True, "admin_only": True},
+        "add_personnel": {"handler": handle_add_personnel, "auth_required": True, "admin_only": True, "writes": ("personnel",)},
+        "update_personnel": {"handler": handle_update_personnel, "auth_required": True, "admin_only": True, "writes": ("personnel",)},
+        "delete_personnel": {"handler": handle_delete_personnel, "auth_required": True, "admin_only": True, "writes": ("personnel",)},
+        "import_personnel": {"handler": handle_import_personnel, "auth_required": True, "admin_only": True, "writes": ("personnel",)},
+        "submit_status_report": {"handler": handle_submit_status_report, "auth_required": True, "writes": ("status_reports", "status_report_counts", "report_items", "persistent_statuses")},
+        "get_status_reports": {"handler": handle_get_status_reports, "auth_required": True, "admin_only": True, "cache_tables": WEEKLY_SUMMARY_TABLES},
+        "archive_reports": {"handler": handle_archive_reports, "auth_required": True, "admin_only": True, "writes": ("status_reports", "status_report_counts", "archived_reports", "report_items")},
         "get_archived_reports": {"handler": handle_get_archived_reports, "auth_required": True, "admin_only": True},
+        "get_archive_index": {"handler": handle_get_archive_index, "auth_required": True, "admin_only": True},
+        "get_archive_page": {"handler": handle_get_archive_page, "auth_required": True, "admin_only": True},
+        "get_archive_tiers": {"handler": handle_get_archive_tiers, "auth_required": True, "admin_only": True},
+        "tier_archives": {"handler": handle_tier_archives, "auth_required": True, "admin_only": True, "writes": ("archived_reports", "archived_daily_reports")},
         "get_submission_history": {"handler": handle_get_submission_history, "auth_required": True},
         "get_report_for_editing": {"handler": handle_get_report_for_editing, "auth_required": True},
         "get_active_statuses": {"handler": handle_get_active_statuses, "auth_required": True},
 
         # Daily System Actions
-        "get_daily_dashboard_summary": {"handler": handle_get_daily_dashboard_summary, "auth_required": True, "admin_only": True},
+        "get_daily_dashboard_summary": {"handler": handle_get_daily_dashboard_summary, "auth_required": True, "admin_only": True, "cache_tables": DAILY_SUMMARY_TABLES},
         "get_daily_personnel_for_submission": {"handler": handle_get_daily_personnel_for_submission, "auth_required": True},
-        "submit_daily_report": {"handler": handle_submit_daily_report, "auth_required": True},
+        "submit_daily_report": {"handler": handle_submit_daily_report, "auth_required": True, "writes": ("daily_reports", "report_items", "persistent_statuses")},
         "get_daily_submission_history": {"handler": handle_get_daily_submission_history, "auth_required": True},
-        "get_daily_final_report": {"handler": handle_get_daily_final_report, "auth_required": True, "admin_only": True},
-        "archive_daily_reports": {"handler": handle_archive_daily_reports, "auth_required": True, "admin_only": True},
+        "get_daily_final_report": {"handler": handle_get_daily_final_report, "auth_required": True, "admin_only": True, "cache_tables": DAILY_SUMMARY_TABLES},
+        "archive_daily_reports": {"handler": handle_archive_daily_reports, "auth_required": True, "admin_only": True, "writes": ("daily_reports", "archived_daily_reports", "report_items")},
         "get_archived_daily_reports": {"handler": handle_get_archived_daily_reports, "auth_required": True, "admin_only": True},
-        "list_holidays": {"handler": handle_list_holidays, "auth_required": True, "admin_only": True},
-        "add_holiday": {"handler": handle_add_holiday, "auth_required": True, "admin_only": True},
-        "delete_holiday": {"handler": handle_delete_holiday, "auth_required": True, "admin_only": True},
+        "list_holidays": {"handler": handle_list_holidays, "auth_required": True, "admin_only": True, "cache_tables": ("holidays",)},
+        "add_holiday": {"handler": handle_add_holiday, "auth_required": True, "admin_only": True, "writes": ("holidays",)},
+        "delete_holiday": {"handler": handle_delete_holiday, "auth_required": True, "admin_only": True, "writes": ("holidays",)},
+        "import_holidays": {"handler": handle_import_holidays, "auth_required": True, "admin_only": True, "writes": ("holidays",)},
+        "query_report_items": {"handler": handle_query_report_items, "auth_required": True, "admin_only": True},
+
+        # Server Maintenance Actions
+        "get_server_stats": {"handler": handle_get_server_stats, "auth_required": True, "admin_only": True},
+        "set_profiling": {"handler": handle_set_profiling, "auth_required": True, "admin_only": True},
+        "get_profile_report": {"handler": handle_get_profile_report, "auth_required": True, "admin_only": True},
     }
 
+    # HTTP/1.1 keeps connections open between requests, so every response carries a
+    # Content-Length or is chunked; end_headers decides whether this one is the last.
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; with Nagle on, the body of a response on
+    # a reused connection waits for the client's delayed ACK (~40 ms) before it is sent.
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        """Serves requests on one connection until the client, an error or a keep-alive limit ends it."""
+        CONNECTION_STATS.opened()
+        self.requests_handled = 0
+        self._close_reason = None
+        self.close_connection = True
+        self.handle_one_request()
+        if not self.close_connection:
+            with KeepAliveSelector() as selector:
+                selector.register(self.connection, selectors.EVENT_READ)
+                while not self.close_connection and self._wait_for_next_request(selector):
+                    self.handle_one_request()
+        CONNECTION_STATS.closed(self._close_reason or "client")
+
+    def _wait_for_next_request(self, selector):
+        """
+        Waits up to KEEPALIVE_TIMEOUT for the next request. An idle connection holds a
+        worker, so it is given up early once other connections are queued for one.
+        """
+        self.connection.setblocking(False)
+        try:
+            pipelined = self.rfile.peek(1) # Already buffered bytes never wake up the selector
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+        if pipelined:
+            return True
+        deadline = time.monotonic() + KEEPALIVE_TIMEOUT
+        while not self._server_backlog():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._close_reason = "idle_timeout"
+                return False
+            if selector.select(min(remaining, KEEPALIVE_POLL_INTERVAL)):
+                return True
+        self._close_reason = "backlog"
+        return False
+
+    def _server_backlog(self):
+        request_queue = getattr(self.server, "request_queue", None)
+        return request_queue is not None and request_queue.qsize() > 0
+
+    def parse_request(self):
+        self._body_remaining = 0
+        CONNECTION_STATS.request(reused=self.requests_handled > 0)
+        self.requests_handled += 1
+        if not super().parse_request():
+            return False
+        if self.headers.get('Transfer-Encoding'):
+            self._body_remaining = -1 # Chunked request bodies are not read, so the connection cannot be reused
+        else:
+            try:
+                self._body_remaining = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                self._body_remaining = -1
+        return True
+
+    def handle_expect_100(self):
+        # An interim response; the keep-alive decision belongs to the final one
+        self.send_response_only(100)
+        BaseHTTPRequestHandler.end_headers(self)
+        return True
+
+    def end_headers(self):
+        if not self.close_connection:
+            reason = self._keep_alive_refusal()
+            if reason:
+                self._close_reason = reason
+                self.send_header('Connection', 'close')
+            else:
+                if self.request_version == 'HTTP/1.0':
+                    self.send_header('Connection', 'keep-alive')
+                self.send_header('Keep-Alive', f'timeout={KEEPALIVE_TIMEOUT}, max={KEEPALIVE_MAX_REQUESTS - self.requests_handled}')
+        super().end_headers()
+
+    def _keep_alive_refusal(self):
+        """Returns why the connection must close after this response, or None to keep it open."""
+        if not getattr(self.server, "keep_alive", False):
+            return "server"
+        if self._body_remaining:
+            return "unread_body"
+        if self.requests_handled >= KEEPALIVE_MAX_REQUESTS:
+            return "max_requests"
+        if self._server_backlog():
+            return "backlog"
+        return None
+
     def _serve_static_file(self):
         parsed_path = urlparse(self.path)
         path = parsed_path.path
         
-        path_map = {'/': '/login.html', '/main': '/main.html', '/daily': '/daily.html'}
-        path = path_map.get(path, path)
+        path = STATIC_PATH_MAP.get(path, path)
         filepath = path.lstrip('/')
-        if not os.path.exists(filepath):
+        if os.path.splitext(filepath)[1] not in STATIC_MIMETYPES:
+            return self._serve_uncached_file(filepath)
+        entry = None
+        if ASSET_BUNDLING and path.startswith(ASSET_URL_PREFIX):
+            entry = ASSET_BUNDLER.asset(path)
+        elif ASSET_BUNDLING and filepath.endswith('.html'):
+            entry = ASSET_BUNDLER.page(filepath)
+        entry = entry or STATIC_FILE_CACHE.get(filepath)
+        if not entry:
             self.send_error(404, "File not found")
             return
-        mimetypes = {'.html': 'text/html', '.js': 'application/javascript', '.css': 'text/css'}
-        mimetype = mimetypes.get(os.path.splitext(filepath)[1], 'application/octet-stream')
+
+        encoding = None
+        if entry['mimetype'] in COMPRESSIBLE_MIMETYPES and len(entry['body']) >= COMPRESSION_MIN_SIZE:
+            encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+        # Each encoding is a separate representation, so it gets its own strong ETag
+        etag = entry['etag'] if not encoding else entry['etag'][:-1] + '-' + encoding + '"'
+
+        if self._is_not_modified(entry, etag):
+            self.send_response(304)
+            self._send_static_validators(entry, etag)
+            self.end_headers()
+            return
+
+        body = STATIC_FILE_CACHE.encoded(entry, encoding) if encoding else entry['body']
         self.send_response(200)
-        self.send_header('Content-type', mimetype)
+        self.send_header('Content-type', entry['mimetype'])
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self._send_static_validators(entry, etag)
         self.end_headers()
+        self.wfile.write(body)
+
+    def _send_static_validators(self, entry, etag):
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', entry['last_modified'])
+        self.send_header('Cache-Control', entry.get('cache_control', STATIC_CACHE_CONTROL))
+        self.send_header('Vary', 'Accept-Encoding')
+
+    def _is_not_modified(self, entry, etag):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            # Any encoding of the current file version still matches
+            candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            base_tag = entry['etag'][:-1]
+            return '*' in candidates or any(tag == entry['etag'] or tag.startswith(base_tag + '-') for tag in candidates)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= entry['mtime']
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _serve_uncached_file(self, filepath):
+        if not os.path.exists(filepath):
+            self.send_error(404, "File not found")
+            return
         with open(filepath, 'rb') as f:
-            self.wfile.write(f.read())
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
     def do_GET(self):
-        self._serve_static_file()
+        path = urlparse(self.path).path
+        if path == "/api/export":
+            self._run_measured("export", self._handle_export)
+        elif path == "/events":
+            self._handle_events()
+        elif path == "/metrics":
+            self._handle_metrics()
+        else:
+            self._serve_static_file()
+
+    def send_response(self, code, message=None):
+        profile = REQUEST_METRICS.current()
+        if profile: profile.status_code = code
+        super().send_response(code, message)
+
+    def _run_measured(self, action, handle):
+        """Runs `handle` with a RequestProfile active so its latency, SQL and sizes reach /metrics."""
+        profile = REQUEST_METRICS.begin(action)
+        try:
+            handle()
+        finally:
+            REQUEST_METRICS.finish(profile)
+
+    def _handle_metrics(self):
+        """
+        Prometheus text exposition for admin sessions and for scrapers that send
+        "Authorization: Bearer <METRICS_TOKEN>"; loopback clients only with METRICS_ALLOW_LOOPBACK.
+        """
+        authorization = self.headers.get('Authorization') or ''
+        token_ok = bool(METRICS_TOKEN) and hmac.compare_digest(authorization.encode('utf-8'), f"Bearer {METRICS_TOKEN}".encode('utf-8'))
+        loopback_ok = METRICS_ALLOW_LOOPBACK and self.client_address[0] in ('127.0.0.1', '::1')
+        if not (token_ok or loopback_ok):
+            try:
+                with DB_POOL.connection() as conn:
+                    session = self._get_session(conn.cursor())
+            except PoolTimeoutError:
+                return self._send_json_response({"status": "error", "message": SERVER_BUSY_MESSAGE}, 503)
+            if not session or session.get("role") != "admin":
+                return self._send_json_response({"status": "error", "message": "คุณไม่มีสิทธิ์ดำเนินการ"}, 403)
+        body = render_metrics(self.server).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle_events(self):
+        """
+        Opens a server-sent event stream for admin dashboards. After the headers the
+        socket is handed to EVENT_BROADCASTER and this worker is released.
+        """
+        try:
+            with DB_POOL.connection() as conn:
+                session = self._get_session(conn.cursor())
+        except PoolTimeoutError:
+            return self._send_json_response({"status": "error", "message": SERVER_BUSY_MESSAGE}, 503)
+        if not session:
+            return self._send_json_response({"status": "error", "message": "Unauthorized"}, 401)
+        if session.get("role") != "admin":
+            return self._send_json_response({"status": "error", "message": "คุณไม่มีสิทธิ์ดำเนินการ"}, 403)
+        if not EVENT_BROADCASTER.has_capacity() or not hasattr(self.server, "detach_request"):
+            return self._send_json_response({"status": "error", "message": SERVER_BUSY_MESSAGE}, 503)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no') # Stop reverse proxies from buffering the stream
+        self.send_header('Connection', 'close') # The socket leaves the worker, so no request follows on it
+        self.end_headers()
+        self.wfile.write(b"retry: 5000\n\n")
+        self.wfile.flush()
+        if EVENT_BROADCASTER.subscribe(self.connection):
+            self.server.detach_request(self.request)
+
+    def _handle_export(self):
+        """
+        Streams archived report items as CSV or XLSX for a date range and department:
+        GET /api/export?kind=weekly|daily&format=csv|xlsx&date_from=&date_to=&department=
+        """
+        query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        kind, export_format = query.get('kind', 'weekly'), query.get('format', 'csv')
+        self._response_started = False
+        try:
+            conn = DB_POOL.acquire()
+        except PoolTimeoutError:
+            return self._send_json_response({"status": "error", "message": SERVER_BUSY_MESSAGE}, 503)
+        try:
+            cursor = conn.cursor()
+            session = self._get_session(cursor)
+            if not session:
+                return self._send_json_response({"status": "error", "message": "Unauthorized"}, 401)
+            if session.get("role") != "admin":
+                return self._send_json_response({"status": "error", "message": "คุณไม่มีสิทธิ์ดำเนินการ"}, 403)
+            if kind not in ARCHIVE_KINDS or export_format not in ('csv', 'xlsx'):
+                return self._send_json_response({"status": "error", "message": "ไม่รู้จักรูปแบบการส่งออก"}, 400)
+            try:
+                # Only validated dates reach the Content-Disposition header
+                date_from = date.fromisoformat(query['date_from']) if query.get('date_from') else None
+                date_to = date.fromisoformat(query['date_to']) if query.get('date_to') else None
+            except ValueError:
+                return self._send_json_response({"status": "error", "message": "รูปแบบวันที่ไม่ถูกต้อง"}, 400)
+
+            header, rows = iter_export_rows(cursor, kind, date_from and date_from.isoformat(), date_to and date_to.isoformat(), query.get('department'))
+            filename = f"archive-{kind}-{date_from or 'start'}-{date_to or 'latest'}.{export_format}"
+            disposition = [('Content-Disposition', f'attachment; filename="{filename}"')]
+            if export_format == 'csv':
+                body = self._start_streamed_response(200, 'text/csv; charset=utf-8', disposition, compress=True)
+                write_csv(body, header, rows)
+            else:
+                body = self._start_streamed_response(200, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', disposition)
+                write_xlsx(body, header, rows)
+            body.close()
+        except Exception as e:
+            print(f"API Error on export: {e}")
+            if self._response_started:
+                self.close_connection = True
+            else:
+                self._send_json_response({"status": "error", "message": "Server error"}, 500)
+        finally:
+            DB_POOL.release(conn)
 
     def do_POST(self):
         if self.path == "/api":
-            self._handle_api_request()
+            self._run_measured("unknown", self._handle_api_request)
+        elif urlparse(self.path).path == "/api/import_personnel":
+            self._run_measured("import_personnel_upload", self._handle_personnel_upload)
         else:
             self.send_error(404, "Endpoint not found")
 
+    def _iter_body_lines(self):
+        """Yields the request body line by line without reading it into memory at once."""
+        while self._body_remaining > 0:
+            line = self.rfile.readline(min(self._body_remaining, 65536))
+            if not line: break
+            self._body_remaining -= len(line)
+            yield line.decode('utf-8-sig')
+
+    def _iter_uploaded_personnel(self):
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip()
+        if content_type == 'text/csv':
+            for row in csv.DictReader(self._iter_body_lines()):
+                yield {PERSONNEL_IMPORT_HEADERS.get(key.strip(), key.strip()): value for key, value in row.items() if key}
+        else: # application/x-ndjson: one JSON object per line
+            for line_number, line in enumerate(self._iter_body_lines(), 1):
+                if not line.strip(): continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    raise UploadRowError(line_number, "ไม่ใช่ JSON ที่ถูกต้อง") from None
+                if not isinstance(row, dict):
+                    raise UploadRowError(line_number, "ต้องเป็นออบเจ็กต์ JSON")
+                yield row
+
+    def _handle_personnel_upload(self):
+        """
+        Streamed variant of the import_personnel action for large rosters. The body is
+        NDJSON or CSV; mode, dry_run and confirm_deleted are passed in the query string.
+        """
+        query = parse_qs(urlparse(self.path).query)
+        mode = query.get('mode', ['upsert'])[0]
+        dry_run = query.get('dry_run', ['0'])[0] in ('1', 'true')
+        self._response_started = False
+        try:
+            conn = DB_POOL.acquire()
+        except PoolTimeoutError:
+            return self._send_json_response({"status": "error", "message": SERVER_BUSY_MESSAGE}, 503)
+        try:
+            cursor = conn.cursor()
+            session = self._get_session(cursor)
+            if not session:
+                return self._send_json_response({"status": "error", "message": "Unauthorized"}, 401)
+            if session.get("role") != "admin":
+                return self._send_json_response({"status": "error", "message": "คุณไม่มีสิทธิ์ดำเนินการ"}, 403)
+            if mode not in IMPORT_MODES:
+                return self._send_json_response({"status": "error", "message": "ไม่รู้จักรูปแบบการนำเข้าข้อมูล"}, 400)
+            try:
+                confirm_deleted = _parse_confirm_deleted(query.get('confirm_deleted', [None])[0])
+            except ValueError:
+                return self._send_json_response({"status": "error", "message": "จำนวนที่ยืนยันไม่ถูกต้อง"}, 400)
+            counts = import_personnel_rows(cursor, self._iter_uploaded_personnel(), mode, dry_run)
+            error = _import_confirmation_error(mode, dry_run, confirm_deleted, counts)
+            if dry_run or error: conn.rollback()
+            else:
+                conn.commit()
+                RESPONSE_CACHE.bump(self.ACTION_MAP["import_personnel"]["writes"])
+            if error: return self._send_json_response({"status": "error", "message": error}, 409)
+            self._send_json_response(_import_personnel_response(counts, dry_run))
+        except UploadRowError as e:
+            conn.rollback()
+            self._send_json_response({"status": "error", "message": f"รูปแบบข้อมูลที่นำเข้าไม่ถูกต้อง {e}", "line": e.line_number}, 400)
+        except (ValueError, csv.Error) as e:
+            print(f"Personnel upload rejected: {e}")
+            conn.rollback()
+            self._send_json_response({"status": "error", "message": "รูปแบบข้อมูลที่นำเข้าไม่ถูกต้อง"}, 400)
+        except Exception as e:
+            print(f"API Error on personnel upload: {e}")
+            self._send_json_response({"status": "error", "message": "Server error"}, 500)
+        finally:
+            DB_POOL.release(conn)
+
     def _send_json_response(self, data, status_code=200, headers=None):
+        if isinstance(data, dict) and any(is_stream(v) for v in data.values()):
+            return self._send_json_stream(data, status_code, headers)
+        started = time.perf_counter()
+        body = json.dumps(data).encode('utf-8')
+        profile = REQUEST_METRICS.current()
+        if profile: profile.json_encode_seconds += time.perf_counter() - started
+        encoding = None
+        if len(body) >= COMPRESSION_MIN_SIZE:
+            encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+        if encoding:
+            started = time.thread_time()
+            compressed = compress_body(body, encoding)
+            cpu_seconds = time.thread_time() - started
+            COMPRESSION_STATS.record(encoding, len(body), len(compressed), cpu_seconds)
+            ratio = len(compressed) / len(body)
+            body = compressed
         self.send_response(status_code)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+            self.send_header('Server-Timing', f'compress;dur={cpu_seconds * 1000:.2f};desc="{encoding} ratio {ratio:.3f}"')
         if headers:
             for key, value in headers:
                 self.send_header(key, value)
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
+        self.wfile.write(body)
+        if profile: profile.response_bytes += len(body)
+
+    def _send_json_stream(self, data, status_code=200, headers=None):
+        """Writes `data` with iter_json as it is produced, using chunked encoding for HTTP/1.1 clients."""
+        body = self._start_streamed_response(status_code, 'application/json', headers, compress=True)
+        for piece in iter_json(data):
+            body.write(piece)
+        body.close()
+
+    def _start_streamed_response(self, status_code, content_type, headers=None, compress=False):
+        """Sends the headers of a body of unknown length and returns the ChunkedBodyWriter for it."""
+        chunked = self.request_version == 'HTTP/1.1'
+        encoding = choose_encoding(self.headers.get('Accept-Encoding')) if compress else None
+        self.send_response(status_code)
+        self.send_header('Content-type', content_type)
+        if compress:
+            self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Connection', 'close') # Without chunking only the close marks the end of the body
+        if headers:
+            for key, value in headers:
+                self.send_header(key, value)
+        self.end_headers()
+        self._response_started = True
+        return ChunkedBodyWriter(self.wfile, chunked, encoding)
 
-    def _get_session(self):
+    def _get_session(self, cursor):
         cookie_header = self.headers.get('Cookie')
         if not cookie_header: return None
         cookies = dict(item.strip().split('=', 1) for item in cookie_header.split(';') if '=' in item)
         session_token = cookies.get('session_token')
         if not session_token: return None
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        expiry_limit = datetime.now() - timedelta(seconds=SESSION_TIMEOUT_SECONDS)
-        cursor.execute("DELETE FROM sessions WHERE created_at < ?", (expiry_limit,))
-        conn.commit()
-
-        cursor.execute("SELECT u.username, u.role, u.department, s.created_at FROM sessions s JOIN users u ON s.username = u.username WHERE s.token = ?", (session_token,))
-        session_data = cursor.fetchone()
-        conn.close()
-        
-        if session_data:
-            session_dict = dict(session_data)
-            session_dict['token'] = session_token
-            return session_dict
-        return None
+        return SESSION_STORE.get(cursor, session_token)
+
+    # Actions whose handlers take the caller's session as an argument
+    SESSION_ACTIONS = frozenset([
+        "logout", "list_personnel", "submit_status_report",
+        "get_submission_history", "get_active_statuses",
+        "get_daily_personnel_for_submission", "submit_daily_report",
+        "get_daily_dashboard_summary", "get_daily_submission_history",
+        "get_daily_final_report", "archive_daily_reports",
+        "get_archived_daily_reports",
+        "list_holidays", "add_holiday", "delete_holiday", "import_holidays"
+    ])
+    # Actions that change the session cookie cannot run inside a batch
+    BATCH_EXCLUDED_ACTIONS = frozenset(["login", "logout", "batch"])
+
+    def _dispatch_action(self, action_name, payload, conn, cursor, session):
+        """Applies the ACTION_MAP rules for one action and runs its handler; returns (status code, response, headers)."""
+        action_config = self.ACTION_MAP.get(action_name)
+        if not action_config:
+            return 404, {"status": "error", "message": "ไม่รู้จักคำสั่งนี้"}, None
+        if action_config.get("auth_required") and not session:
+            return 401, {"status": "error", "message": "Unauthorized"}, None
+        if action_config.get("admin_only") and (not session or session.get("role") != "admin"):
+            return 403, {"status": "error", "message": "คุณไม่มีสิทธิ์ดำเนินการ"}, None
+
+        handler_kwargs = {"payload": payload, "conn": conn, "cursor": cursor}
+        if action_name == "login":
+            handler_kwargs["client_address"] = self.client_address
+        if session and action_name in self.SESSION_ACTIONS:
+            handler_kwargs["session"] = session
+
+        cache_tables = action_config.get("cache_tables")
+        if cache_tables:
+            cache_key = (action_name, json.dumps(payload, sort_keys=True, default=str),
+                         session.get("role"), session.get("department"), date.today().isoformat())
+            cached = RESPONSE_CACHE.get(cache_key, cache_tables)
+            if cached is not None:
+                return 200, cached, None
+            generations = RESPONSE_CACHE.generations(cache_tables)
+
+        response_data = action_config["handler"](**handler_kwargs)
+        headers = None
+        if isinstance(response_data, tuple):
+            response_data, headers = response_data
+        if action_config.get("writes"):
+            RESPONSE_CACHE.bump(action_config["writes"])
+        elif cache_tables and headers is None and isinstance(response_data, dict) and response_data.get("status") == "success" \
+                and not any(is_stream(value) for value in response_data.values()):
+            RESPONSE_CACHE.put(cache_key, generations, response_data)
+        return 200, response_data, headers
+
+    def _run_batch(self, payload, conn, cursor, session):
+        """
+        Runs a list of {"action", "payload"} entries on this request's session and
+        connection and returns their results in order. With "read_transaction" the
+        items read from one consistent snapshot (until an item commits a write).
+        """
+        actions = payload.get("actions")
+        if not isinstance(actions, list) or not actions:
+            return 400, {"status": "error", "message": "ไม่พบรายการคำสั่ง"}
+        if len(actions) > BATCH_MAX_ACTIONS:
+            return 400, {"status": "error", "message": f"ส่งคำสั่งได้ไม่เกิน {BATCH_MAX_ACTIONS} รายการต่อครั้ง"}
+
+        if payload.get("read_transaction"):
+            cursor.execute("BEGIN")
+        results = []
+        for entry in actions:
+            entry = entry if isinstance(entry, dict) else {}
+            action_name = entry.get("action")
+            if action_name in self.BATCH_EXCLUDED_ACTIONS:
+                status_code, response_data = 400, {"status": "error", "message": "คำสั่งนี้ไม่สามารถใช้ในชุดคำสั่งได้"}
+            else:
+                try:
+                    status_code, response_data, _ = self._dispatch_action(action_name, entry.get("payload") or {}, conn, cursor, session)
+                    # Later items reuse the cursor, so streamed results are read out now
+                    response_data = materialize_json(response_data)
+                except HashQueueFullError:
+                    status_code, response_data = 503, {"status": "error", "message": SERVER_BUSY_MESSAGE}
+                except Exception as e:
+                    print(f"API Error on batched action '{action_name}': {e}")
+                    if conn.in_transaction: conn.rollback()
+                    status_code, response_data = 500, {"status": "error", "message": "Server error"}
+            results.append({"action": action_name, "status_code": status_code, "response": response_data})
+        if conn.in_transaction:
+            conn.commit()
+        return 200, {"status": "success", "results": results}
 
     def _handle_api_request(self):
         action_name = "unknown"
+        self._response_started = False
         try:
-            session = self._get_session()
+            conn = DB_POOL.acquire()
+        except PoolTimeoutError:
+            return self._send_json_response({"status": "error", "message": SERVER_BUSY_MESSAGE}, 503)
+        try:
+            cursor = conn.cursor()
+            session = self._get_session(cursor)
             content_length = int(self.headers['Content-Length'])
-            request_data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            raw_body = self.rfile.read(content_length)
+            self._body_remaining -= len(raw_body)
+            started = time.perf_counter()
+            request_data = json.loads(raw_body.decode('utf-8'))
             action_name, payload = request_data.get("action"), request_data.get("payload", {})
-            action_config = self.ACTION_MAP.get(action_name)
-            if not action_config:
-                return self._send_json_response({"status": "error", "message": "ไม่รู้จักคำสั่งนี้"}, 404)
-            if action_config.get("auth_required") and not session:
-                return self._send_json_response({"status": "error", "message": "Unauthorized"}, 401)
-            if action_config.get("admin_only") and (not session or session.get("role") != "admin"):
-                return self._send_json_response({"status": "error", "message": "คุณไม่มีสิทธิ์ดำเนินการ"}, 403)
-            
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            try:
-                handler_kwargs = {"payload": payload, "conn": conn, "cursor": cursor}
-                if action_name == "login":
-                    handler_kwargs["client_address"] = self.client_address
-                # Updated session-requiring actions list
-                if session and action_name in [
-                    "logout", "list_personnel", "submit_status_report",
-                    "get_submission_history", "get_active_statuses",
-                    "get_daily_personnel_for_submission", "submit_daily_report",
-                    "get_daily_dashboard_summary", "get_daily_submission_history",
-                    "get_daily_final_report", "archive_daily_reports",
-                    "get_archived_daily_reports",
-                    "list_holidays", "add_holiday", "delete_holiday" # Add new actions
-                    ]:
-                    handler_kwargs["session"] = session
-
-                response_data = action_config["handler"](**handler_kwargs)
-                headers = None
-                if isinstance(response_data, tuple):
-                    response_data, headers = response_data
-                self._send_json_response(response_data, headers=headers)
-            finally:
-                conn.close()
+            profile = REQUEST_METRICS.current()
+            if profile:
+                profile.json_decode_seconds += time.perf_counter() - started
+                # Only known names become metric labels, so arbitrary input cannot grow the label set
+                profile.action = action_name if action_name in self.ACTION_MAP or action_name == "batch" else "unknown"
+            if action_name == "batch":
+                status_code, response_data = self._run_batch(payload, conn, cursor, session)
+                return self._send_json_response(response_data, status_code)
+
+            status_code, response_data, headers = self._dispatch_action(action_name, payload, conn, cursor, session)
+            self._send_json_response(response_data, status_code, headers=headers)
+        except HashQueueFullError:
+            self._send_json_response({"status": "error", "message": SERVER_BUSY_MESSAGE}, 503)
         except Exception as e:
             print(f"API Error on action '{action_name}': {e}")
-            self._send_json_response({"status": "error", "message": "Server error"}, 500)
+            if self._response_started:
+                # Part of a streamed body is already on the wire; dropping the connection is the only signal left
+                self.close_connection = True
+            else:
+                self._send_json_response({"status": "error", "message": "Server error"}, 500)
+        finally:
+            DB_POOL.release(conn)
+
+# --- HTTP Server ---
+class DetachableServerMixin:
+    """
+    Lets a handler keep its socket after the request is done (see /events); the
+    server then leaves closing it to whoever took it over.
+    """
+    def __init__(self, *args, **kwargs):
+        self._detached = set()
+        self._detached_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def detach_request(self, request):
+        with self._detached_lock: self._detached.add(request)
+
+    def shutdown_request(self, request):
+        with self._detached_lock:
+            if request in self._detached:
+                self._detached.discard(request)
+                return
+        super().shutdown_request(request)
+
+class DetachableHTTPServer(DetachableServerMixin, HTTPServer):
+    keep_alive = False # An idle persistent connection would stall the only thread
+
+class DetachableThreadingHTTPServer(DetachableServerMixin, ThreadingHTTPServer):
+    keep_alive = True
 
-def run(server_class=HTTPServer, handler_class=APIHandler, port=9999):
+class PooledHTTPServer(DetachableServerMixin, HTTPServer):
+    """
+    HTTPServer that hands accepted connections to a fixed pool of worker threads.
+    Connections wait in a bounded queue; when the queue is full the client gets an
+    immediate 503 instead of the backlog growing without limit.
+    """
+    keep_alive = True
+
+    def __init__(self, server_address, handler_class, workers=WORKER_THREADS, queue_size=REQUEST_QUEUE_SIZE):
+        super().__init__(server_address, handler_class)
+        self.request_queue = queue.Queue(maxsize=queue_size)
+        self.rejected = 0
+        self.workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"http-worker-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def process_request(self, request, client_address):
+        try:
+            self.request_queue.put_nowait((request, client_address))
+        except queue.Full:
+            self._reject_request(request)
+
+    def _worker_loop(self):
+        while True:
+            item = self.request_queue.get()
+            if item is None:
+                break
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def stats(self):
+        return {"workers": len(self.workers), "queue_depth": self.request_queue.qsize(), "queue_size": self.request_queue.maxsize, "rejected": self.rejected}
+
+    def _reject_request(self, request):
+        self.rejected += 1
+        body = json.dumps({"status": "error", "message": SERVER_BUSY_MESSAGE}).encode('utf-8')
+        head = ("HTTP/1.0 503 Service Unavailable\r\n"
+                "Content-Type: application/json\r\n"
+                "Retry-After: 1\r\n"
+                "Connection: close\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1')
+        try:
+            request.sendall(head + body)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        """Stops accepting connections, lets queued requests finish, then stops the workers."""
+        super().server_close()
+        for _ in self.workers:
+            self.request_queue.put(None)
+        deadline = time.time() + SHUTDOWN_GRACE_SECONDS
+        for worker in self.workers:
+            worker.join(max(0, deadline - time.time()))
+
+def make_server(server_address, handler_class, mode=None):
+    mode = mode or SERVER_MODE
+    if mode == "pooled":
+        return PooledHTTPServer(server_address, handler_class)
+    if mode == "threaded":
+        return DetachableThreadingHTTPServer(server_address, handler_class)
+    return DetachableHTTPServer(server_address, handler_class)
+
+def run(server_class=None, handler_class=APIHandler, port=9999):
     init_db()
-    httpd = server_class(('', port), handler_class)
+    PASSWORD_HASHER.start()
+    run_maintenance()
+    start_maintenance_thread()
+    STATIC_FILE_CACHE.warm(static_files_to_warm())
+    if ASSET_BUNDLING:
+        ASSET_BUNDLER.build(static_files_to_warm())
+    if server_class:
+        httpd = server_class(('', port), handler_class)
+    else:
+        httpd = make_server(('', port), handler_class)
+
+    def request_shutdown(signum, frame):
+        # shutdown() blocks until serve_forever() returns, so it must run off the main thread
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, request_shutdown)
+
     print(f"เซิร์ฟเวอร์ระบบจัดการกำลังพลกำลังทำงานที่ http://localhost:{port}")
-    httpd.serve_forever()
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("กำลังปิดเซิร์ฟเวอร์...")
+        httpd.server_close()
+        EVENT_BROADCASTER.close()
+        PASSWORD_HASHER.shutdown()
+        DB_POOL.close_all()
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run()